@@ -39,18 +39,27 @@ import sentry_sdk
 import structlog
 from fastapi import Depends, FastAPI, Header, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 from app_media import router as app_media_router
 from app_tweets import router as app_tweets_router
+from app_tweets.archiver import tweet_archiver
+from app_tweets.buffers import like_buffer
+from app_tweets.db_services import tweet_invalidator
+from app_tweets.render import tweet_fragments
+from app_tweets.stream import tweet_stream
 from app_users import router as app_users_router
-from app_users.services import PermissionService
+from app_users.db_services import api_key_cache
+from app_users.services import PermissionService, password_hasher
+from cache import cache_backend
 from exceptions import (
     AuthException,
     BackendException,
     ErrorsList,
     InternalServerException,
+    ServiceUnavailableException,
 )
+from loaders import loader_scope
 from log_fab import make_context
 from settings import settings
 from tags import tags_metadata
@@ -113,6 +122,7 @@ app = FastAPI(
     docs_url="/api/docs",
     openapi_url="/api/v1/openapi.json",
     dependencies=[Depends(verify_api_key)],
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -124,12 +134,13 @@ async def add_process_time_header(request: Request, call_next):
         peer=request.client.host,
         headers=request.headers,
     )
-    return await call_next(request)
+    with loader_scope():
+        return await call_next(request)
 
 
 @app.exception_handler(BackendException)
 async def media_exception_handler(request: Request, exc: BackendException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_404_NOT_FOUND,
         content={"result": exc.result, "error_type": exc.error_type, "error_message": exc.error_message},
     )
@@ -137,7 +148,7 @@ async def media_exception_handler(request: Request, exc: BackendException):
 
 @app.exception_handler(AuthException)
 async def auth_exception_handler(request: Request, exc: AuthException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_401_UNAUTHORIZED,
         content={"result": exc.result, "error_type": exc.error_type, "error_message": exc.error_message},
     )
@@ -145,18 +156,64 @@ async def auth_exception_handler(request: Request, exc: AuthException):
 
 @app.exception_handler(InternalServerException)
 async def internal_exception_handler(request: Request, exc: AuthException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"result": exc.result, "error_type": exc.error_type, "error_message": exc.error_message},
     )
 
 
+@app.exception_handler(ServiceUnavailableException)
+async def unavailable_exception_handler(request: Request, exc: ServiceUnavailableException):
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"result": exc.result, "error_type": exc.error_type, "error_message": exc.error_message},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Запуск фоновых задач воркера."""
+    tweet_invalidator.start()
+    if settings.like_write_mode == "buffer":
+        like_buffer.start()
+    if settings.archive_interval > 0:
+        tweet_archiver.start()
+    if settings.tweet_stream_enabled:
+        tweet_stream.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Остановка фоновых задач воркера: остаток буфера лайков записывается в СУБД."""
+    await tweet_stream.stop()
+    await tweet_archiver.stop()
+    await like_buffer.stop()
+    await tweet_invalidator.stop()
+
+
+@app.get("/api/metrics", status_code=status.HTTP_200_OK, tags=["metrics"])
+async def get_metrics() -> dict:
+    """Эндпоинт возвращает метрики кэшей, буферов и фоновых задач воркера, обработавшего запрос."""
+    return dict(
+        api_key_cache=api_key_cache.stats(),
+        tweet_cache=tweet_invalidator.stats(),
+        tweet_fragments=tweet_fragments.stats(),
+        like_buffer=like_buffer.stats(),
+        tweet_archiver=tweet_archiver.stats(),
+        tweet_stream=tweet_stream.stats(),
+        password_hasher=password_hasher.stats(),
+        cache_backend_errors=getattr(cache_backend, "errors", 0),
+    )
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Changes-Version", "ETag"],
 )
 
 app.include_router(app_tweets_router)
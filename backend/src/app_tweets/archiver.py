@@ -0,0 +1,164 @@
+"""
+archiver.py
+-----------
+
+Модуль реализует фоновый перенос удалённых твитов в архив и очистку устаревших счётчиков хэштегов.
+
+Note
+----
+    Раз в ``archive_interval`` секунд каждый воркер переносит твиты, удалённые больше ``archive_after`` секунд назад,
+    пачками по ``archive_batch_size``, но не больше ``archive_max_batches`` пачек за проход, чтобы один проход
+    не держал СУБД занятой. Одновременно архивирует только один воркер, остальные пропускают проход.
+
+    Тем же проходом удаляются счётчики хэштегов интервалов, начавшихся раньше ``trending_window`` секунд назад:
+    популярность их уже не учитывает, а без очистки таблица ``hashtag_counters`` растёт на строку на хэштег
+    в каждом интервале. Удаление идемпотентно, поэтому его выполняет каждый воркер.
+
+Attributes
+----------
+tweet_archiver: TweetArchiver
+    Архиватор воркера.
+"""
+import asyncio
+import time
+import typing as t
+from datetime import datetime, timedelta, timezone
+
+import structlog
+
+from app_tweets.db_services import TweetDbService
+from exceptions import BackendException
+from settings import settings
+
+logger = structlog.get_logger()
+
+
+class TweetArchiver:
+    """Класс периодически переносит удалённые твиты в архив.
+
+    Parameters
+    ----------
+    service: TweetDbService
+        Сервис работы с СУБД твитов.
+    archive_after: float
+        Сколько секунд удалённый твит остаётся в таблице ``tweets``.
+    interval: float
+        Интервал между проходами в секундах.
+    batch_size: int
+        Размер пачки.
+    max_batches: int
+        Максимальное количество пачек за проход.
+    trending_window: float
+        Окно популярности хэштегов в секундах. Более старые счётчики удаляются.
+    """
+
+    def __init__(
+        self,
+        service: TweetDbService,
+        archive_after: float,
+        interval: float,
+        batch_size: int,
+        max_batches: int,
+        trending_window: float,
+    ) -> None:
+        self.service = service
+        self.archive_after = archive_after
+        self.trending_window = trending_window
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._task: t.Optional[asyncio.Task] = None
+        self.runs = 0
+        self.skipped = 0
+        self.batches = 0
+        self.archived = 0
+        self.pruned = 0
+        self.errors = 0
+        self.last_archived = 0
+        self.last_run_seconds = 0.0
+        self.last_run_at: t.Optional[datetime] = None
+
+    async def run_once(self) -> int:
+        """Метод выполняет один проход архивирования и удаляет счётчики хэштегов, вышедшие из окна популярности.
+
+        Returns
+        -------
+        int
+            Количество перенесённых за проход твитов.
+        """
+        started = time.monotonic()
+        deleted_before = datetime.now(timezone.utc) - timedelta(seconds=self.archive_after)
+        archived = 0
+        for _ in range(self.max_batches):
+            tweet_ids = await self.service.archive_tweets(deleted_before=deleted_before, limit=self.batch_size)
+            if tweet_ids is None:
+                self.skipped += 1
+                break
+            self.batches += 1
+            archived += len(tweet_ids)
+            if len(tweet_ids) < self.batch_size:
+                break
+        expired_before = datetime.now(timezone.utc) - timedelta(seconds=self.trending_window)
+        self.pruned += await self.service.prune_hashtag_counters(before=expired_before)
+        self.runs += 1
+        self.archived += archived
+        self.last_archived = archived
+        self.last_run_seconds = time.monotonic() - started
+        self.last_run_at = datetime.now(timezone.utc)
+        logger.info(event="проход архивирования завершён", **self.stats())
+        return archived
+
+    def start(self) -> None:
+        """Метод запускает периодическое архивирование в цикле событий воркера."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._archive_loop())
+
+    async def stop(self) -> None:
+        """Метод останавливает периодическое архивирование. Прерванная пачка откатывается транзакцией."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        """Метод возвращает метрики архивирования.
+
+        Returns
+        -------
+        dict
+            Словарь со счётчиками проходов, пачек, перенесённых твитов и удалённых счётчиков хэштегов.
+        """
+        return dict(
+            runs=self.runs,
+            skipped=self.skipped,
+            batches=self.batches,
+            archived=self.archived,
+            pruned=self.pruned,
+            errors=self.errors,
+            last_archived=self.last_archived,
+            last_run_seconds=round(self.last_run_seconds, 6),
+            last_run_at=self.last_run_at.isoformat() if self.last_run_at else None,
+        )
+
+    async def _archive_loop(self) -> None:
+        """Внутренний метод периодически запускает проход архивирования."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except BackendException as e:
+                self.errors += 1
+                logger.exception(event="ошибка обслуживания твитов", exc_info=e)
+
+
+tweet_archiver = TweetArchiver(
+    TweetDbService(),
+    archive_after=settings.archive_after,
+    interval=settings.archive_interval,
+    batch_size=settings.archive_batch_size,
+    max_batches=settings.archive_max_batches,
+    trending_window=settings.trending_window,
+)
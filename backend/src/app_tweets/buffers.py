@@ -0,0 +1,204 @@
+"""
+buffers.py
+----------
+
+Модуль реализует отложенную запись лайков (write-behind) для популярных твитов.
+
+Note
+----
+    В режиме ``like_write_mode = "buffer"`` лайки и дизлайки копятся в памяти воркера и сбрасываются в СУБД пачкой
+    раз в ``like_flush_interval`` секунд или при накоплении ``like_flush_size`` изменений. Счётчик каждого твита
+    обновляется одним запросом на пачку, поэтому тысячи лайков одного твита не выстраиваются в очередь за блокировкой
+    строки. Ценой служит окно потери: при аварийном падении воркера теряются изменения за последний интервал.
+
+Attributes
+----------
+like_buffer: LikeBuffer
+    Буфер лайков воркера.
+"""
+import asyncio
+import time
+import typing as t
+
+import structlog
+
+from app_tweets.db_services import TweetDbService
+from exceptions import BackendException, ErrorsList
+from settings import settings
+
+logger = structlog.get_logger()
+
+LikeKey = t.Tuple[int, int]
+
+
+class LikeBuffer:
+    """Класс копит изменения лайков и сбрасывает их в СУБД пачками.
+
+    Parameters
+    ----------
+    service: TweetDbService
+        Сервис работы с СУБД твитов.
+    flush_interval: float
+        Интервал сброса буфера в секундах. Определяет, сколько лайков может потеряться при падении воркера.
+    flush_size: int
+        Количество накопленных изменений, при котором буфер сбрасывается не дожидаясь интервала.
+
+    Note
+    ----
+    Для каждой пары ``(tweet_id, author_id)`` хранится только итоговое изменение: True - лайк, False - дизлайк.
+    Лайк и дизлайк одного автора внутри интервала взаимно уничтожаются и до СУБД не доходят.
+    """
+
+    def __init__(self, service: TweetDbService, flush_interval: float, flush_size: int) -> None:
+        self.service = service
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending: t.Dict[LikeKey, bool] = {}
+        self._inflight: t.Dict[LikeKey, bool] = {}
+        self._lock = asyncio.Lock()
+        self._task: t.Optional[asyncio.Task] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed_likes = 0
+        self.flushed_unlikes = 0
+        self.errors = 0
+        self.last_flush_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def add(self, tweet_id: int, author_id: int) -> bool:
+        """Метод принимает лайк в буфер.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор лайкнувшего автора.
+
+        Returns
+        -------
+        bool
+            True, если лайк принят. False, если автор уже лайкал твит.
+        """
+        return await self._apply((tweet_id, author_id), liked=True)
+
+    async def remove(self, tweet_id: int, author_id: int) -> bool:
+        """Метод принимает дизлайк в буфер.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор автора лайка.
+
+        Returns
+        -------
+        bool
+            True, если дизлайк принят. False, если лайка не было.
+        """
+        return await self._apply((tweet_id, author_id), liked=False)
+
+    async def flush(self) -> None:
+        """Метод сбрасывает накопленные изменения в СУБД одной транзакцией.
+        При ошибке изменения возвращаются в буфер и будут записаны при следующем сбросе.
+        """
+        async with self._lock:
+            if not self._pending:
+                return
+            self._inflight, self._pending = self._pending, {}
+            added = [key for key, liked in self._inflight.items() if liked]
+            removed = [key for key, liked in self._inflight.items() if not liked]
+            started = time.monotonic()
+            try:
+                await self.service.flush_likes(added=added, removed=removed)
+            except BackendException as e:
+                self.errors += 1
+                for key, liked in self._inflight.items():
+                    if self._pending.pop(key, None) is None:
+                        self._pending[key] = liked
+                logger.exception(event="ошибка сброса буфера лайков", exc_info=e, pending=len(self._pending))
+            else:
+                self.flushes += 1
+                self.flushed_likes += len(added)
+                self.flushed_unlikes += len(removed)
+                self.last_flush_seconds = time.monotonic() - started
+                logger.info(event="буфер лайков сброшен", **self.stats())
+            finally:
+                self._inflight = {}
+
+    def start(self) -> None:
+        """Метод запускает периодический сброс буфера в цикле событий воркера."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Метод останавливает периодический сброс и записывает остаток буфера. Вызывается при остановке воркера."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        """Метод возвращает метрики буфера.
+
+        Returns
+        -------
+        dict
+            Словарь с размером буфера и счётчиками принятых, отклонённых и записанных изменений.
+        """
+        return dict(
+            pending=len(self._pending),
+            accepted=self.accepted,
+            rejected=self.rejected,
+            flushes=self.flushes,
+            flushed_likes=self.flushed_likes,
+            flushed_unlikes=self.flushed_unlikes,
+            errors=self.errors,
+            last_flush_seconds=round(self.last_flush_seconds, 6),
+        )
+
+    async def _apply(self, key: LikeKey, liked: bool) -> bool:
+        """Внутренний метод принимает изменение, если оно меняет текущее состояние лайка."""
+        state = self._state(key)
+        if state is None:
+            exists = await self.service.like_exists(*key)
+            if exists is None:
+                raise BackendException(**ErrorsList.tweet_not_exists)
+            state = self._state(key)
+            state = exists if state is None else state
+        if state is liked:
+            self.rejected += 1
+            return False
+        if key in self._pending:
+            del self._pending[key]
+        else:
+            self._pending[key] = liked
+        self.accepted += 1
+        if len(self._pending) >= self.flush_size:
+            await self.flush()
+        return True
+
+    def _state(self, key: LikeKey) -> t.Optional[bool]:
+        """Внутренний метод возвращает состояние лайка с учётом ещё не записанных изменений."""
+        if key in self._pending:
+            return self._pending[key]
+        return self._inflight.get(key)
+
+    async def _flush_loop(self) -> None:
+        """Внутренний метод периодически сбрасывает буфер."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+like_buffer = LikeBuffer(
+    TweetDbService(), flush_interval=settings.like_flush_interval, flush_size=settings.like_flush_size
+)
@@ -2,60 +2,314 @@
 db_services.py
 --------------
 Модуль реализует классы для взаимодействия между бизнес-логикой и СУБД.
+
+Note
+----
+    Твиты, запрошенные по идентификатору, кэшируются в памяти воркера в сериализованном виде (``tweet_cache``).
+    Лайк, дизлайк и удаление твита удаляют его из кэша и рассылают инвалидацию остальным воркерам
+    через ``tweet_invalidator``. Если рассылка потеряна, устаревший твит живёт не дольше ``tweet_cache_ttl`` секунд.
+
+    Удалённые твиты через ``archive_after`` секунд переносятся в таблицу ``tweets_archive`` (``archive_tweets``),
+    чтобы не раздувать таблицу ``tweets`` и её индексы. По идентификатору они по-прежнему доступны.
+
+    Твиты читаются с проекцией ``TWEET_PROJECTION``: из таблицы твитов - только поля ``TweetModelSchema``,
+    из авторов твита и лайков - только идентификатор и имя. Хэш пароля и api-key автора при чтении твитов
+    из СУБД не выбираются.
+
+    Читатели автора и авторы, которых читает владелец ленты, берутся из таблицы подписок ``follows``,
+    порог популярности автора - из счётчика ``Author.follower_count``.
+
+    Каждое изменение твита назначает ему новую версию, а его автору - новую версию твитов ``Author.tweets_version``
+    в той же транзакции. По ним эндпоинты отвечают на условные запросы, не читая самих твитов.
+
+    События потока твитов (``app_tweets.stream``) рассылаются через ``pg_notify`` в канал ``tweet_stream_channel``.
 """
+import json
 import typing as t
+from datetime import datetime
 
 import structlog
 from loguru import logger
-from sqlalchemy import select, update
-from sqlalchemy.orm import selectinload
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    Text,
+    cast,
+    column,
+    delete,
+    exists,
+    false,
+    func,
+    literal,
+    literal_column,
+    select,
+    true,
+    tuple_,
+    union_all,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import (
+    ARRAY,
+    JSONB,
+    REAL,
+    aggregate_order_by,
+    insert,
+)
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlalchemy.sql.expression import (
+    CTE,
+    ColumnElement,
+    FromClause,
+    Insert,
+    Select,
+    Update,
+)
 
+from app_media.models import Media
 from app_tweets.interfaces import AbstractTweetService
-from app_tweets.models import Tweet
-from app_tweets.schemas import TweetInSchema, TweetModelSchema
+from app_tweets.models import (
+    SEARCH_CONFIG,
+    TWEET_VERSIONS,
+    Hashtag,
+    HashtagCounter,
+    Like,
+    Timeline,
+    Tweet,
+    TweetArchive,
+)
+from app_tweets.schemas import TweetEventSchema, TweetInSchema, TweetModelSchema
+from app_users.models import AUTHOR_VERSIONS, Author, Follow
+from app_users.schemas import AuthorBaseSchema
+from cache import CacheInvalidator, TTLCache, cache_backend
 from db import session
 from exceptions import BackendException, ErrorsList, exc_handler
 from schemas import SuccessSchema
+from settings import settings
 
 structlog.configure(processors=[structlog.processors.JSONRenderer(ensure_ascii=False)])
 log = structlog.get_logger()
 
+ARCHIVE_LOCK_KEY = 0x7477_6565_7473  # 'tweets'
+TWEET_PROJECTION = (
+    load_only(Tweet.id, Tweet.content, Tweet.author_id, Tweet.attachments, Tweet.soft_delete, Tweet.version),
+    selectinload(Tweet.author).load_only(Author.id, Author.name),
+    selectinload(Tweet.likes).joinedload(Like.author).load_only(Author.id, Author.name),
+)
+ARCHIVE_PROJECTION = (joinedload(TweetArchive.author).load_only(Author.id, Author.name),)
+
+tweet_cache = TTLCache(name="tweet", maxsize=settings.tweet_cache_size, ttl=settings.tweet_cache_ttl)
+tweet_invalidator = CacheInvalidator(tweet_cache, channel="invalidate:tweet", backend=cache_backend)
+
+
+def lock_authors(author_ids: t.Union[t.Iterable[int], Select]) -> Select:
+    """Функция возвращает запрос, блокирующий строки авторов до того, как их твитам назначаются новые версии.
+
+    Parameters
+    ----------
+    author_ids: Iterable[int] | Select
+        Идентификаторы авторов или подзапрос, возвращающий их.
+
+    Returns
+    -------
+    Select
+        Запрос ``SELECT authors.id ... ORDER BY id FOR UPDATE``.
+
+    Note
+    ----
+    Версии твитов - курсор опроса изменений (``get_changes``), поэтому для одного автора они должны идти в порядке
+    фиксации транзакций. Каждый запрос, берущий версию из ``tweet_versions``, сначала блокирует строку автора
+    твита: следующая транзакция возьмёт версию только после фиксации предыдущей, и опрос не перескочит
+    через изменение, которое ещё не было видно. Изменяющий твиты подзапрос должен зависеть от блокировки,
+    например через ``EXISTS``, иначе Postgres может взять версию раньше, чем заблокирует строку.
+    Строки блокируются в порядке идентификаторов, как и в ``_change_follow``, поэтому не взаимоблокируются.
+    """
+    return select(Author.id).where(Author.id.in_(author_ids)).order_by(Author.id).with_for_update()
+
+
+def touch_authors(changed: CTE) -> Update:
+    """Функция возвращает запрос, назначающий новую версию твитов авторам изменённых твитов.
+
+    Parameters
+    ----------
+    changed: CTE
+        Изменяющий твиты подзапрос ``UPDATE ... RETURNING author_id``.
+
+    Returns
+    -------
+    Update
+        Запрос ``WITH changed AS (...) UPDATE authors ... FROM changed RETURNING authors.id``.
+    """
+    return (
+        update(Author)
+        .where(Author.id == changed.c.author_id)
+        .values(tweets_version=AUTHOR_VERSIONS.next_value())
+        .returning(Author.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def fan_out(tweets: FromClause, author_id: int, fanout_limit: int) -> Insert:
+    """Функция возвращает запрос, раскладывающий новые твиты автора по домашним лентам его читателей и его собственной.
+
+    Parameters
+    ----------
+    tweets: FromClause
+        Источник идентификаторов новых твитов со столбцом ``id``.
+    author_id: int
+        Идентификатор автора твитов в СУБД.
+    fanout_limit: int
+        Максимальное число читателей, при котором твиты раскладываются по их лентам.
+
+    Returns
+    -------
+    Insert
+        Запрос ``INSERT INTO timelines ... SELECT ... ON CONFLICT DO NOTHING``.
+    """
+    readers = (
+        select(Follow.follower_id, tweets.c.id)
+        .select_from(Author)
+        .join(Follow, Follow.followee_id == Author.id)
+        .join(tweets, true())
+        .where(Author.id == author_id, Author.follower_count <= fanout_limit)
+    )
+    owner = select(literal(author_id), tweets.c.id)
+    return insert(Timeline).from_select(["owner_id", "tweet_id"], union_all(readers, owner)).on_conflict_do_nothing()
+
+
+def count_hashtags(pairs: Select, bucket: datetime) -> Insert:
+    """Функция возвращает запрос, добавляющий хэштеги в обратный индекс и увеличивающий счётчики популярности.
+
+    Parameters
+    ----------
+    pairs: Select
+        Подзапрос пар ``(tag, tweet_id)``.
+    bucket: datetime
+        Начало текущего интервала счётчиков.
+
+    Returns
+    -------
+    Insert
+        Запрос ``WITH added AS (INSERT INTO hashtags ... RETURNING tag) INSERT INTO hashtag_counters ...``.
+        Счётчики увеличиваются только на реально добавленные в индекс пары, поэтому повторная запись хэштегов
+        твита не завышает популярность.
+    """
+    added = (
+        insert(Hashtag)
+        .from_select(["tag", "tweet_id"], pairs)
+        .on_conflict_do_nothing()
+        .returning(Hashtag.tag)
+        .cte("added")
+    )
+    counts = select(added.c.tag, literal(bucket), func.count()).group_by(added.c.tag)
+    query = insert(HashtagCounter).from_select(["tag", "bucket", "count"], counts)
+    return query.on_conflict_do_update(
+        index_elements=[HashtagCounter.tag, HashtagCounter.bucket],
+        set_={"count": HashtagCounter.count + query.excluded.count},
+    )
+
+
+def publish_columns(
+    tweets: FromClause,
+    author_id: int,
+    fanout_limit: t.Optional[int] = None,
+    hashtags: t.Optional[Select] = None,
+    bucket: t.Optional[datetime] = None,
+    notify: bool = False,
+) -> t.List[ColumnElement]:
+    """Функция возвращает столбцы, которые в запросе создания твитов раскладывают их по лентам, индексируют
+    хэштеги и рассылают события потока.
+
+    Parameters
+    ----------
+    tweets: FromClause
+        Источник идентификаторов новых твитов со столбцом ``id``.
+    author_id: int
+        Идентификатор автора твитов в СУБД.
+    fanout_limit: int, optional
+        Порог раскладки по лентам читателей. Если не задан, твиты по лентам не раскладываются.
+    hashtags: Select, optional
+        Подзапрос пар ``(tag, tweet_id)`` хэштегов новых твитов.
+    bucket: datetime, optional
+        Начало текущего интервала счётчиков хэштегов.
+    notify: bool
+        Разослать событие ``tweet`` о каждом новом твите.
+
+    Returns
+    -------
+    List[ColumnElement]
+        Столбцы ``fanned`` и ``tagged`` с числом строк, записанных изменяющими CTE, и ``pg_notify`` событий.
+        Уведомление рассылается для каждой строки запроса, поэтому столбец события нужно выбирать из ``tweets``.
+    """
+    columns = []
+    if fanout_limit is not None:
+        fanned = fan_out(tweets, author_id, fanout_limit).returning(Timeline.tweet_id).cte("fanned")
+        columns.append(select(func.count()).select_from(fanned).scalar_subquery().label("fanned"))
+    if hashtags is not None:
+        tagged = count_hashtags(hashtags, bucket).returning(HashtagCounter.tag).cte("tagged")
+        columns.append(select(func.count()).select_from(tagged).scalar_subquery().label("tagged"))
+    if notify:
+        event = func.jsonb_build_object("event", "tweet", "tweet_id", tweets.c.id, "author_id", literal(author_id))
+        columns.append(func.pg_notify(settings.tweet_stream_channel, cast(event, Text)).label("notified"))
+    return columns
+
 
 class TweetDbService(AbstractTweetService):
     """Класс инкапсулирует cruid-методы для твитов в СУБД."""
 
     @exc_handler(ConnectionRefusedError)
-    async def get_list(self, author_id: int) -> t.Optional[t.List[TweetModelSchema]]:
-        """Метод получает список твитов из СУБД конкретного автора.
+    async def get_list(
+        self,
+        author_id: int,
+        limit: int = settings.tweets_page_size,
+        before_id: t.Optional[int] = None,
+        after_id: t.Optional[int] = None,
+    ) -> t.Optional[t.List[TweetModelSchema]]:
+        """Метод получает из СУБД страницу твитов конкретного автора от новых к старым.
 
         Parameters
         ----------
         author_id: int
             Идентификатор автора в СУБД.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Вернуть твиты старше этого.
+        after_id: int, optional
+            Вернуть твиты новее этого. Выбираются ближайшие к ``after_id``.
 
         Returns
         -------
         List[TweetModelSchema], optional
             Список pydantic-схем ORM модели твитов автора.
-        """
 
-        query = (
-            select(Tweet)
-            .filter_by(author_id=author_id, soft_delete=False)
-            .order_by(Tweet.id)
-            .options(selectinload(Tweet.author))
-        )
+        Note
+        ----
+        Страница выбирается по индексу ``(author_id, id)`` без OFFSET, стоимость не зависит от её глубины.
+        """
+        query = select(Tweet).where(Tweet.author_id == author_id, Tweet.soft_delete == false())
+        if before_id:
+            query = query.where(Tweet.id < before_id)
+        if after_id:
+            query = query.where(Tweet.id > after_id)
+        query = query.order_by(Tweet.id.asc() if after_id else Tweet.id.desc()).limit(limit).options(*TWEET_PROJECTION)
         async with session() as async_session:
             async with async_session.begin():
                 if query_set := await async_session.execute(query):
-                    return [TweetModelSchema.from_orm(item) for item in query_set.scalars().all()]
+                    tweets = [TweetModelSchema.from_orm(item) for item in query_set.scalars().all()]
+                    return tweets[::-1] if after_id else tweets
 
     @exc_handler(ConnectionRefusedError)
     async def create_tweet(
         self,
         new_tweet: TweetInSchema,
         author_id: int,
-        attachments: t.Optional[t.List[str]],
+        attachments: t.Optional[t.List[str]] = None,
+        media_ids: t.Optional[t.List[int]] = None,
+        tags: t.Optional[t.List[str]] = None,
+        bucket: t.Optional[datetime] = None,
+        fanout_limit: t.Optional[int] = None,
+        notify: bool = False,
     ) -> TweetModelSchema:
         """
         Метод создаёт новый твит автора.
@@ -68,27 +322,386 @@ class TweetDbService(AbstractTweetService):
             Идентификатор автора в базе.
         attachments: t.List[str], optional
             Ссылки на картинки.
+        media_ids: t.List[int], optional
+            Идентификаторы медиа-ресурсов. Если переданы, ссылки на картинки берутся из СУБД в порядке идентификаторов.
+        tags: List[str], optional
+            Хэштеги твита для обратного индекса и счётчиков интервала ``bucket``.
+        bucket: datetime, optional
+            Начало текущего интервала счётчиков хэштегов.
+        fanout_limit: int, optional
+            Порог раскладки твита по лентам читателей. Если не задан, твит по лентам не раскладывается.
+        notify: bool
+            Разослать событие ``tweet`` в поток твитов.
 
         Returns
         -------
         Tweet
             Pydantic схема ORM модели нового твита.
+
+        Note
+        ----
+        Строка автора блокируется (``lock_authors``), и версия твита берётся из последовательности уже под
+        блокировкой. Твит вставляется, ссылки на картинки подставляются подзапросом, автору назначается новая
+        версия твитов,
+        твит раскладывается по лентам, его хэштеги попадают в индекс и счётчики, а событие - в ``pg_notify``,
+        и всё это одним запросом ``WITH locked AS (SELECT ... FOR UPDATE), created AS (INSERT ... RETURNING ...),
+        touched AS (UPDATE authors ...),
+        fanned AS (INSERT INTO timelines ...), added AS (...), tagged AS (...) SELECT ...``. Если запрос падает,
+        не остаётся ни твита без лент и хэштегов, ни счётчиков без твита, а Postgres доставляет уведомление только
+        после фиксации транзакции.
         """
-        tweet = Tweet(
-            content=new_tweet.tweet_data,
-            author_id=author_id,
-            likes=[],
-            soft_delete=False,
-            attachments=attachments,
+        if media_ids:
+            links = (
+                select(
+                    func.coalesce(
+                        func.jsonb_agg(
+                            aggregate_order_by(
+                                Media.link, func.array_position(cast(media_ids, ARRAY(Integer)), Media.id)
+                            )
+                        ),
+                        cast([], JSONB),
+                    )
+                )
+                .where(Media.id.in_(media_ids))
+                .scalar_subquery()
+            )
+        else:
+            links = cast(attachments or [], JSONB)
+        locked = lock_authors([author_id]).cte("locked")
+        # счётчик лайков задан явно: значение по умолчанию из модели не подставляется в INSERT,
+        # который соседствует в запросе с UPDATE; версия берётся в SELECT из заблокированной строки автора
+        created = (
+            insert(Tweet)
+            .from_select(
+                ["content", "author_id", "attachments", "soft_delete", "like_count", "version"],
+                select(
+                    literal(new_tweet.tweet_data, Text),
+                    locked.c.id,
+                    links,
+                    false(),
+                    literal(0),
+                    TWEET_VERSIONS.next_value(),
+                ).select_from(locked),
+            )
+            .returning(Tweet.id, Tweet.content, Tweet.author_id, Tweet.attachments, Tweet.soft_delete, Tweet.version)
+            .cte("created")
         )
+        touched = (
+            update(Author)
+            .where(Author.id == author_id)
+            .values(tweets_version=AUTHOR_VERSIONS.next_value())
+            .returning(Author.name)
+            .cte("touched")
+        )
+        hashtags = None
+        if tags:
+            rows = func.unnest(cast(tags, ARRAY(Text))).table_valued("tag").render_derived("tags")
+            hashtags = select(rows.c.tag, created.c.id).select_from(created).join(rows, true())
+        columns = publish_columns(created, author_id, fanout_limit, hashtags, bucket, notify)
+        query = select(created, touched.c.name.label("author_name"), *columns).join(touched, true())
         log.info(event="пишем твит в postgres", tweet=new_tweet.dict(), attachments=attachments, author_id=author_id)
         async with session() as async_session:
             async with async_session.begin():
-                async_session.add(tweet)
-                await async_session.commit()
+                qs = await async_session.execute(query)
+                row = qs.one()
                 log.info("создан твит")
-        tweet = await self.get_tweet_by_id(tweet_id=tweet.id)
-        return TweetModelSchema.from_orm(tweet)
+        return TweetModelSchema(
+            id=row.id,
+            content=row.content,
+            author_id=row.author_id,
+            soft_delete=row.soft_delete,
+            likes=[],
+            attachments=row.attachments,
+            author=AuthorBaseSchema(id=row.author_id, name=row.author_name),
+            version=row.version,
+        )
+
+    @exc_handler(ConnectionRefusedError)
+    async def create_tweets(
+        self,
+        new_tweets: t.List[TweetInSchema],
+        author_id: int,
+        tags: t.Optional[t.List[t.List[str]]] = None,
+        bucket: t.Optional[datetime] = None,
+        fanout_limit: t.Optional[int] = None,
+        notify: bool = False,
+    ) -> t.List[int]:
+        """
+        Метод сохраняет пачку твитов автора одной транзакцией.
+
+        Parameters
+        ----------
+        new_tweets: List[TweetInSchema]
+            Провалидированные pydantic-схемы новых твитов.
+        author_id: int
+            Идентификатор автора в СУБД.
+        tags: List[List[str]], optional
+            Хэштеги каждого твита в порядке ``new_tweets``.
+        bucket: datetime, optional
+            Начало текущего интервала счётчиков хэштегов.
+        fanout_limit: int, optional
+            Порог раскладки твитов по лентам читателей. Если не задан, твиты по лентам не раскладываются.
+        notify: bool
+            Разослать событие ``tweet`` о каждом твите в поток твитов.
+
+        Returns
+        -------
+        List[int]
+            Идентификаторы новых твитов в порядке ``new_tweets``.
+
+        Note
+        ----
+        Ссылки на картинки всех твитов выбираются одним запросом, а твиты вставляются одним
+        ``INSERT ... SELECT FROM unnest(...) WITH ORDINALITY``: размер запроса не зависит от числа твитов,
+        а идентификаторы выдаются последовательностью в порядке пачки. Перед вставкой блокируется строка автора
+        (``lock_authors``), чтобы версии твитов шли в порядке фиксации. Раскладка по лентам, хэштеги и события
+        (``publish_columns``) записываются вторым запросом в той же транзакции.
+        """
+        media_ids = {media_id for new_tweet in new_tweets for media_id in new_tweet.tweet_media_ids or []}
+        async with session() as async_session:
+            async with async_session.begin():
+                await async_session.execute(lock_authors([author_id]))
+                links = {}
+                if media_ids:
+                    qs = await async_session.execute(select(Media.id, Media.link).where(Media.id.in_(media_ids)))
+                    links = dict(qs.all())
+                attachments = [
+                    json.dumps([links[media_id] for media_id in new_tweet.tweet_media_ids or [] if media_id in links])
+                    for new_tweet in new_tweets
+                ]
+                rows = (
+                    func.unnest(
+                        cast([new_tweet.tweet_data for new_tweet in new_tweets], ARRAY(Text)),
+                        cast(attachments, ARRAY(Text)),
+                    )
+                    .table_valued("content", "attachments", with_ordinality="n")
+                    .render_derived("rows")
+                )
+                query = (
+                    insert(Tweet)
+                    .from_select(
+                        ["content", "author_id", "attachments", "soft_delete"],
+                        select(rows.c.content, literal(author_id), cast(rows.c.attachments, JSONB), false()).order_by(
+                            rows.c.n
+                        ),
+                    )
+                    .returning(Tweet.id)
+                )
+                qs = await async_session.execute(query)
+                tweet_ids = sorted(qs.scalars().all())
+                await async_session.execute(
+                    update(Author).where(Author.id == author_id).values(tweets_version=AUTHOR_VERSIONS.next_value())
+                )
+                tweets = func.unnest(cast(tweet_ids, ARRAY(Integer))).table_valued("id").render_derived("tweet")
+                hashtags = None
+                if pairs := [
+                    (tweet_id, tag) for tweet_id, tweet_tags in zip(tweet_ids, tags or []) for tag in tweet_tags
+                ]:
+                    rows = (
+                        func.unnest(
+                            cast([tweet_id for tweet_id, _ in pairs], ARRAY(Integer)),
+                            cast([tag for _, tag in pairs], ARRAY(Text)),
+                        )
+                        .table_valued("tweet_id", "tag")
+                        .render_derived("rows")
+                    )
+                    hashtags = select(rows.c.tag, rows.c.tweet_id)
+                if columns := publish_columns(tweets, author_id, fanout_limit, hashtags, bucket, notify):
+                    query = select(*columns)
+                    await async_session.execute(query.select_from(tweets) if notify else query)
+        log.info(event="пачка твитов записана в postgres", author_id=author_id, count=len(tweet_ids))
+        return tweet_ids
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_tag_tweets(
+        self, tag: str, limit: int, before_id: t.Optional[int] = None
+    ) -> t.List[TweetModelSchema]:
+        """Метод возвращает страницу твитов с хэштегом от новых к старым.
+
+        Parameters
+        ----------
+        tag: str
+            Хэштег без решётки в нижнем регистре.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Вернуть твиты с идентификатором меньше этого.
+
+        Returns
+        -------
+        List[TweetModelSchema]
+            Список pydantic-схем твитов.
+        """
+        query = (
+            select(Tweet)
+            .join(Hashtag, Hashtag.tweet_id == Tweet.id)
+            .where(Hashtag.tag == tag, Tweet.soft_delete == false())
+        )
+        if before_id:
+            # условие на Tweet.id дублирует условие на хэштег, чтобы отсечь новые секции таблицы твитов
+            query = query.where(Hashtag.tweet_id < before_id, Tweet.id < before_id)
+        query = query.order_by(Hashtag.tweet_id.desc()).limit(limit).options(*TWEET_PROJECTION)
+        async with session() as async_session:
+            async with async_session.begin():
+                qs = await async_session.execute(query)
+                tweets = [TweetModelSchema.from_orm(item) for item in qs.scalars().all()]
+        log.info(event="запрос твитов хэштега", tag=tag, before_id=before_id, count=len(tweets))
+        return tweets
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_trending(self, since: datetime, limit: int) -> t.List[t.Tuple[str, int]]:
+        """Метод возвращает самые упоминаемые хэштеги за скользящее окно.
+
+        Parameters
+        ----------
+        since: datetime
+            Начало окна.
+        limit: int
+            Количество хэштегов.
+
+        Returns
+        -------
+        List[Tuple[str, int]]
+            Пары из хэштега и числа твитов с ним за окно по убыванию числа.
+        """
+        total = func.sum(HashtagCounter.count).label("count")
+        query = (
+            select(HashtagCounter.tag, total)
+            .where(HashtagCounter.bucket >= since)
+            .group_by(HashtagCounter.tag)
+            .order_by(total.desc(), HashtagCounter.tag)
+            .limit(limit)
+        )
+        async with session() as async_session:
+            async with async_session.begin():
+                qs = await async_session.execute(query)
+                trending = [(row.tag, row.count) for row in qs.all()]
+        log.info(event="запрос популярных хэштегов", since=since, count=len(trending))
+        return trending
+
+    @exc_handler(ConnectionRefusedError)
+    async def prune_hashtag_counters(self, before: datetime) -> int:
+        """Метод удаляет счётчики интервалов, вышедших из окна популярности.
+        Вызывается каждым проходом архиватора (``TweetArchiver.run_once``).
+
+        Parameters
+        ----------
+        before: datetime
+            Счётчики интервалов раньше этого момента удаляются.
+
+        Returns
+        -------
+        int
+            Количество удалённых счётчиков.
+        """
+        query = delete(HashtagCounter).where(HashtagCounter.bucket < before)
+        async with session() as async_session:
+            async with async_session.begin():
+                result = await async_session.execute(query)
+        log.info(event="удалены устаревшие счётчики хэштегов", before=before, count=result.rowcount)
+        return result.rowcount
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_timeline(
+        self, owner_id: int, fanout_limit: int, limit: int, before_id: t.Optional[int] = None
+    ) -> t.List[TweetModelSchema]:
+        """Метод возвращает страницу домашней ленты автора от новых твитов к старым.
+
+        Parameters
+        ----------
+        owner_id: int
+            Идентификатор автора, чью ленту читаем.
+        fanout_limit: int
+            Порог числа читателей, выше которого твиты автора читаются из таблицы твитов, а не из лент.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Вернуть твиты с идентификатором меньше этого.
+
+        Returns
+        -------
+        List[TweetModelSchema]
+            Список pydantic-схем твитов ленты.
+
+        Note
+        ----
+        Обе ветки запроса - материализованная лента и твиты популярных авторов - читают не больше ``limit``
+        строк по индексу, поэтому стоимость страницы не зависит от числа подписок и глубины ленты.
+        Авторы, которых читает владелец ленты, выбираются по первичному ключу ``follows``, популярные из них -
+        по счётчику читателей без подсчёта подписок.
+
+        В ленте только твиты самого владельца и авторов, которых он читает сейчас: отписка удаляет разложенные
+        в ленту твиты автора в той же транзакции, что и подписку (``AuthorDbService.unfollow``).
+        """
+        own = select(Timeline.tweet_id.label("id")).where(Timeline.owner_id == owner_id)
+        celebrities = (
+            select(Author.id)
+            .join(Follow, Follow.followee_id == Author.id)
+            .where(Follow.follower_id == owner_id, Author.follower_count > fanout_limit)
+        )
+        pulled = select(Tweet.id).where(Tweet.author_id.in_(celebrities), Tweet.soft_delete == false())
+        if before_id:
+            own = own.where(Timeline.tweet_id < before_id)
+            pulled = pulled.where(Tweet.id < before_id)
+        ids = union_all(
+            own.order_by(Timeline.tweet_id.desc()).limit(limit),
+            pulled.order_by(Tweet.id.desc()).limit(limit),
+        ).subquery()
+        query = (
+            select(Tweet)
+            .where(Tweet.id.in_(select(ids.c.id)), Tweet.soft_delete == false())
+            .order_by(Tweet.id.desc())
+            .limit(limit)
+            .options(*TWEET_PROJECTION)
+        )
+        async with session() as async_session:
+            async with async_session.begin():
+                query_set = await async_session.execute(query)
+                tweets = [TweetModelSchema.from_orm(item) for item in query_set.scalars().all()]
+        log.info(event="запрос домашней ленты", owner_id=owner_id, before_id=before_id, count=len(tweets))
+        return tweets
+
+    @exc_handler(ConnectionRefusedError)
+    async def search(
+        self, text: str, limit: int, rank: t.Optional[float] = None, before_id: t.Optional[int] = None
+    ) -> t.List[t.Tuple[TweetModelSchema, float]]:
+        """Метод ищет твиты по тексту и возвращает страницу, упорядоченную по убыванию релевантности.
+
+        Parameters
+        ----------
+        text: str
+            Поисковый запрос в синтаксисе ``websearch_to_tsquery``: слова, "фразы", -исключения, or.
+        limit: int
+            Размер страницы.
+        rank: float, optional
+            Релевантность последнего твита предыдущей страницы.
+        before_id: int, optional
+            Идентификатор последнего твита предыдущей страницы.
+
+        Returns
+        -------
+        List[Tuple[TweetModelSchema, float]]
+            Пары из pydantic-схемы твита и его релевантности.
+
+        Note
+        ----
+        Совпадения выбираются по GIN-индексу ``search_vector``, удалённые твиты исключаются.
+        Страницы разделяются по паре ``(rank, id)`` без OFFSET.
+        """
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), text)
+        relevance = func.ts_rank(Tweet.search_vector, tsquery)
+        query = select(Tweet, relevance.label("rank")).where(
+            Tweet.search_vector.op("@@")(tsquery), Tweet.soft_delete == false()
+        )
+        if rank is not None and before_id:
+            query = query.where(tuple_(relevance, Tweet.id) < tuple_(cast(rank, REAL), before_id))
+        query = query.order_by(relevance.desc(), Tweet.id.desc()).limit(limit).options(*TWEET_PROJECTION)
+        async with session() as async_session:
+            async with async_session.begin():
+                qs = await async_session.execute(query)
+                found = [(TweetModelSchema.from_orm(row.Tweet), row.rank) for row in qs.all()]
+        log.info(event="полнотекстовый поиск твитов", text=text, rank=rank, before_id=before_id, count=len(found))
+        return found
 
     @exc_handler(ConnectionRefusedError)
     async def get_tweet_by_id(self, tweet_id: int) -> t.Optional[TweetModelSchema]:
@@ -103,19 +716,185 @@ class TweetDbService(AbstractTweetService):
         -------
         TweetModelSchema
             Pydantic-схема твита.
+
+        Note
+        ----
+        Твит, которого нет в ``tweets``, ищется в архиве удалённых твитов.
         """
+        if cached := tweet_cache.get(tweet_id):
+            return TweetModelSchema.parse_raw(cached)
         logger.info("запрос твитта по идентификатору СУБД.", tweet_id=tweet_id)
-        query = select(Tweet).filter_by(id=tweet_id)
+        query = select(Tweet).filter_by(id=tweet_id).options(*TWEET_PROJECTION)
         async with session() as async_session:
             async with async_session.begin():
                 qs = await async_session.execute(query)
                 result = qs.scalars().first()
+            if not result:
+                async with async_session.begin():
+                    qs = await async_session.execute(
+                        select(TweetArchive).filter_by(id=tweet_id).options(*ARCHIVE_PROJECTION)
+                    )
+                    result = qs.scalars().first()
         if result:
             tweet = TweetModelSchema.from_orm(result)
+            tweet_cache.set(tweet_id, tweet.json())
             logger.info("твит запрошен успешно", tweet=tweet.dict())
             return tweet
         raise BackendException(**ErrorsList.tweet_not_exists)
 
+    @exc_handler(ConnectionRefusedError)
+    async def get_changes(
+        self, author_id: int, since_version: int, limit: int
+    ) -> t.Tuple[t.List[TweetModelSchema], t.List[int], t.Optional[int]]:
+        """Метод возвращает твиты автора, изменённые после версии: новые, лайкнутые, дизлайкнутые и удалённые.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор автора в СУБД.
+        since_version: int
+            Версия, после которой нужны изменения.
+        limit: int
+            Максимальное количество изменений. Изменения отдаются от старых к новым, остальные - следующим запросом.
+
+        Returns
+        -------
+        Tuple[List[TweetModelSchema], List[int], int | None]
+            Изменённые неудалённые твиты, идентификаторы удалённых твитов и наибольшая версия среди изменений
+            или None, если изменений нет.
+
+        Note
+        ----
+        Версия твита назначается из общей возрастающей последовательности при каждом изменении, поэтому изменения
+        после версии выбираются по индексам ``(author_id, version)`` таблицы твитов и архива одним запросом,
+        и опрос без изменений не читает ничего, кроме индексов. Твиты загружаются вторым запросом, только если
+        изменения есть. Удалённые твиты, уже перенесённые в архив, тоже отдаются как удалённые.
+
+        Версию твиту назначает только транзакция, заблокировавшая строку его автора (``lock_authors``), поэтому
+        версии твитов одного автора идут в порядке фиксации: опрос не вернёт версию, после которой позже
+        зафиксируется изменение с меньшей версией.
+        """
+        live = select(Tweet.id, Tweet.version, Tweet.soft_delete).where(
+            Tweet.author_id == author_id, Tweet.version > since_version
+        )
+        archived = select(TweetArchive.id, TweetArchive.version, true()).where(
+            TweetArchive.author_id == author_id, TweetArchive.version > since_version
+        )
+        changes = union_all(live, archived).subquery()
+        query = select(changes).order_by(changes.c.version).limit(limit)
+        tweets: t.List[TweetModelSchema] = []
+        async with session() as async_session:
+            async with async_session.begin():
+                rows = (await async_session.execute(query)).all()
+                if changed := [row.id for row in rows if not row.soft_delete]:
+                    qs = await async_session.execute(
+                        select(Tweet).where(Tweet.id.in_(changed)).options(*TWEET_PROJECTION)
+                    )
+                    tweets = [TweetModelSchema.from_orm(item) for item in qs.scalars()]
+        # твит, удалённый между двумя запросами, отдаётся удалённым
+        deleted = [row.id for row in rows if row.soft_delete] + [tweet.id for tweet in tweets if tweet.soft_delete]
+        tweets = [tweet for tweet in tweets if not tweet.soft_delete]
+        version = rows[-1].version if rows else None
+        logger.info(
+            "запрос изменений твитов",
+            author_id=author_id,
+            since_version=since_version,
+            changes=len(rows),
+            version=version,
+        )
+        return tweets, deleted, version
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_tweets_by_ids(self, ids: t.List[int]) -> t.Dict[int, TweetModelSchema]:
+        """Метод возвращает твиты по списку идентификаторов СУБД.
+
+        Parameters
+        ----------
+        ids: List[int]
+            Идентификаторы твитов в СУБД.
+
+        Returns
+        -------
+        Dict[int, TweetModelSchema]
+            Pydantic-схемы найденных твитов по идентификаторам. Ненайденных твитов в словаре нет.
+
+        Note
+        ----
+        Твиты из кэша берутся без обращения к СУБД, остальные загружаются одним запросом ``IN (...)``
+        независимо от их количества. Твиты, которых нет в ``tweets``, ищутся одним запросом в архиве.
+        """
+        tweets = {
+            tweet_id: TweetModelSchema.parse_raw(cached) for tweet_id in ids if (cached := tweet_cache.get(tweet_id))
+        }
+        if missed := [tweet_id for tweet_id in ids if tweet_id not in tweets]:
+            async with session() as async_session:
+                async with async_session.begin():
+                    qs = await async_session.execute(
+                        select(Tweet).where(Tweet.id.in_(missed)).options(*TWEET_PROJECTION)
+                    )
+                    found = qs.scalars().all()
+                if archived := set(missed) - {tweet.id for tweet in found}:
+                    async with async_session.begin():
+                        qs = await async_session.execute(
+                            select(TweetArchive).where(TweetArchive.id.in_(archived)).options(*ARCHIVE_PROJECTION)
+                        )
+                        found += qs.scalars().all()
+            for item in found:
+                tweets[item.id] = TweetModelSchema.from_orm(item)
+                tweet_cache.set(item.id, tweets[item.id].json())
+        logger.info(
+            "запрос твитов по списку идентификаторов", ids=ids, found=len(tweets), cached=len(ids) - len(missed)
+        )
+        return tweets
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_tweet_version(self, tweet_id: int) -> t.Optional[int]:
+        """Метод возвращает версию твита, не загружая сам твит.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+
+        Returns
+        -------
+        int, optional
+            Версия твита из ``tweets`` или архива. None, если твита нет или он перенесён в архив без версии.
+
+        Note
+        ----
+        Версия твита из ``tweet_cache`` отдаётся без обращения к СУБД: любое изменение твита удаляет его из кэша.
+        """
+        if cached := tweet_cache.get(tweet_id):
+            return TweetModelSchema.parse_raw(cached).version
+        query = select(
+            func.coalesce(
+                select(Tweet.version).where(Tweet.id == tweet_id).scalar_subquery(),
+                select(TweetArchive.version).where(TweetArchive.id == tweet_id).scalar_subquery(),
+            )
+        )
+        async with session() as async_session:
+            async with async_session.begin():
+                return await async_session.scalar(query)
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_tweets_version(self, author_id: int) -> t.Optional[int]:
+        """Метод возвращает версию твитов автора.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор автора в СУБД.
+
+        Returns
+        -------
+        int, optional
+            Версия твитов автора или None, если автора нет.
+        """
+        async with session() as async_session:
+            async with async_session.begin():
+                return await async_session.scalar(select(Author.tweets_version).where(Author.id == author_id))
+
     @exc_handler(ConnectionRefusedError)
     async def delete_tweet(self, tweet_id: int, author_id: int) -> SuccessSchema:
         """Метод удаляет твит по идентификатору СУБД.
@@ -135,36 +914,364 @@ class TweetDbService(AbstractTweetService):
         Note
         ----
         Имеется в виду мягкое удаление через флаг удаления. На самом деле твит остаётся для принятия решения о
-        возбуждении уголовного дела по 288 статье УК РФ.
+        возбуждении уголовного дела по 288 статье УК РФ: позже он переносится в архив ``archive_tweets``.
         """
-        query = update(Tweet).filter_by(id=tweet_id, author_id=author_id).values(soft_delete=True)
+        locked = lock_authors([author_id]).cte("locked")
+        deleted = (
+            update(Tweet)
+            .filter_by(id=tweet_id, author_id=author_id, soft_delete=False)
+            .where(select(locked.c.id).exists())
+            .values(soft_delete=True, deleted_at=func.now(), version=TWEET_VERSIONS.next_value())
+            .returning(Tweet.author_id)
+            .cte("deleted")
+        )
+        query = touch_authors(deleted)
         async with session() as async_session:
             async with async_session.begin():
                 await async_session.execute(query)
                 await async_session.commit()
                 logger.info("удаляем твит из postgresql", tweet_id=tweet_id, author_id=author_id)
-                return SuccessSchema()
+        await tweet_invalidator.invalidate(tweet_id)
+        return SuccessSchema()
+
+    @exc_handler(ConnectionRefusedError)
+    async def archive_tweets(self, deleted_before: datetime, limit: int) -> t.Optional[t.List[int]]:
+        """Метод переносит пачку удалённых твитов из ``tweets`` в ``tweets_archive``.
+
+        Parameters
+        ----------
+        deleted_before: datetime
+            Переносятся твиты, удалённые раньше этого момента.
+        limit: int
+            Максимальный размер пачки.
+
+        Returns
+        -------
+        List[int], optional
+            Идентификаторы перенесённых твитов или None, если архивирует другой воркер.
+
+        Note
+        ----
+        Пачка переносится одним запросом ``WITH moved AS (DELETE ... RETURNING) INSERT INTO tweets_archive``
+        вместе со снимком лайков. Лайки, записи лент и хэштеги удаляются каскадно.
+        Транзакционная рекомендательная блокировка не даёт воркерам архивировать одновременно,
+        а ``SKIP LOCKED`` - ждать строки, которые сейчас лайкают.
+        """
+        doomed = (
+            select(Tweet.id)
+            .where(Tweet.soft_delete == true(), Tweet.deleted_at < deleted_before)
+            .order_by(Tweet.deleted_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        moved = (
+            delete(Tweet)
+            .where(Tweet.id.in_(doomed))
+            .returning(
+                Tweet.id,
+                Tweet.content,
+                Tweet.author_id,
+                Tweet.attachments,
+                Tweet.like_count,
+                Tweet.deleted_at,
+                Tweet.version,
+            )
+            .cte("moved")
+        )
+        like = func.jsonb_build_object("user_id", Like.author_id, "name", Author.name)
+        likes = (
+            select(func.coalesce(func.jsonb_agg(aggregate_order_by(like, Like.author_id)), cast([], JSONB)))
+            .select_from(Like)
+            .join(Author, Author.id == Like.author_id)
+            .where(Like.tweet_id == moved.c.id)
+            .scalar_subquery()
+        )
+        columns = ["id", "content", "author_id", "attachments", "like_count", "likes", "deleted_at", "version"]
+        rows = select(
+            moved.c.id,
+            moved.c.content,
+            moved.c.author_id,
+            moved.c.attachments,
+            moved.c.like_count,
+            likes,
+            moved.c.deleted_at,
+            moved.c.version,
+        )
+        query = insert(TweetArchive).from_select(columns, rows).returning(TweetArchive.id)
+        async with session() as async_session:
+            async with async_session.begin():
+                locked = await async_session.scalar(
+                    select(func.pg_try_advisory_xact_lock(cast(ARCHIVE_LOCK_KEY, BigInteger)))
+                )
+                if not locked:
+                    log.info(event="архивирование выполняет другой воркер")
+                    return None
+                qs = await async_session.execute(query)
+                tweet_ids = sorted(qs.scalars().all())
+        log.info(event="удалённые твиты перенесены в архив", count=len(tweet_ids), deleted_before=deleted_before)
+        return tweet_ids
 
     @exc_handler(ConnectionRefusedError)
-    async def update_like_in_tweet(self, tweet_id: int, likes: dict) -> SuccessSchema:
+    async def add_like(self, tweet_id: int, author_id: int) -> bool:
+        """Метод атомарно добавляет лайк автора к твиту и увеличивает счётчик лайков.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор лайкнувшего автора в СУБД.
+
+        Returns
+        -------
+        bool
+            True, если лайк добавлен. False, если автор уже лайкал твит или твита нет.
+
+        Note
+        ----
+        Вставка ``ON CONFLICT DO NOTHING`` и обновление счётчика выполняются одним запросом, поэтому
+        конкурентные лайки не теряются и не задваиваются.
+        Твит обновляется по идентификатору-параметру, а не по результату вставки, чтобы планировщик
+        читал одну секцию секционированной таблицы твитов. Тем же запросом блокируется строка автора твита
+        (``lock_authors``) и автору назначается новая версия твитов.
+        """
+        inserted = (
+            insert(Like)
+            .from_select(
+                ["tweet_id", "author_id"],
+                select(literal(tweet_id), literal(author_id)).where(exists().where(Tweet.id == tweet_id)),
+            )
+            .on_conflict_do_nothing()
+            .returning(Like.tweet_id)
+            .cte("inserted")
+        )
+        locked = lock_authors(select(Tweet.author_id).where(Tweet.id == tweet_id)).cte("locked")
+        liked = (
+            update(Tweet)
+            .where(Tweet.id == tweet_id, select(inserted.c.tweet_id).exists(), select(locked.c.id).exists())
+            .values(like_count=Tweet.like_count + 1, version=TWEET_VERSIONS.next_value())
+            .returning(Tweet.author_id)
+            .cte("liked")
+        )
+        query = touch_authors(liked)
+        async with session() as async_session:
+            async with async_session.begin():
+                qs = await async_session.execute(query)
+                added = qs.first() is not None
+        if added:
+            await tweet_invalidator.invalidate(tweet_id)
+        logger.info("добавляем лайк в postgresql", tweet_id=tweet_id, author_id=author_id, added=added)
+        return added
+
+    @exc_handler(ConnectionRefusedError)
+    async def remove_like(self, tweet_id: int, author_id: int) -> bool:
+        """Метод атомарно удаляет лайк автора с твита и уменьшает счётчик лайков.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор автора лайка в СУБД.
+
+        Returns
+        -------
+        bool
+            True, если лайк удалён. False, если лайка не было.
+        """
+        deleted = (
+            delete(Like)
+            .where(Like.tweet_id == tweet_id, Like.author_id == author_id)
+            .returning(Like.tweet_id)
+            .cte("deleted")
+        )
+        locked = lock_authors(select(Tweet.author_id).where(Tweet.id == tweet_id)).cte("locked")
+        unliked = (
+            update(Tweet)
+            .where(Tweet.id == tweet_id, select(deleted.c.tweet_id).exists(), select(locked.c.id).exists())
+            .values(like_count=Tweet.like_count - 1, version=TWEET_VERSIONS.next_value())
+            .returning(Tweet.author_id)
+            .cte("unliked")
+        )
+        query = touch_authors(unliked)
+        async with session() as async_session:
+            async with async_session.begin():
+                qs = await async_session.execute(query)
+                removed = qs.first() is not None
+        if removed:
+            await tweet_invalidator.invalidate(tweet_id)
+        logger.info("удаляем лайк из postgresql", tweet_id=tweet_id, author_id=author_id, removed=removed)
+        return removed
+
+    @exc_handler(ConnectionRefusedError)
+    async def like_exists(self, tweet_id: int, author_id: int) -> t.Optional[bool]:
+        """Метод проверяет, лайкал ли автор твит.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор автора в СУБД.
+
+        Returns
+        -------
+        bool, optional
+            True или False, если твит существует, иначе None.
+        """
+        liked = exists().where(Like.tweet_id == tweet_id, Like.author_id == author_id)
+        query = select(liked.label("liked")).where(Tweet.id == tweet_id)
+        async with session() as async_session:
+            async with async_session.begin():
+                qs = await async_session.execute(query)
+                row = qs.first()
+        return row.liked if row else None
+
+    @exc_handler(ConnectionRefusedError)
+    async def flush_likes(self, added: t.List[t.Tuple[int, int]], removed: t.List[t.Tuple[int, int]]) -> None:
+        """Метод записывает пачку лайков и дизлайков одной транзакцией.
+
+        Parameters
+        ----------
+        added: List[Tuple[int, int]]
+            Пары ``(tweet_id, author_id)`` новых лайков.
+        removed: List[Tuple[int, int]]
+            Пары ``(tweet_id, author_id)`` удалённых лайков.
+
+        Note
+        ----
+        Счётчик каждого твита обновляется один раз на пачку на величину фактически вставленных и удалённых строк.
+        Строки авторов (``lock_authors``), а затем их твитов блокируются в порядке идентификаторов до того, как твитам
+        назначаются новые версии, чтобы сбросы соседних воркеров не взаимоблокировались.
+        """
+        deltas: t.Dict[int, int] = {}
+        async with session() as async_session:
+            async with async_session.begin():
+                if added:
+                    pairs = values(column("tweet_id", Integer), column("author_id", Integer), name="pairs").data(added)
+                    query = (
+                        insert(Like)
+                        .from_select(
+                            ["tweet_id", "author_id"],
+                            select(pairs.c.tweet_id, pairs.c.author_id).join(Tweet, Tweet.id == pairs.c.tweet_id),
+                        )
+                        .on_conflict_do_nothing()
+                        .returning(Like.tweet_id)
+                    )
+                    for tweet_id in (await async_session.execute(query)).scalars():
+                        deltas[tweet_id] = deltas.get(tweet_id, 0) + 1
+                if removed:
+                    query = (
+                        delete(Like)
+                        .where(tuple_(Like.tweet_id, Like.author_id).in_(removed))
+                        .returning(Like.tweet_id)
+                        .execution_options(synchronize_session=False)
+                    )
+                    for tweet_id in (await async_session.execute(query)).scalars():
+                        deltas[tweet_id] = deltas.get(tweet_id, 0) - 1
+                if deltas := {tweet_id: delta for tweet_id, delta in deltas.items() if delta}:
+                    await async_session.execute(lock_authors(select(Tweet.author_id).where(Tweet.id.in_(deltas))))
+                    await async_session.execute(
+                        select(Tweet.id).where(Tweet.id.in_(deltas)).order_by(Tweet.id).with_for_update()
+                    )
+                    counters = values(column("id", Integer), column("delta", Integer), name="counters").data(
+                        list(deltas.items())
+                    )
+                    query = (
+                        update(Tweet)
+                        .where(Tweet.id == counters.c.id)
+                        .values(like_count=Tweet.like_count + counters.c.delta, version=TWEET_VERSIONS.next_value())
+                        .returning(Tweet.author_id)
+                        .execution_options(synchronize_session=False)
+                    )
+                    author_ids = set((await async_session.execute(query)).scalars())
+                    await async_session.execute(
+                        update(Author)
+                        .where(Author.id.in_(author_ids))
+                        .values(tweets_version=AUTHOR_VERSIONS.next_value())
+                    )
+        await tweet_invalidator.invalidate(*deltas)
+        logger.info("пачка лайков записана в postgresql", added=len(added), removed=len(removed), tweets=len(deltas))
+
+    @exc_handler(ConnectionRefusedError)
+    async def notify_events(self, events: t.List[TweetEventSchema]) -> int:
+        """Метод рассылает события твитов слушателям канала ``tweet_stream_channel``.
+
+        Parameters
+        ----------
+        events: List[TweetEventSchema]
+            События без автора твита.
+
+        Returns
+        -------
+        int
+            Количество разосланных событий. События о твитах, которых уже нет в ``tweets``, не рассылаются.
+
+        Note
+        ----
+        Автор твита подставляется в событие тем же запросом ``SELECT pg_notify(...) FROM unnest(...) JOIN tweets``,
+        поэтому сервису не нужно загружать твит, чтобы сообщить о лайке.
+        """
+        rows = (
+            func.unnest(cast([event.json(exclude_none=True) for event in events], ARRAY(Text)))
+            .table_valued("payload")
+            .render_derived("events")
+        )
+        payload = cast(rows.c.payload, JSONB)
+        query = (
+            select(
+                func.pg_notify(
+                    settings.tweet_stream_channel,
+                    cast(payload.op("||")(func.jsonb_build_object("author_id", Tweet.author_id)), Text),
+                )
+            )
+            .select_from(rows)
+            .join(Tweet, Tweet.id == payload["tweet_id"].astext.cast(Integer))
+        )
+        async with session() as async_session:
+            async with async_session.begin():
+                qs = await async_session.execute(query)
+                sent = len(qs.all())
+        log.info(event="разосланы события твитов", count=len(events), sent=sent)
+        return sent
+
+    @exc_handler(ConnectionRefusedError)
+    async def update_like_in_tweet(self, tweet_id: int, likes: t.List[dict]) -> SuccessSchema:
         """Метод перезаписывает лайки в СУБД у конкретного твита.
 
         Parameters
         ----------
         tweet_id: int
             Идентификатор твита в СУБД.
-        likes: dict
-            Обновлённый набор лайков.
+        likes: List[dict]
+            Обновлённый набор лайков в виде словарей ``AuthorLikeSchema``.
 
         Returns
         -------
         SuccessSchema
             Pydantic-схема успешного выполнения операции.
+
+        Note
+        ----
+        Для лайка и дизлайка одним автором используются ``add_like`` и ``remove_like``.
         """
-        query = update(Tweet).where(Tweet.id == tweet_id).values(likes=likes)
+        author_ids = {like["user_id"] for like in likes}
         async with session() as async_session:
             async with async_session.begin():
-                await async_session.execute(query)
-                await async_session.commit()
-                logger.info("обновляем лаек автора в postgresql", tweet_id=tweet_id, likes=likes)
+                await async_session.execute(lock_authors(select(Tweet.author_id).where(Tweet.id == tweet_id)))
+                await async_session.execute(delete(Like).where(Like.tweet_id == tweet_id))
+                if author_ids:
+                    await async_session.execute(
+                        insert(Like).values([dict(tweet_id=tweet_id, author_id=author_id) for author_id in author_ids])
+                    )
+                changed = (
+                    update(Tweet)
+                    .where(Tweet.id == tweet_id)
+                    .values(like_count=len(author_ids), version=TWEET_VERSIONS.next_value())
+                    .returning(Tweet.author_id)
+                    .cte("changed")
+                )
+                await async_session.execute(touch_authors(changed))
+                logger.info("обновляем лайки твита в postgresql", tweet_id=tweet_id, likes=likes)
+        await tweet_invalidator.invalidate(tweet_id)
         return SuccessSchema()
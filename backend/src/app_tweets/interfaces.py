@@ -6,22 +6,36 @@ interfaces.py
 """
 import typing as t
 from abc import ABC, abstractmethod
+from datetime import datetime
 
-from app_tweets.schemas import TweetInSchema, TweetModelSchema
+from app_tweets.schemas import TweetEventSchema, TweetInSchema, TweetModelSchema
 from schemas import SuccessSchema
+from settings import settings
 
 
 class AbstractTweetService(ABC):
     """Абстрактный класс инкапсулирует cruid-методы для твитов в СУБД."""
 
     @abstractmethod
-    def get_list(self, author_id: int) -> t.List[TweetModelSchema]:
-        """Абстрактный метод получения списка твитов для конкретного автора.
+    def get_list(
+        self,
+        author_id: int,
+        limit: int = settings.tweets_page_size,
+        before_id: t.Optional[int] = None,
+        after_id: t.Optional[int] = None,
+    ) -> t.List[TweetModelSchema]:
+        """Абстрактный метод получения страницы твитов конкретного автора от новых к старым.
 
         Parameters
         ----------
         author_id: int
             Идентификатор автора.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Вернуть твиты старше этого.
+        after_id: int, optional
+            Вернуть твиты новее этого.
         """
         ...
 
@@ -30,7 +44,12 @@ class AbstractTweetService(ABC):
         self,
         new_tweet: TweetInSchema,
         author_id: int,
-        attachments: t.Optional[t.List[str]],
+        attachments: t.Optional[t.List[str]] = None,
+        media_ids: t.Optional[t.List[int]] = None,
+        tags: t.Optional[t.List[str]] = None,
+        bucket: t.Optional[datetime] = None,
+        fanout_limit: t.Optional[int] = None,
+        notify: bool = False,
     ):
         """
         Абстрактный метод сохранения твита.
@@ -43,6 +62,110 @@ class AbstractTweetService(ABC):
             Идентификатор автора в СУБД.
         attachments: t.List[str], optional
             Список ссылок на картинки.
+        media_ids: t.List[int], optional
+            Идентификаторы медиа-ресурсов, ссылки на которые подставляются в твит.
+        tags: t.List[str], optional
+            Хэштеги твита.
+        bucket: datetime, optional
+            Начало текущего интервала счётчиков хэштегов.
+        fanout_limit: int, optional
+            Порог раскладки твита по лентам читателей.
+        notify: bool
+            Разослать событие ``tweet`` в поток твитов.
+        """
+        ...
+
+    @abstractmethod
+    async def create_tweets(
+        self,
+        new_tweets: t.List[TweetInSchema],
+        author_id: int,
+        tags: t.Optional[t.List[t.List[str]]] = None,
+        bucket: t.Optional[datetime] = None,
+        fanout_limit: t.Optional[int] = None,
+        notify: bool = False,
+    ) -> t.List[int]:
+        """Абстрактный метод сохраняет пачку твитов автора.
+
+        Parameters
+        ----------
+        new_tweets: List[TweetInSchema]
+            Провалидированные pydantic-схемы новых твитов.
+        author_id: int
+            Идентификатор автора в СУБД.
+        tags: List[List[str]], optional
+            Хэштеги каждого твита в порядке ``new_tweets``.
+        bucket: datetime, optional
+            Начало текущего интервала счётчиков хэштегов.
+        fanout_limit: int, optional
+            Порог раскладки твитов по лентам читателей.
+        notify: bool
+            Разослать событие ``tweet`` о каждом твите.
+
+        Returns
+        -------
+        List[int]
+            Идентификаторы новых твитов в порядке ``new_tweets``.
+        """
+        ...
+
+    @abstractmethod
+    async def get_tag_tweets(
+        self, tag: str, limit: int, before_id: t.Optional[int] = None
+    ) -> t.List[TweetModelSchema]:
+        """Абстрактный метод возвращает страницу твитов с хэштегом от новых к старым.
+
+        Parameters
+        ----------
+        tag: str
+            Хэштег без решётки в нижнем регистре.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Вернуть твиты с идентификатором меньше этого.
+        """
+        ...
+
+    @abstractmethod
+    async def get_trending(self, since: datetime, limit: int) -> t.List[t.Tuple[str, int]]:
+        """Абстрактный метод возвращает самые упоминаемые хэштеги за скользящее окно.
+
+        Parameters
+        ----------
+        since: datetime
+            Начало окна.
+        limit: int
+            Количество хэштегов.
+        """
+        ...
+
+    @abstractmethod
+    async def prune_hashtag_counters(self, before: datetime) -> int:
+        """Абстрактный метод удаляет счётчики интервалов, вышедших из окна популярности.
+
+        Parameters
+        ----------
+        before: datetime
+            Счётчики интервалов раньше этого момента удаляются.
+        """
+        ...
+
+    @abstractmethod
+    async def get_timeline(
+        self, owner_id: int, fanout_limit: int, limit: int, before_id: t.Optional[int] = None
+    ) -> t.List[TweetModelSchema]:
+        """Абстрактный метод возвращает страницу домашней ленты автора от новых твитов к старым.
+
+        Parameters
+        ----------
+        owner_id: int
+            Идентификатор автора, чью ленту читаем.
+        fanout_limit: int
+            Порог числа читателей, выше которого твиты автора читаются при чтении ленты.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Вернуть твиты с идентификатором меньше этого.
         """
         ...
 
@@ -64,6 +187,25 @@ class AbstractTweetService(ABC):
         """
         ...
 
+    @abstractmethod
+    async def search(
+        self, text: str, limit: int, rank: t.Optional[float] = None, before_id: t.Optional[int] = None
+    ) -> t.List[t.Tuple[TweetModelSchema, float]]:
+        """Абстрактный метод ищет твиты по тексту и возвращает страницу, упорядоченную по убыванию релевантности.
+
+        Parameters
+        ----------
+        text: str
+            Поисковый запрос.
+        limit: int
+            Размер страницы.
+        rank: float, optional
+            Релевантность последнего твита предыдущей страницы.
+        before_id: int, optional
+            Идентификатор последнего твита предыдущей страницы.
+        """
+        ...
+
     @abstractmethod
     async def get_tweet_by_id(self, tweet_id: int) -> t.Optional[TweetModelSchema]:
         """Абстрактный метод возвращает твит по идентификатору СУБД.
@@ -81,14 +223,165 @@ class AbstractTweetService(ABC):
         ...
 
     @abstractmethod
-    async def update_like_in_tweet(self, tweet_id: int, likes: dict) -> SuccessSchema:
+    async def get_changes(
+        self, author_id: int, since_version: int, limit: int
+    ) -> t.Tuple[t.List[TweetModelSchema], t.List[int], t.Optional[int]]:
+        """Абстрактный метод возвращает твиты автора, изменённые после версии.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор автора в СУБД.
+        since_version: int
+            Версия, после которой нужны изменения.
+        limit: int
+            Максимальное количество изменений.
+        """
+        ...
+
+    @abstractmethod
+    async def get_tweets_by_ids(self, ids: t.List[int]) -> t.Dict[int, TweetModelSchema]:
+        """Абстрактный метод возвращает твиты по списку идентификаторов СУБД.
+
+        Parameters
+        ----------
+        ids: List[int]
+            Идентификаторы твитов в СУБД.
+
+        Returns
+        -------
+        Dict[int, TweetModelSchema]
+            Pydantic-схемы найденных твитов по идентификаторам.
+        """
+        ...
+
+    @abstractmethod
+    async def get_tweet_version(self, tweet_id: int) -> t.Optional[int]:
+        """Абстрактный метод возвращает версию твита, не загружая сам твит.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        """
+        ...
+
+    @abstractmethod
+    async def get_tweets_version(self, author_id: int) -> t.Optional[int]:
+        """Абстрактный метод возвращает версию твитов автора.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор автора в СУБД.
+        """
+        ...
+
+    @abstractmethod
+    async def archive_tweets(self, deleted_before: datetime, limit: int) -> t.Optional[t.List[int]]:
+        """Абстрактный метод переносит пачку удалённых твитов в архив.
+
+        Parameters
+        ----------
+        deleted_before: datetime
+            Переносятся твиты, удалённые раньше этого момента.
+        limit: int
+            Максимальный размер пачки.
+
+        Returns
+        -------
+        List[int], optional
+            Идентификаторы перенесённых твитов или None, если архивирует другой воркер.
+        """
+        ...
+
+    @abstractmethod
+    async def add_like(self, tweet_id: int, author_id: int) -> bool:
+        """Абстрактный метод атомарно добавляет лайк автора к твиту.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор лайкнувшего автора в СУБД.
+
+        Returns
+        -------
+        bool
+            True, если лайк добавлен.
+        """
+        ...
+
+    @abstractmethod
+    async def remove_like(self, tweet_id: int, author_id: int) -> bool:
+        """Абстрактный метод атомарно удаляет лайк автора с твита.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор автора лайка в СУБД.
+
+        Returns
+        -------
+        bool
+            True, если лайк удалён.
+        """
+        ...
+
+    @abstractmethod
+    async def like_exists(self, tweet_id: int, author_id: int) -> t.Optional[bool]:
+        """Абстрактный метод проверяет, лайкал ли автор твит.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+        author_id: int
+            Идентификатор автора в СУБД.
+
+        Returns
+        -------
+        bool, optional
+            True или False, если твит существует, иначе None.
+        """
+        ...
+
+    @abstractmethod
+    async def flush_likes(self, added: t.List[t.Tuple[int, int]], removed: t.List[t.Tuple[int, int]]) -> None:
+        """Абстрактный метод записывает пачку лайков и дизлайков.
+
+        Parameters
+        ----------
+        added: List[Tuple[int, int]]
+            Пары ``(tweet_id, author_id)`` новых лайков.
+        removed: List[Tuple[int, int]]
+            Пары ``(tweet_id, author_id)`` удалённых лайков.
+        """
+        ...
+
+    @abstractmethod
+    async def notify_events(self, events: t.List[TweetEventSchema]) -> int:
+        """Абстрактный метод рассылает события твитов слушателям потока.
+
+        Parameters
+        ----------
+        events: List[TweetEventSchema]
+            События без автора твита.
+        """
+        ...
+
+    @abstractmethod
+    async def update_like_in_tweet(self, tweet_id: int, likes: t.List[dict]) -> SuccessSchema:
         """Абстрактный метод перезаписывает лайки в СУБД у конкретного твита.
 
         Parameters
         ----------
         tweet_id: int
             Идентификатор твита в СУБД.
-        likes: dict
+        likes: List[dict]
             Обновлённый набор лайков.
         """
         ...
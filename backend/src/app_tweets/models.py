@@ -1,14 +1,32 @@
 """
 models.py
 ---------
-Модуль определяет ORM-модель твитов для SqlAlchemy.
+Модуль определяет ORM-модели твитов, архива удалённых твитов, лайков, домашних лент и хэштегов для SqlAlchemy.
 """
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, Text
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Computed,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Sequence,
+    String,
+    Text,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred, relationship, synonym
 
 from db import Base
 
+SEARCH_CONFIG = "russian"
+HASHTAG_MAX_LENGTH = 100
+TWEET_VERSIONS = Sequence("tweet_versions", metadata=Base.metadata)
+
 
 class Tweet(Base):
     """Модель твита
@@ -23,19 +41,206 @@ class Tweet(Base):
         Идентификатор автора. Обеспечивает связь один-ко-многим между моделями автора и твита.
     author
         Обратная связь с моделью автора. Позволяет ОРМ-модели твита добраться до автора.
-    likes: dict
-        Информация о лайках к этому твиту.
+        Сама по себе не загружается: запрос указывает, какие поля автора ему нужны.
+    likes: List[Like]
+        Лайки к этому твиту.
+    like_count: int
+        Денормализованный счётчик лайков.
     attachments: dict
         Вложения к твиту. Обычно картинки.
     soft_delete: bool
         Флаг мягкого удаления твита из СУБД.
+    deleted_at: datetime, optional
+        Момент мягкого удаления. Через ``archive_after`` секунд после него твит переносится в архив.
+    search_vector: str
+        Вычисляемый в СУБД tsvector текста твита для полнотекстового поиска. По умолчанию не загружается.
+    version: int
+        Версия твита из общей последовательности ``tweet_versions``. Назначается при создании и заново
+        при каждом лайке, дизлайке и удалении, поэтому пара ``(id, version)`` однозначно определяет
+        отображение твита. Версия берётся только под блокировкой строки автора, поэтому версии твитов
+        одного автора идут в порядке фиксации транзакций.
+
+    Note
+    ----
+    Частичный индекс ``(author_id, id) WHERE NOT soft_delete`` обслуживает постраничную выдачу твитов автора
+    по ключу и не содержит удалённых твитов. Запросы должны сравнивать ``soft_delete`` с литералом ``false()``,
+    а не с параметром, иначе общий план подготовленного запроса не сможет использовать индекс.
+    GIN-индекс ``search_vector`` обслуживает полнотекстовый поиск, частичный индекс ``deleted_at`` -
+    выбор удалённых твитов для переноса в архив. Индекс ``(author_id, version)`` обслуживает выборку изменений
+    твитов автора после версии из запроса: опрос без изменений стоит одного чтения индекса.
+
+    Таблицу можно секционировать по диапазонам ``id`` (см. ``app_tweets.partitions``). Модель при этом
+    не меняется, но запросы должны ограничивать ``Tweet.id``, чтобы планировщик отсекал лишние секции.
     """
 
     __tablename__ = "tweets"
+    __table_args__ = (
+        Index("ix_tweets_author_id_id_live", "author_id", "id", postgresql_where=text("NOT soft_delete")),
+        Index("ix_tweets_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_tweets_deleted_at", "deleted_at", postgresql_where=text("soft_delete")),
+        Index("ix_tweets_author_id_version", "author_id", "version"),
+    )
     id = Column(Integer, primary_key=True)
     content = Column(Text, nullable=False)
     author_id = Column(Integer, ForeignKey("authors.id"))
-    author = relationship("Author", back_populates="tweets", lazy="joined")
-    likes = Column(JSONB, default=[])
+    author = relationship("Author", back_populates="tweets", lazy="raise")
+    likes = relationship("Like", lazy="selectin", order_by="Like.author_id", cascade="all, delete-orphan")
+    like_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
     attachments = Column(JSONB, default=[])
     soft_delete = Column(Boolean, default=False)
+    deleted_at = Column(DateTime(timezone=True))
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(f"to_tsvector('{SEARCH_CONFIG}'::regconfig, content)", persisted=True))
+    )
+    version = Column(BigInteger, nullable=False, server_default=TWEET_VERSIONS.next_value())
+
+
+class TweetArchive(Base):
+    """Модель удалённого твита, перенесённого из таблицы ``tweets`` в архив.
+
+    Arguments
+    ---------
+    id: int
+        Идентификатор твита. Совпадает с идентификатором в ``tweets`` до переноса.
+    content: str
+        Текст твита.
+    author_id: int
+        Идентификатор автора.
+    author
+        Связь с моделью автора. Сама по себе не загружается.
+    attachments: list
+        Ссылки на вложения.
+    like_count: int
+        Счётчик лайков на момент переноса.
+    likes: list
+        Лайки на момент переноса в виде словарей ``AuthorLikeSchema``.
+    deleted_at: datetime
+        Момент мягкого удаления.
+    archived_at: datetime
+        Момент переноса в архив.
+    version: int
+        Версия твита на момент переноса.
+
+    Note
+    ----
+    Архив хранит удалённые твиты для юридических запросов и не участвует в лентах, поиске и хэштегах.
+    Индекс ``(author_id, version)`` отдаёт опросу изменений удаления, перенесённые в архив после версии из запроса.
+    """
+
+    __tablename__ = "tweets_archive"
+    __table_args__ = (Index("ix_tweets_archive_author_id_version", "author_id", "version"),)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    content = Column(Text, nullable=False)
+    author_id = Column(Integer, ForeignKey("authors.id"))
+    author = relationship("Author", lazy="raise")
+    attachments = Column(JSONB, default=[])
+    like_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    likes = Column(JSONB, nullable=False, default=[], server_default=text("'[]'::jsonb"))
+    deleted_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    version = Column(BigInteger)
+
+    @property
+    def soft_delete(self) -> bool:
+        return True
+
+
+class Like(Base):
+    """Модель лайка.
+
+    Arguments
+    ---------
+    tweet_id: int
+        Идентификатор отлайканного твита.
+    author_id: int
+        Идентификатор лайкнувшего автора.
+    author
+        Связь с моделью лайкнувшего автора. Сама по себе не загружается.
+    user_id: int
+        Синоним ``author_id`` для схемы ``AuthorLikeSchema``.
+
+    Note
+    ----
+    Первичный ключ ``(tweet_id, author_id)`` не даёт лайкнуть твит дважды даже при конкурентных запросах.
+    """
+
+    __tablename__ = "likes"
+    __table_args__ = (Index("ix_likes_author_id", "author_id"),)
+    tweet_id = Column(Integer, ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("authors.id", ondelete="CASCADE"), primary_key=True)
+    author = relationship("Author", lazy="raise")
+    user_id = synonym("author_id")
+
+    @property
+    def name(self) -> str:
+        return self.author.name
+
+
+class Timeline(Base):
+    """Модель записи домашней ленты автора.
+
+    Arguments
+    ---------
+    owner_id: int
+        Идентификатор автора, чья это лента.
+    tweet_id: int
+        Идентификатор твита в ленте.
+
+    Note
+    ----
+    Первичный ключ ``(owner_id, tweet_id)`` одновременно служит индексом для постраничного чтения ленты
+    от новых твитов к старым. Индекс ``tweet_id`` нужен каскадному удалению твита: без него удаление каждого
+    твита читает всю таблицу лент.
+    """
+
+    __tablename__ = "timelines"
+    __table_args__ = (Index("ix_timelines_tweet_id", "tweet_id"),)
+    owner_id = Column(Integer, ForeignKey("authors.id", ondelete="CASCADE"), primary_key=True)
+    tweet_id = Column(Integer, ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
+
+
+class Hashtag(Base):
+    """Модель записи обратного индекса хэштегов.
+
+    Arguments
+    ---------
+    tag: str
+        Хэштег без решётки в нижнем регистре.
+    tweet_id: int
+        Идентификатор твита с этим хэштегом.
+
+    Note
+    ----
+    Первичный ключ ``(tag, tweet_id)`` служит индексом для постраничного чтения твитов хэштега
+    от новых к старым, индекс ``tweet_id`` - для каскадного удаления твита.
+    """
+
+    __tablename__ = "hashtags"
+    __table_args__ = (Index("ix_hashtags_tweet_id", "tweet_id"),)
+    tag = Column(String(HASHTAG_MAX_LENGTH), primary_key=True)
+    tweet_id = Column(Integer, ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True)
+
+
+class HashtagCounter(Base):
+    """Модель счётчика упоминаний хэштега за интервал времени.
+
+    Arguments
+    ---------
+    tag: str
+        Хэштег без решётки в нижнем регистре.
+    bucket: datetime
+        Начало интервала длиной ``trending_bucket`` секунд.
+    count: int
+        Число новых твитов с хэштегом за интервал.
+
+    Note
+    ----
+    Счётчики увеличиваются при сохранении твита. Популярные хэштеги считаются суммой счётчиков интервалов,
+    попавших в скользящее окно, по индексу ``bucket`` без чтения таблицы твитов.
+    """
+
+    __tablename__ = "hashtag_counters"
+    __table_args__ = (Index("ix_hashtag_counters_bucket", "bucket"),)
+    tag = Column(String(HASHTAG_MAX_LENGTH), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    count = Column(Integer, nullable=False, default=0, server_default=text("0"))
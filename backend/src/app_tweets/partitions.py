@@ -0,0 +1,251 @@
+"""
+partitions.py
+-------------
+
+Модуль реализует необязательное секционирование таблицы твитов по диапазонам идентификаторов.
+
+Note
+----
+    Таблица ``tweets`` превращается в секционированную ``PARTITION BY RANGE (id)``: каждая секция хранит
+    ``tweets_partition_size`` идентификаторов подряд и называется ``tweets_p<начало диапазона>``. Существующая
+    таблица не копируется, а присоединяется секцией ``tweets_p0`` со всеми строками до текущей границы,
+    поэтому преобразование занимает одно чтение таблицы под блокировкой вместо перезаписи.
+
+    Секционирование по идентификатору выбрано потому, что первичный ключ и внешние ключи лайков, лент
+    и хэштегов ссылаются на ``tweets.id``, а ключ секционирования обязан входить в первичный ключ. Запросы
+    твита по идентификатору читают одну секцию, постраничные выдачи от новых к старым - только новые секции,
+    а вакуум и перестроение индексов работают с секциями по отдельности.
+
+    Секции создаются заранее на ``tweets_partitions_ahead`` диапазонов вперёд от текущего значения
+    последовательности идентификаторов (``ensure_partitions``). Секции по умолчанию нет: твит, для которого
+    не нашлось секции, не сохранится, поэтому команду ``python -m maintenance create-partitions``
+    нужно запускать по расписанию.
+
+    Функции принимают синхронное подключение SqlAlchemy и выполняются в его транзакции, чтобы их можно было
+    вызывать и из миграций Alembic, и из асинхронного кода через ``AsyncConnection.run_sync``.
+"""
+import re
+import typing as t
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+TABLE = "tweets"
+LEGACY_PARTITION = f"{TABLE}_p0"
+BOUNDS_RE = re.compile(r"FROM \((?P<lower>[^)]+)\) TO \((?P<upper>[^)]+)\)")
+
+Partition = t.Tuple[str, t.Optional[int], int]
+
+
+def _bound(value: str) -> t.Optional[int]:
+    value = value.strip("'")
+    return None if value == "MINVALUE" else int(value)
+
+
+def _partition_name(start: int) -> str:
+    return f"{TABLE}_p{start}"
+
+
+def _index_definitions(conn: Connection, table: str) -> t.List[t.Tuple[str, str]]:
+    """Функция возвращает имена и определения индексов таблицы, кроме индекса первичного ключа."""
+    qs = conn.execute(
+        text(
+            "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index AS i "
+            "JOIN pg_class AS c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = CAST(:table AS regclass) AND NOT i.indisprimary ORDER BY c.relname"
+        ),
+        dict(table=table),
+    )
+    return [(name, definition.replace(" ON ONLY ", " ON ")) for name, definition in qs]
+
+
+def _foreign_keys(conn: Connection, referenced: bool) -> t.List[t.Tuple[str, str, str]]:
+    """Функция возвращает внешние ключи таблицы твитов: собственные или ссылающиеся на неё.
+
+    Returns
+    -------
+    List[Tuple[str, str, str]]
+        Таблица, имя и определение каждого внешнего ключа.
+    """
+    column = "confrelid" if referenced else "conrelid"
+    qs = conn.execute(
+        text(
+            "SELECT CAST(conrelid AS regclass)::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            f"WHERE contype = 'f' AND conparentid = 0 AND {column} = CAST(:table AS regclass) ORDER BY conname"
+        ),
+        dict(table=TABLE),
+    )
+    return [tuple(row) for row in qs]
+
+
+def _sequence(conn: Connection) -> str:
+    """Функция возвращает имя последовательности идентификаторов твитов."""
+    return conn.scalar(text("SELECT pg_get_serial_sequence(:table, 'id')"), dict(table=TABLE))
+
+
+def is_partitioned(conn: Connection) -> bool:
+    """Функция проверяет, секционирована ли таблица твитов."""
+    return conn.scalar(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = CAST(:table AS regclass)"), dict(table=TABLE)
+    )
+
+
+def list_partitions(conn: Connection) -> t.List[Partition]:
+    """Функция возвращает секции таблицы твитов.
+
+    Returns
+    -------
+    List[Tuple[str, int | None, int]]
+        Имя, нижняя (``None`` - без ограничения) и верхняя граница идентификаторов каждой секции
+        в порядке возрастания.
+    """
+    qs = conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits AS i "
+            "JOIN pg_class AS c ON c.oid = i.inhrelid WHERE i.inhparent = CAST(:table AS regclass)"
+        ),
+        dict(table=TABLE),
+    )
+    partitions = []
+    for name, bounds in qs:
+        match = BOUNDS_RE.search(bounds)
+        partitions.append((name, _bound(match["lower"]), _bound(match["upper"])))
+    return sorted(partitions, key=lambda partition: partition[2])
+
+
+def ensure_partitions(conn: Connection, size: int, ahead: int) -> t.List[str]:
+    """Функция заранее создаёт секции твитов на ``ahead`` диапазонов вперёд.
+
+    Parameters
+    ----------
+    conn: Connection
+        Подключение к СУБД.
+    size: int
+        Число идентификаторов в секции.
+    ahead: int
+        Сколько диапазонов после текущего значения последовательности идентификаторов должно быть покрыто секциями.
+
+    Returns
+    -------
+    List[str]
+        Имена созданных секций.
+    """
+    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    position = conn.scalar(
+        text("SELECT coalesce(pg_sequence_last_value(CAST(:sequence AS regclass)), 0)"), dict(sequence=_sequence(conn))
+    )
+    upper = list_partitions(conn)[-1][2]
+    created = []
+    while upper < position + ahead * size:
+        start, upper = upper, upper + size
+        name = _partition_name(start)
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ({start}) TO ({upper})"))
+        created.append(name)
+    return created
+
+
+def partition_tweets(conn: Connection, size: int, ahead: int) -> t.List[str]:
+    """Функция преобразует обычную таблицу твитов в секционированную по диапазонам идентификаторов.
+
+    Parameters
+    ----------
+    conn: Connection
+        Подключение к СУБД.
+    size: int
+        Число идентификаторов в секции.
+    ahead: int
+        Сколько диапазонов вперёд покрыть секциями сразу.
+
+    Returns
+    -------
+    List[str]
+        Имена секций: существующая таблица и созданные заранее.
+
+    Note
+    ----
+        Индексы и внешние ключи воспроизводятся по каталогу СУБД, а не по моделям, поэтому функция
+        подходит для любой ревизии схемы. Индексы существующей таблицы не перестраиваются,
+        а присоединяются к индексам секционированной.
+    """
+    conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+    sequence = _sequence(conn)
+    boundary = (conn.scalar(text(f"SELECT coalesce(max(id), 0) FROM {TABLE}")) // size + 1) * size
+    indexes = _index_definitions(conn, TABLE)
+    own_keys = _foreign_keys(conn, referenced=False)
+    referencing_keys = _foreign_keys(conn, referenced=True)
+    for table, name, _ in referencing_keys:
+        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_PARTITION}"))
+    conn.execute(text(f"ALTER TABLE {LEGACY_PARTITION} RENAME CONSTRAINT {TABLE}_pkey TO {LEGACY_PARTITION}_pkey"))
+    for _, name, _ in own_keys:
+        new_name = name.replace(TABLE, LEGACY_PARTITION, 1)
+        conn.execute(text(f"ALTER TABLE {LEGACY_PARTITION} RENAME CONSTRAINT {name} TO {new_name}"))
+    for name, _ in indexes:
+        conn.execute(text(f"ALTER INDEX {name} RENAME TO {name.replace(TABLE, LEGACY_PARTITION, 1)}"))
+    # проверочное ограничение совпадает с границами секции, и присоединение обходится без второго чтения таблицы
+    conn.execute(
+        text(f"ALTER TABLE {LEGACY_PARTITION} ADD CONSTRAINT {LEGACY_PARTITION}_bound CHECK (id < {boundary})")
+    )
+
+    conn.execute(
+        text(
+            f"CREATE TABLE {TABLE} (LIKE {LEGACY_PARTITION} INCLUDING DEFAULTS INCLUDING GENERATED) "
+            "PARTITION BY RANGE (id)"
+        )
+    )
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)"))
+    conn.execute(
+        text(f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY_PARTITION} FOR VALUES FROM (MINVALUE) TO ({boundary})")
+    )
+    conn.execute(text(f"ALTER TABLE {LEGACY_PARTITION} DROP CONSTRAINT {LEGACY_PARTITION}_bound"))
+    conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+    for _, definition in indexes:
+        conn.execute(text(definition))
+    for _, name, definition in own_keys:
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}"))
+    for table, name, definition in referencing_keys:
+        conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"))
+    return [LEGACY_PARTITION, *ensure_partitions(conn, size, ahead)]
+
+
+def unpartition_tweets(conn: Connection) -> None:
+    """Функция преобразует секционированную таблицу твитов обратно в обычную.
+
+    Note
+    ----
+        В отличие от секционирования, обратное преобразование копирует все строки в новую таблицу
+        и строит индексы заново.
+    """
+    conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+    sequence = _sequence(conn)
+    indexes = _index_definitions(conn, TABLE)
+    own_keys = _foreign_keys(conn, referenced=False)
+    referencing_keys = _foreign_keys(conn, referenced=True)
+    for table, name, _ in referencing_keys:
+        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+
+    partitioned = f"{TABLE}_partitioned"
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {partitioned}"))
+    conn.execute(text(f"CREATE TABLE {TABLE} (LIKE {partitioned} INCLUDING DEFAULTS INCLUDING GENERATED)"))
+    columns = ", ".join(
+        conn.execute(
+            text(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :table AND is_generated = 'NEVER' "
+                "ORDER BY ordinal_position"
+            ),
+            dict(table=partitioned),
+        ).scalars()
+    )
+    conn.execute(text(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {partitioned}"))
+    conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+    conn.execute(text(f"DROP TABLE {partitioned}"))
+
+    conn.execute(text(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)"))
+    for _, definition in indexes:
+        conn.execute(text(definition))
+    for _, name, definition in own_keys:
+        conn.execute(text(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}"))
+    for table, name, definition in referencing_keys:
+        conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"))
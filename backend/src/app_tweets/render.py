@@ -0,0 +1,86 @@
+"""
+render.py
+---------
+
+Модуль реализует кэш отрисованных в JSON твитов и сборку из них ответов со списками твитов.
+
+Note
+----
+    Твит меняется только лайками, дизлайками и удалением, и каждое такое изменение назначает ему новую версию.
+    Поэтому JSON твита однозначно определяется парой ``(id, version)`` и кэшируется по ней без инвалидации:
+    устаревшие версии просто вытесняются. Ответ со списком твитов склеивается из готовых фрагментов,
+    и повторная отрисовка твита, который уже показывали, сводится к поиску в словаре.
+
+Attributes
+----------
+tweet_fragments: TTLCache
+    Кэш отрисованных твитов воркера.
+"""
+import typing as t
+
+import orjson
+from fastapi import Response, status
+
+from app_tweets.schemas import TweetListOutSchema, TweetSchema
+from cache import TTLCache
+from settings import settings
+
+tweet_fragments = TTLCache(
+    name="tweet_fragment", maxsize=settings.tweet_fragment_cache_size, ttl=settings.tweet_fragment_cache_ttl
+)
+
+
+def render_tweet(tweet: TweetSchema) -> bytes:
+    """Функция возвращает JSON твита из кэша или отрисовывает и кэширует его.
+
+    Parameters
+    ----------
+    tweet: TweetSchema
+        Pydantic-схема твита. Твит без версии отрисовывается без кэша.
+
+    Returns
+    -------
+    bytes
+        JSON твита.
+    """
+    if tweet.version is None:
+        return orjson.dumps(tweet.dict(by_alias=True))
+    key = (tweet.id, tweet.version)
+    if (fragment := tweet_fragments.get(key)) is None:
+        fragment = orjson.dumps(tweet.dict(by_alias=True))
+        tweet_fragments.set(key, fragment)
+    return fragment
+
+
+def render_tweet_list(result: TweetListOutSchema) -> bytes:
+    """Функция склеивает JSON схемы списка твитов из отрисованных твитов.
+
+    Returns
+    -------
+    bytes
+        То же, что ``orjson.dumps(result.dict())``.
+    """
+    tweets = b"null" if result.tweets is None else b"[" + b",".join(map(render_tweet, result.tweets)) + b"]"
+    return b'{"result":' + orjson.dumps(result.result) + b',"tweets":' + tweets + b"}"
+
+
+def tweet_list_response(
+    result: TweetListOutSchema, status_code: int = status.HTTP_200_OK, headers: t.Optional[t.Dict[str, str]] = None
+) -> Response:
+    """Функция возвращает готовый ответ со списком твитов, склеенный из кэша отрисованных твитов.
+
+    Parameters
+    ----------
+    result: TweetListOutSchema
+        Pydantic-схема списка твитов.
+    status_code: int
+        HTTP-статус.
+    headers: Dict[str, str], optional
+        Заголовки ответа.
+
+    Returns
+    -------
+    Response
+        Готовый ответ.
+    """
+    return Response(render_tweet_list(result), status_code=status_code, headers=headers, media_type="application/json")
@@ -8,11 +8,11 @@ Note
 -----
     Большинство схем поддерживают загрузку из орм-моделей.
 """
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
-from app_users.schemas import AuthorBaseSchema, AuthorLikeSchema, AuthorModelSchema
+from app_users.schemas import AuthorBaseSchema, AuthorLikeSchema
 
 
 class TweetModelSchema(BaseModel):
@@ -32,17 +32,20 @@ class TweetModelSchema(BaseModel):
         Список авторов, отлайкавших этот твит.
     attachments: List[int]
         Список идентификаторов медиа-ресурсов.
-    author: AuthorModelSchema.
-        Схема ОРМ модели Автора твита.
+    author: AuthorBaseSchema
+        Идентификатор и имя автора твита. Граф подписок и секреты автора в схему твита не попадают.
+    version: int, optional
+        Версия твита.
     """
 
     id: int
     content: str
     author_id: int
     soft_delete: bool
-    likes: List[dict] = None
+    likes: List[AuthorLikeSchema] = None
     attachments: List[str] = None
-    author: AuthorModelSchema = None
+    author: AuthorBaseSchema = None
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -63,6 +66,8 @@ class TweetSchema(BaseModel):
         Автор твита.
     likes: List[LikeAuthorSchema], optional
         Список авторов, отлайкавших этот твит.
+    version: int, optional
+        Версия твита для кэша отрисованных твитов. В тело ответа не попадает.
     """
 
     id: int
@@ -70,6 +75,7 @@ class TweetSchema(BaseModel):
     attachments: Optional[List[str]]
     author: AuthorBaseSchema
     likes: Optional[List[AuthorLikeSchema]]
+    version: Optional[int] = Field(default=None, exclude=True)
 
     class Config:
         orm_mode = True
@@ -103,11 +109,13 @@ class TweetListOutSchema(BaseModel):
         Флаг успешного выполнения.
     tweets: List[TweetSchema], optional
         Список твитов автора.
-
+    next_cursor: str, optional
+        Курсор следующей страницы. В тело ответа не попадает, фронтенд получает его в заголовке ``X-Next-Cursor``.
     """
 
     result: bool = True
     tweets: Optional[List[TweetSchema]]
+    next_cursor: Optional[str] = Field(default=None, exclude=True)
 
     class Config:
         orm_mode = True
@@ -150,3 +158,174 @@ class TweetOutSchema(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class TweetBatchItemSchema(BaseModel):
+    """Схема результата сохранения одного твита из пачки.
+
+    Parameters
+    ----------
+    result: bool
+        Флаг успешного сохранения.
+    tweet_id: int, optional
+        Идентификатор нового твита в СУБД.
+    error_type: str, optional
+        Тип ошибки.
+    error_message: str, optional
+        Описание ошибки.
+    """
+
+    result: bool
+    tweet_id: Optional[int]
+    error_type: Optional[str]
+    error_message: Optional[str]
+
+
+class TweetBatchOutSchema(BaseModel):
+    """Схема результата пакетной загрузки твитов для фронтенда.
+
+    Parameters
+    ----------
+    result: bool
+        Флаг выполнения запроса.
+    tweets: List[TweetBatchItemSchema]
+        Результаты в порядке твитов в запросе.
+    """
+
+    result: bool = True
+    tweets: List[TweetBatchItemSchema]
+
+
+class TweetItemSchema(BaseModel):
+    """Схема одного твита из выборки по списку идентификаторов.
+
+    Parameters
+    ----------
+    id: int
+        Запрошенный идентификатор.
+    result: bool
+        Флаг: твит найден.
+    tweet: TweetModelSchema, optional
+        Твит.
+    error_type: str, optional
+        Тип ошибки.
+    error_message: str, optional
+        Описание ошибки.
+    """
+
+    id: int
+    result: bool
+    tweet: Optional[TweetModelSchema]
+    error_type: Optional[str]
+    error_message: Optional[str]
+
+
+class TweetItemsOutSchema(BaseModel):
+    """Схема выборки твитов по списку идентификаторов для фронтенда.
+
+    Parameters
+    ----------
+    result: bool
+        Флаг выполнения запроса.
+    tweets: List[TweetItemSchema]
+        Твиты в порядке идентификаторов в запросе.
+    """
+
+    result: bool = True
+    tweets: List[TweetItemSchema]
+
+
+class TweetLikesSchema(BaseModel):
+    """Схема изменения лайков твита, который уже есть у фронтенда.
+
+    Parameters
+    ----------
+    id: int
+        Идентификатор твита.
+    like_count: int
+        Текущее число лайков.
+    likes: List[AuthorLikeSchema]
+        Текущие лайки.
+    """
+
+    id: int
+    like_count: int
+    likes: List[AuthorLikeSchema]
+
+
+class TweetChangesOutSchema(BaseModel):
+    """Схема изменений твитов автора после версии из запроса для фронтенда.
+
+    Parameters
+    ----------
+    result: bool
+        Флаг выполнения запроса.
+    version: int
+        Версия, с которой нужно запросить следующие изменения.
+    tweets: List[TweetSchema]
+        Новые твиты от новых к старым.
+    likes: List[TweetLikesSchema]
+        Твиты, у которых изменились лайки.
+    deleted: List[int]
+        Идентификаторы удалённых твитов.
+    """
+
+    result: bool = True
+    version: int
+    tweets: List[TweetSchema]
+    likes: List[TweetLikesSchema]
+    deleted: List[int]
+
+
+class HashtagSchema(BaseModel):
+    """Схема популярного хэштега.
+
+    Parameters
+    ----------
+    tag: str
+        Хэштег без решётки.
+    count: int
+        Число твитов с хэштегом за окно популярности.
+    """
+
+    tag: str = Field(example="импортозамещение")
+    count: int
+
+
+class TrendingOutSchema(BaseModel):
+    """Схема популярных хэштегов для фронтенда.
+
+    Parameters
+    ----------
+    result: bool
+        Флаг выполнения запроса.
+    tags: List[HashtagSchema]
+        Хэштеги по убыванию популярности.
+    """
+
+    result: bool = True
+    tags: List[HashtagSchema]
+
+
+class TweetEventSchema(BaseModel):
+    """Схема события потока твитов.
+
+    Parameters
+    ----------
+    event: str
+        Вид события: ``tweet`` - новый твит, ``like``, ``unlike`` или ``delete``.
+    tweet_id: int
+        Идентификатор твита.
+    author_id: int, optional
+        Идентификатор автора твита. Подставляется СУБД при отправке события.
+    user_id: int, optional
+        Идентификатор лайкнувшего автора для ``like`` и ``unlike``.
+    name: str, optional
+        Имя лайкнувшего автора для ``like`` и ``unlike``.
+    """
+
+    event: Literal["tweet", "like", "unlike", "delete"]
+    tweet_id: int
+    author_id: Optional[int] = None
+    user_id: Optional[int] = None
+    name: Optional[str] = None
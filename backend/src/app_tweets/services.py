@@ -4,24 +4,71 @@ services.py
 
 Модуль определяет бизнес-логику приложения app_tweets.
 """
+import json
+import re
+import time
+import typing as t
+from datetime import datetime, timezone
+
 from pydantic import ValidationError
 
-from app_media.services import MediaService
+from app_tweets.buffers import like_buffer
 from app_tweets.db_services import TweetDbService as TweetTransportService
+from app_tweets.models import HASHTAG_MAX_LENGTH
 from app_tweets.schemas import (
+    TrendingOutSchema,
+    TweetBatchItemSchema,
+    TweetBatchOutSchema,
+    TweetChangesOutSchema,
+    TweetEventSchema,
     TweetInSchema,
+    TweetItemSchema,
+    TweetItemsOutSchema,
+    TweetLikesSchema,
     TweetListOutSchema,
     TweetModelOutSchema,
     TweetOutSchema,
 )
-from app_users.schemas import AuthorLikeSchema
+from app_tweets.stream import TweetStreamSubscriber, tweet_stream
 from app_users.services import AuthorService
-from exceptions import BackendException, ErrorsList
+from exceptions import BackendException, ErrorsList, ServiceUnavailableException
 from log_fab import get_logger
+from pagination import (
+    decode_cursor,
+    decode_rank_cursor,
+    encode_rank_cursor,
+    next_cursor,
+    parse_ids,
+)
 from schemas import SuccessSchema
+from settings import settings
 
 logger = get_logger()
 
+HASHTAG_RE = re.compile(r"(?<![\w#])#(\w+)")
+
+
+def extract_hashtags(text: str) -> t.List[str]:
+    """Функция извлекает хэштеги из текста твита.
+
+    Parameters
+    ----------
+    text: str
+        Текст твита.
+
+    Returns
+    -------
+    List[str]
+        Уникальные хэштеги без решётки в нижнем регистре в порядке появления в тексте.
+    """
+    tags = (tag.lower() for tag in HASHTAG_RE.findall(text))
+    return list(dict.fromkeys(tag for tag in tags if len(tag) <= HASHTAG_MAX_LENGTH))
+
+
+def normalize_hashtag(tag: str) -> str:
+    """Функция приводит хэштег из запроса к виду, в котором он хранится в индексе."""
+    return tag.lstrip("#").lower()
+
 
 class TweetService:
     """
@@ -42,14 +89,29 @@ class TweetService:
         self.service = TweetTransportService()
         self.author_service = AuthorService()
 
-    async def get_list(self, api_key: str) -> TweetListOutSchema:
+    async def get_list(
+        self,
+        api_key: str,
+        limit: int = settings.tweets_page_size,
+        before_id: t.Optional[int] = None,
+        after_id: t.Optional[int] = None,
+        cursor: t.Optional[str] = None,
+    ) -> TweetListOutSchema:
         """
-        Метод возвращает список твитов пользователя.
+        Метод возвращает страницу твитов пользователя от новых к старым.
 
         Parameters
         ----------
         api_key: str
             Уникальный идентификатор фронтенда.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Вернуть твиты старше этого.
+        after_id: int, optional
+            Вернуть твиты новее этого.
+        cursor: str, optional
+            Курсор из предыдущей страницы. Если передан, заменяет ``before_id`` и ``after_id``.
 
         Returns
         -------
@@ -58,10 +120,16 @@ class TweetService:
         ErrorSchema
             Pydantic-схема ошибки выполнения.
         """
-        author = await self.author_service.get_author(api_key=api_key)
-        tweets = await self.service.get_list(author_id=author.user.id)
+        if cursor:
+            before_id, after_id = decode_cursor(cursor)
+        author = await self.author_service.get_principal(api_key)
+        tweets = await self.service.get_list(author_id=author.id, limit=limit, before_id=before_id, after_id=after_id)
         try:
-            result = TweetListOutSchema(result=True, tweets=tweets)
+            result = TweetListOutSchema(
+                result=True,
+                tweets=tweets,
+                next_cursor=next_cursor([tweet.id for tweet in tweets], limit, after_id=after_id),
+            )
         except ValidationError as e:
             logger.exception(event="ошибка преобразования в схему", exc_info=e)
             raise BackendException(**ErrorsList.serialize_error)
@@ -69,6 +137,156 @@ class TweetService:
             logger.info(event="успешное преобразование списка твитов в схему", result=result.result, count=len(tweets))
             return result
 
+    async def get_changes(
+        self,
+        api_key: str,
+        since_version: int,
+        since_id: t.Optional[int] = None,
+        limit: int = settings.tweets_page_size,
+    ) -> t.Optional[TweetChangesOutSchema]:
+        """
+        Метод возвращает изменения твитов пользователя после версии: новые твиты, лайки и удаления.
+
+        Parameters
+        ----------
+        api_key: str
+            Уникальный идентификатор фронтенда.
+        since_version: int
+            Версия из заголовка ``X-Changes-Version`` предыдущего ответа.
+        since_id: int, optional
+            Наибольший идентификатор твита, который уже есть у фронтенда. Изменённые твиты до него включительно
+            отдаются только лайками. Если не передан, все изменённые твиты отдаются целиком.
+        limit: int
+            Максимальное количество изменений. Если изменений больше, следующие отдаются по новой версии.
+
+        Returns
+        -------
+        TweetChangesOutSchema, optional
+            Pydantic-схема изменений или None, если изменений нет.
+        """
+        author = await self.author_service.get_principal(api_key)
+        tweets, deleted, version = await self.service.get_changes(author.id, since_version, limit)
+        if version is None:
+            logger.info(event="твиты не изменились", since_version=since_version)
+            return None
+        new = [tweet for tweet in tweets if since_id is None or tweet.id > since_id]
+        liked = [tweet for tweet in tweets if since_id is not None and tweet.id <= since_id]
+        result = TweetChangesOutSchema(
+            result=True,
+            version=version,
+            tweets=sorted(new, key=lambda tweet: tweet.id, reverse=True),
+            likes=[
+                TweetLikesSchema(id=tweet.id, like_count=len(tweet.likes or []), likes=tweet.likes or [])
+                for tweet in liked
+            ],
+            deleted=deleted,
+        )
+        logger.info(event="изменения твитов", version=version, new=len(new), liked=len(liked), deleted=len(deleted))
+        return result
+
+    async def get_list_version(self, api_key: str) -> t.Optional[int]:
+        """
+        Метод возвращает версию твитов пользователя для валидатора ``ETag`` списка его твитов.
+
+        Parameters
+        ----------
+        api_key: str
+            Уникальный идентификатор фронтенда.
+
+        Returns
+        -------
+        int, optional
+            Версия твитов автора.
+        """
+        author = await self.author_service.get_principal(api_key)
+        return await self.service.get_tweets_version(author_id=author.id)
+
+    async def get_timeline(self, api_key: str, limit: int, before_id: t.Optional[int] = None) -> TweetListOutSchema:
+        """
+        Метод возвращает домашнюю ленту пользователя: его твиты и твиты авторов, которых он читает.
+
+        Parameters
+        ----------
+        api_key: str
+            Уникальный идентификатор фронтенда.
+        limit: int
+            Размер страницы.
+        before_id: int, optional
+            Идентификатор последнего твита предыдущей страницы.
+
+        Returns
+        -------
+        TweetListOutSchema
+            Pydantic-схема списка твитов для фронтенда.
+        """
+        author = await self.author_service.get_principal(api_key)
+        tweets = await self.service.get_timeline(
+            owner_id=author.id, fanout_limit=settings.timeline_fanout_limit, limit=limit, before_id=before_id
+        )
+        try:
+            result = TweetListOutSchema(result=True, tweets=tweets)
+        except ValidationError as e:
+            logger.exception(event="ошибка преобразования в схему", exc_info=e)
+            raise BackendException(**ErrorsList.serialize_error)
+        else:
+            logger.info(event="успешное преобразование ленты в схему", result=result.result, count=len(tweets))
+            return result
+
+    async def search(self, text: str, limit: int, cursor: t.Optional[str] = None) -> TweetListOutSchema:
+        """
+        Метод ищет твиты по тексту.
+
+        Parameters
+        ----------
+        text: str
+            Поисковый запрос.
+        limit: int
+            Размер страницы.
+        cursor: str, optional
+            Курсор из предыдущей страницы.
+
+        Returns
+        -------
+        TweetListOutSchema
+            Pydantic-схема списка найденных твитов от более релевантных к менее релевантным.
+        """
+        rank, before_id = decode_rank_cursor(cursor) if cursor else (None, None)
+        found = await self.service.search(text, limit=limit, rank=rank, before_id=before_id)
+        try:
+            result = TweetListOutSchema(
+                result=True,
+                tweets=[tweet for tweet, _ in found],
+                next_cursor=encode_rank_cursor(found[-1][1], found[-1][0].id) if len(found) == limit else None,
+            )
+        except ValidationError as e:
+            logger.exception(event="ошибка преобразования в схему", exc_info=e)
+            raise BackendException(**ErrorsList.serialize_error)
+        else:
+            logger.info(event="успешное преобразование результатов поиска в схему", count=len(found))
+            return result
+
+    async def open_stream(self, api_key: str) -> TweetStreamSubscriber:
+        """
+        Метод подписывает пользователя на события твитов: его собственных и авторов, которых он читает.
+
+        Parameters
+        ----------
+        api_key: str
+            Уникальный идентификатор фронтенда.
+
+        Returns
+        -------
+        TweetStreamSubscriber
+            Очередь кадров потока.
+        """
+        if not settings.tweet_stream_enabled:
+            logger.warning(event="запрос отключённого потока событий твитов")
+            raise ServiceUnavailableException(**ErrorsList.stream_disabled)
+        author = await self.author_service.get_principal(api_key)
+        author_ids = [author.id, *await self.author_service.get_followee_ids(author.id)]
+        logger.info(event="подписка на поток событий твитов", author_id=author.id, authors=len(author_ids))
+        return tweet_stream.subscribe(author_ids)
+
     async def get_tweet(self, tweet_id: int) -> TweetModelOutSchema:
         """
         Метод возвращает твит пользователя по идентификатору в СУБД.
@@ -88,6 +306,51 @@ class TweetService:
         logger.warning(event="запрос твита с несуществующим id", tweet_id=tweet_id)
         raise BackendException(**ErrorsList.tweet_not_exists)
 
+    async def get_tweets(self, ids: str) -> TweetItemsOutSchema:
+        """
+        Метод возвращает твиты по списку идентификаторов.
+
+        Parameters
+        ----------
+        ids: str
+            Идентификаторы твитов через запятую, не больше ``multi_get_max``.
+
+        Returns
+        -------
+        TweetItemsOutSchema
+            Pydantic-схема с результатом по каждому идентификатору в порядке запроса.
+
+        Note
+        ----
+        Ненайденный твит не мешает выдаче остальных: он получает свою ошибку в ответе.
+        """
+        tweet_ids = parse_ids(ids)
+        tweets = await self.service.get_tweets_by_ids(tweet_ids)
+        items = [
+            TweetItemSchema(id=tweet_id, result=True, tweet=tweets[tweet_id])
+            if tweet_id in tweets
+            else TweetItemSchema(id=tweet_id, result=False, **ErrorsList.tweet_not_exists)
+            for tweet_id in tweet_ids
+        ]
+        logger.info(event="запрос твитов по списку", count=len(tweet_ids), found=len(tweets))
+        return TweetItemsOutSchema(result=True, tweets=items)
+
+    async def get_tweet_version(self, tweet_id: int) -> t.Optional[int]:
+        """
+        Метод возвращает версию твита для валидатора ``ETag``, не загружая сам твит.
+
+        Parameters
+        ----------
+        tweet_id: int
+            Идентификатор твита в СУБД.
+
+        Returns
+        -------
+        int, optional
+            Версия твита или None, если твита нет.
+        """
+        return await self.service.get_tweet_version(tweet_id=tweet_id)
+
     async def create_tweet(self, new_tweet: TweetInSchema, api_key: str) -> TweetOutSchema:
         """
         Метод добавляет твит автора в СУБД.
@@ -103,11 +366,24 @@ class TweetService:
         -------
         TweetOutSchema
             Pydantic-схема вновь созданного твита для фронтенда.
+
+        Note
+        ----
+        Раскладка по лентам, хэштеги, их счётчики и событие потока пишутся тем же запросом, что и твит:
+        при ошибке не остаётся ни твита без лент и хэштегов, ни увеличенных счётчиков без твита, а повтор
+        запроса клиентом создаёт новый твит и считает его хэштеги один раз.
         """
         logger.info(event="творим твит", new_tweet=new_tweet.dict())
-        if author := await self.author_service.get_author(api_key=api_key):
-            attachments = await MediaService.get_many_media(new_tweet.tweet_media_ids)
-            created_tweet = await self.service.create_tweet(new_tweet, author.user.id, attachments)
+        if author := await self.author_service.get_principal(api_key):
+            created_tweet = await self.service.create_tweet(
+                new_tweet,
+                author.id,
+                media_ids=new_tweet.tweet_media_ids,
+                tags=extract_hashtags(new_tweet.tweet_data),
+                bucket=self._bucket(time.time()),
+                fanout_limit=settings.timeline_fanout_limit,
+                notify=settings.tweet_stream_enabled,
+            )
             try:
                 result = TweetOutSchema(result=True, tweet_id=created_tweet.id)
             except ValidationError as e:
@@ -119,6 +395,147 @@ class TweetService:
         logger.error(event="попытка создать твит несуществующим автором")
         raise BackendException(**ErrorsList.author_not_exists)
 
+    async def create_tweets(self, body: bytes, ndjson: bool, api_key: str) -> TweetBatchOutSchema:
+        """
+        Метод сохраняет пачку твитов автора.
+
+        Parameters
+        ----------
+        body: bytes
+            Тело запроса: JSON-массив твитов или NDJSON, по твиту в строке.
+        ndjson: bool
+            Флаг формата NDJSON.
+        api_key: str
+            Уникальный идентификатор автора от фронтенда.
+
+        Returns
+        -------
+        TweetBatchOutSchema
+            Pydantic-схема с результатом по каждому твиту в порядке запроса.
+
+        Note
+        ----
+        Невалидные твиты не мешают сохранению остальных: каждый получает свою ошибку в ответе.
+        Валидные твиты, их раскладка по лентам, хэштеги и события пишутся одной транзакцией.
+        """
+        author = await self.author_service.get_principal(api_key)
+        items = self._parse_batch(body, ndjson)
+        if len(items) > settings.tweets_batch_max:
+            logger.error(event="слишком большая пачка твитов", count=len(items), limit=settings.tweets_batch_max)
+            raise BackendException(**ErrorsList.batch_too_large)
+        results: t.List[t.Optional[TweetBatchItemSchema]] = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, TweetInSchema.parse_obj(item)))
+            except ValidationError as e:
+                message = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+                results[index] = TweetBatchItemSchema(
+                    result=False, error_type=ErrorsList.invalid_tweet["error_type"], error_message=message
+                )
+        if valid:
+            tweet_ids = await self.service.create_tweets(
+                [new_tweet for _, new_tweet in valid],
+                author.id,
+                tags=[extract_hashtags(new_tweet.tweet_data) for _, new_tweet in valid],
+                bucket=self._bucket(time.time()),
+                fanout_limit=settings.timeline_fanout_limit,
+                notify=settings.tweet_stream_enabled,
+            )
+            for (index, _), tweet_id in zip(valid, tweet_ids):
+                results[index] = TweetBatchItemSchema(result=True, tweet_id=tweet_id)
+        logger.info(event="сохранена пачка твитов", count=len(items), created=len(valid))
+        return TweetBatchOutSchema(result=True, tweets=results)
+
+    async def get_tag_tweets(self, tag: str, limit: int, cursor: t.Optional[str] = None) -> TweetListOutSchema:
+        """
+        Метод возвращает страницу твитов с хэштегом от новых к старым.
+
+        Parameters
+        ----------
+        tag: str
+            Хэштег с решёткой или без.
+        limit: int
+            Размер страницы.
+        cursor: str, optional
+            Курсор из предыдущей страницы.
+
+        Returns
+        -------
+        TweetListOutSchema
+            Pydantic-схема списка твитов для фронтенда.
+        """
+        before_id = decode_cursor(cursor)[0] if cursor else None
+        tweets = await self.service.get_tag_tweets(normalize_hashtag(tag), limit=limit, before_id=before_id)
+        try:
+            result = TweetListOutSchema(
+                result=True, tweets=tweets, next_cursor=next_cursor([tweet.id for tweet in tweets], limit)
+            )
+        except ValidationError as e:
+            logger.exception(event="ошибка преобразования в схему", exc_info=e)
+            raise BackendException(**ErrorsList.serialize_error)
+        else:
+            logger.info(event="успешное преобразование твитов хэштега в схему", tag=tag, count=len(tweets))
+            return result
+
+    async def get_trending(self, limit: int = settings.trending_limit) -> TrendingOutSchema:
+        """
+        Метод возвращает самые упоминаемые хэштеги за последние ``trending_window`` секунд.
+
+        Parameters
+        ----------
+        limit: int
+            Количество хэштегов.
+
+        Returns
+        -------
+        TrendingOutSchema
+            Pydantic-схема популярных хэштегов.
+
+        Note
+        ----
+        Окно сдвигается интервалами по ``trending_bucket`` секунд: учитывается текущий интервал
+        и все, начавшиеся не раньше ``trending_window`` секунд назад.
+        """
+        since = self._bucket(time.time() - settings.trending_window + settings.trending_bucket)
+        trending = await self.service.get_trending(since=since, limit=limit)
+        result = TrendingOutSchema(result=True, tags=[dict(tag=tag, count=count) for tag, count in trending])
+        logger.info(event="популярные хэштеги", since=since.isoformat(), count=len(trending))
+        return result
+
+    async def _publish(self, *events: TweetEventSchema) -> None:
+        """Внутренний метод отправляет события в поток твитов, если поток включён."""
+        if settings.tweet_stream_enabled and events:
+            await self.service.notify_events(list(events))
+
+    @staticmethod
+    def _bucket(timestamp: float) -> datetime:
+        """Внутренний метод возвращает начало интервала счётчиков хэштегов, содержащего момент времени."""
+        return datetime.fromtimestamp(timestamp - timestamp % settings.trending_bucket, tz=timezone.utc)
+
+    @staticmethod
+    def _parse_batch(body: bytes, ndjson: bool) -> t.List[t.Any]:
+        """Внутренний метод разбирает тело пакетного запроса в список твитов.
+        Строки NDJSON с неверным JSON остаются строками и не проходят валидацию схемы.
+        """
+        if ndjson:
+            items = []
+            for line in body.splitlines():
+                if line.strip():
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        items.append(line.decode(errors="replace"))
+            return items
+        try:
+            items = json.loads(body)
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            logger.error(event="тело пакетного запроса не является массивом")
+            raise BackendException(**ErrorsList.incorrect_parameters)
+        return items
+
     async def delete_tweet(self, tweet_id: int, api_key: str) -> SuccessSchema:
         """
         Метод удаляет твит автора из СУБД.
@@ -137,16 +554,18 @@ class TweetService:
         ErrorSchema
             Pydantic-схема ошибки выполнения.
         """
-        author = await self.author_service.get_author(api_key=api_key)
+        author = await self.author_service.get_principal(api_key)
         tweet = await self.service.get_tweet_by_id(tweet_id=tweet_id)
-        if not tweet.author.id == author.user.id:
+        if not tweet.author_id == author.id:
             logger.error(
                 event="сравнение идентификаторов автора запроса и автора твитта %s <?> %s",
-                author_id=author.user.id,
-                tweet_id=tweet.author.id,
+                author_id=author.id,
+                tweet_id=tweet.author_id,
             )
             raise BackendException(**ErrorsList.not_self_tweet_remove)
-        return await self.service.delete_tweet(tweet_id=tweet_id, author_id=author.user.id)
+        result = await self.service.delete_tweet(tweet_id=tweet_id, author_id=author.id)
+        await self._publish(TweetEventSchema(event="delete", tweet_id=tweet_id))
+        return result
 
     async def add_like_to_tweet(self, tweet_id: int, api_key: str) -> SuccessSchema:
         """
@@ -163,19 +582,22 @@ class TweetService:
         -------
         SuccessSchema
             Pydantic-схема успешной операции.
+
+        Note
+        ----
+        В режиме ``like_write_mode = "buffer"`` лайк попадает в буфер воркера и записывается в СУБД с задержкой.
         """
-        author = await self.author_service.get_author(api_key=api_key)
-        tweet = await self.service.get_tweet_by_id(tweet_id=tweet_id)
-        like = AuthorLikeSchema(user_id=author.user.id, name=author.user.name)
-        if like in tweet.likes:
-            logger.error(event="попытка двойного лайка", tweet_id=tweet_id, author_id=author.user.id)
+        author = await self.author_service.get_principal(api_key)
+        if settings.like_write_mode == "buffer":
+            added = await like_buffer.add(tweet_id=tweet_id, author_id=author.id)
+        elif not (added := await self.service.add_like(tweet_id=tweet_id, author_id=author.id)):
+            await self.service.get_tweet_by_id(tweet_id=tweet_id)
+        if not added:
+            logger.error(event="попытка двойного лайка", tweet_id=tweet_id, author_id=author.id)
             raise BackendException(**ErrorsList.double_like)
-        tweet.likes.append(like.dict())
-        result = await self.service.update_like_in_tweet(
-            tweet_id=tweet_id, likes=tweet.dict(include={"likes"})["likes"]
-        )
-        logger.info(event="добавлен лайк", author_id=like.user_id, tweet_id=tweet.id)
-        return result
+        await self._publish(TweetEventSchema(event="like", tweet_id=tweet_id, user_id=author.id, name=author.name))
+        logger.info(event="добавлен лайк", author_id=author.id, tweet_id=tweet_id)
+        return SuccessSchema()
 
     async def remove_like_from_tweet(self, tweet_id: int, api_key: str) -> SuccessSchema:
         """
@@ -193,15 +615,14 @@ class TweetService:
         SuccessSchema
             Pydantic-схема успешной операции.
         """
-        author = await self.author_service.get_author(api_key=api_key)
-        tweet = await self.service.get_tweet_by_id(tweet_id=tweet_id)
-        like = AuthorLikeSchema(user_id=author.user.id, name=author.user.name)
-        if like not in tweet.likes:
-            logger.error(event="попытка удаления не своего лайка", tweet_id=tweet_id, author_id=author.user.id)
+        author = await self.author_service.get_principal(api_key)
+        if settings.like_write_mode == "buffer":
+            removed = await like_buffer.remove(tweet_id=tweet_id, author_id=author.id)
+        elif not (removed := await self.service.remove_like(tweet_id=tweet_id, author_id=author.id)):
+            await self.service.get_tweet_by_id(tweet_id=tweet_id)
+        if not removed:
+            logger.error(event="попытка удаления не своего лайка", tweet_id=tweet_id, author_id=author.id)
             raise BackendException(**ErrorsList.remove_not_exist_like)
-        tweet.likes.remove(like.dict())
-        result = await self.service.update_like_in_tweet(
-            tweet_id=tweet_id, likes=tweet.dict(include={"likes"})["likes"]
-        )
-        logger.info(event="удалён лайк", author_id=like.user_id, tweet_id=tweet.id)
-        return result
+        await self._publish(TweetEventSchema(event="unlike", tweet_id=tweet_id, user_id=author.id, name=author.name))
+        logger.info(event="удалён лайк", author_id=author.id, tweet_id=tweet_id)
+        return SuccessSchema()
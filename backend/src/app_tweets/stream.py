@@ -0,0 +1,324 @@
+"""
+stream.py
+---------
+
+Модуль реализует поток событий твитов для открытых вкладок фронтенда: новые твиты, лайки, дизлайки и удаления
+твитов самого автора и авторов, которых он читает.
+
+Note
+----
+    ``TweetService`` после каждого изменения рассылает событие через ``pg_notify`` в канал ``tweet_stream_channel``.
+    В каждом воркере одно выделенное подключение к Postgres слушает канал и раздаёт события подписчикам воркера.
+    Подписчики проиндексированы по авторам, поэтому событие обходит только заинтересованных в нём, а новый твит
+    загружается и отрисовывается один раз на воркер, а не на подписчика, и только если его кто-то ждёт.
+
+    У каждого подписчика своя очередь из ``tweet_stream_queue_size`` кадров. Подписчик, который не успевает
+    забирать кадры, получает событие ``reset`` и отключается, не задерживая остальных: фронтенд перечитывает
+    ``/api/tweets`` условным запросом и переподключается. То же событие получают все подписчики после обрыва
+    подключения к Postgres, потому что события за время обрыва потеряны.
+
+    Список читаемых авторов фиксируется при подключении.
+
+Attributes
+----------
+tweet_stream: TweetStreamHub
+    Поток событий твитов воркера.
+"""
+import asyncio
+import typing as t
+
+import asyncpg
+import orjson
+import structlog
+from pydantic import ValidationError
+
+from app_tweets.db_services import TweetDbService
+from app_tweets.render import render_tweet
+from app_tweets.schemas import TweetEventSchema, TweetSchema
+from db import credentials
+from exceptions import BackendException
+from settings import settings
+
+logger = structlog.get_logger()
+
+RESET = b"event: reset\ndata: {}\n\n"
+PING = b": ping\n\n"
+
+
+def sse_frame(event: str, data: bytes) -> bytes:
+    """Функция собирает кадр Server-Sent Events."""
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class TweetStreamSubscriber:
+    """Класс реализует очередь кадров одного подключения к потоку.
+
+    Parameters
+    ----------
+    author_ids: Set[int]
+        Авторы, о твитах которых нужно сообщать.
+    maxsize: int
+        Максимальное количество кадров, ожидающих отправки.
+    """
+
+    def __init__(self, author_ids: t.Set[int], maxsize: int) -> None:
+        self.author_ids = author_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(maxsize, 1))
+        self.closed = False
+
+    def send(self, frame: bytes) -> bool:
+        """Метод ставит кадр в очередь без ожидания.
+
+        Returns
+        -------
+        bool
+            False, если очередь переполнена и подписчик сброшен.
+        """
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.reset()
+            return False
+        return True
+
+    def reset(self) -> None:
+        """Метод заменяет недоставленные кадры событием ``reset``, после которого поток подписчика завершается."""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESET)
+
+    async def frames(self, heartbeat: float) -> t.AsyncIterator[bytes]:
+        """Метод отдаёт кадры по мере поступления, а в паузах - комментарии, не дающие прокси закрыть соединение."""
+        while True:
+            try:
+                frame = await asyncio.wait_for(self.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield PING
+                continue
+            yield frame
+            if frame is RESET:
+                return
+
+
+class TweetStreamHub:
+    """Класс слушает канал событий твитов и раздаёт их подписчикам воркера.
+
+    Parameters
+    ----------
+    service: TweetDbService
+        Сервис работы с СУБД твитов.
+    channel: str
+        Канал ``LISTEN``.
+    queue_size: int
+        Размер очереди кадров подписчика.
+    backlog: int
+        Максимальное количество полученных, но не разосланных событий. При переполнении сбрасываются все подписчики.
+    heartbeat: float
+        Интервал в секундах между проверками подключения к Postgres и комментариями в потоках подписчиков.
+    retry_after: float
+        Пауза в секундах перед переподключением к Postgres.
+    """
+
+    def __init__(
+        self,
+        service: TweetDbService,
+        channel: str,
+        queue_size: int,
+        backlog: int,
+        heartbeat: float,
+        retry_after: float,
+    ) -> None:
+        self.service = service
+        self.channel = channel
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.retry_after = retry_after
+        self._events: asyncio.Queue = asyncio.Queue(maxsize=backlog)
+        self._subscribers: t.Dict[int, t.Set[TweetStreamSubscriber]] = {}
+        self._tasks: t.List[asyncio.Task] = []
+        self.connected = asyncio.Event()
+        self.subscribers = 0
+        self.received = 0
+        self.sent = 0
+        self.slow = 0
+        self.overflows = 0
+        self.reconnects = 0
+        self.errors = 0
+
+    def subscribe(self, author_ids: t.Iterable[int]) -> TweetStreamSubscriber:
+        """Метод подписывает новое подключение на события твитов авторов.
+
+        Parameters
+        ----------
+        author_ids: Iterable[int]
+            Авторы, о твитах которых нужно сообщать.
+
+        Returns
+        -------
+        TweetStreamSubscriber
+            Очередь кадров подключения.
+        """
+        subscriber = TweetStreamSubscriber(set(author_ids), self.queue_size)
+        for author_id in subscriber.author_ids:
+            self._subscribers.setdefault(author_id, set()).add(subscriber)
+        self.subscribers += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: TweetStreamSubscriber) -> None:
+        """Метод отписывает подключение. Повторная отписка ничего не делает."""
+        removed = False
+        for author_id in subscriber.author_ids:
+            if (subscribers := self._subscribers.get(author_id)) is not None and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                removed = True
+                if not subscribers:
+                    del self._subscribers[author_id]
+        self.subscribers -= removed
+
+    async def frames(self, subscriber: TweetStreamSubscriber) -> t.AsyncIterator[bytes]:
+        """Метод отдаёт кадры подписчика и отписывает его, когда фронтенд отключился или подписчик сброшен."""
+        try:
+            async for frame in subscriber.frames(self.heartbeat):
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def reset_all(self) -> None:
+        """Метод сбрасывает всех подписчиков воркера: их фронтенды перечитают твиты и переподключатся."""
+        for subscriber in set().union(*self._subscribers.values()):
+            subscriber.reset()
+            self.unsubscribe(subscriber)
+
+    def _on_notify(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        """Внутренний метод принимает уведомление Postgres и ставит его в очередь рассылки."""
+        self.received += 1
+        try:
+            self._events.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.overflows += 1
+            logger.warning(
+                event="очередь событий твитов переполнена, подписчики сброшены", backlog=self._events.qsize()
+            )
+            self.reset_all()
+
+    async def listen(self) -> None:
+        """Метод держит подключение ``LISTEN`` и переподключается после обрыва, пока его не отменят."""
+        while True:
+            lost = asyncio.Event()
+            try:
+                connection = await asyncpg.connect(
+                    user=credentials["user"],
+                    password=credentials["password"],
+                    host=credentials["host"],
+                    port=credentials["port"],
+                    database=credentials["db"],
+                )
+            except (OSError, asyncpg.PostgresError) as e:
+                self.errors += 1
+                logger.warning(event="нет подключения к потоку событий твитов", error=repr(e))
+                await asyncio.sleep(self.retry_after)
+                continue
+            connection.add_termination_listener(lambda _, lost=lost: lost.set())
+            try:
+                await connection.add_listener(self.channel, self._on_notify)
+                self.connected.set()
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        await asyncio.wait_for(connection.fetchval("SELECT 1"), self.heartbeat)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError) as e:
+                self.errors += 1
+                logger.warning(event="потеряно подключение к потоку событий твитов", error=repr(e))
+            finally:
+                self.connected.clear()
+                connection.terminate()
+            self.reconnects += 1
+            self.reset_all()
+            await asyncio.sleep(self.retry_after)
+
+    async def dispatch(self) -> None:
+        """Метод раздаёт полученные события подписчикам, пока его не отменят."""
+        while True:
+            payload = await self._events.get()
+            try:
+                event = TweetEventSchema.parse_raw(payload)
+            except ValidationError:
+                logger.warning(event="неверное событие твита", payload=payload)
+                continue
+            if not (subscribers := self._subscribers.get(event.author_id)):
+                continue
+            try:
+                frame = await self.render(event)
+            except BackendException:
+                continue
+            for subscriber in list(subscribers):
+                if subscriber.send(frame):
+                    self.sent += 1
+                else:
+                    self.slow += 1
+                    self.unsubscribe(subscriber)
+
+    async def render(self, event: TweetEventSchema) -> bytes:
+        """Метод превращает событие в кадр потока. Новый твит загружается и отрисовывается целиком.
+
+        Raises
+        ------
+        BackendException
+            Твит удалили раньше, чем о нём успели сообщить.
+        """
+        if event.event == "tweet":
+            tweet = await self.service.get_tweet_by_id(event.tweet_id)
+            return sse_frame(event.event, render_tweet(TweetSchema.from_orm(tweet)))
+        return sse_frame(event.event, orjson.dumps(event.dict(exclude={"event", "author_id"}, exclude_none=True)))
+
+    def start(self) -> None:
+        """Метод запускает прослушивание канала и рассылку событий в цикле событий воркера."""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self.listen()), asyncio.create_task(self.dispatch())]
+
+    async def stop(self) -> None:
+        """Метод останавливает поток и сбрасывает подписчиков."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self.reset_all()
+
+    def stats(self) -> dict:
+        """Метод возвращает метрики потока.
+
+        Returns
+        -------
+        dict
+            Количество подписчиков, полученных событий, отправленных кадров, сброшенных медленных подписчиков,
+            переполнений очереди событий и переподключений к Postgres.
+        """
+        return dict(
+            connected=self.connected.is_set(),
+            subscribers=self.subscribers,
+            backlog=self._events.qsize(),
+            received=self.received,
+            sent=self.sent,
+            slow=self.slow,
+            overflows=self.overflows,
+            reconnects=self.reconnects,
+            errors=self.errors,
+        )
+
+
+tweet_stream = TweetStreamHub(
+    TweetDbService(),
+    channel=settings.tweet_stream_channel,
+    queue_size=settings.tweet_stream_queue_size,
+    backlog=settings.tweet_stream_backlog,
+    heartbeat=settings.tweet_stream_heartbeat,
+    retry_after=settings.tweet_stream_retry_after,
+)
@@ -4,31 +4,87 @@ urls.py
 
 Реализует эндпоинты для работы с твитами населения.
 """
-from fastapi import APIRouter, Depends, Request, status
+import typing as t
 
+from fastapi import APIRouter, Depends, Path, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from app_tweets.models import HASHTAG_MAX_LENGTH
+from app_tweets.render import tweet_list_response
 from app_tweets.schemas import (
+    TrendingOutSchema,
+    TweetBatchOutSchema,
+    TweetChangesOutSchema,
     TweetInSchema,
+    TweetItemsOutSchema,
     TweetListOutSchema,
     TweetModelOutSchema,
     TweetOutSchema,
 )
 from app_tweets.services import TweetService
+from app_tweets.stream import tweet_stream
 from app_users.services import PermissionService
 from log_fab import get_logger, make_context
+from responses import (
+    forward_headers,
+    make_etag,
+    not_modified,
+    orjson_response,
+    revalidating,
+    validator_headers,
+)
 from schemas import SuccessSchema
+from settings import settings
 
 router = APIRouter()
 logger = get_logger()
 
 
-@router.get("/api/tweets", response_model=TweetListOutSchema, status_code=status.HTTP_200_OK, tags=["tweets"])
+@router.get(
+    "/api/tweets",
+    response_model=t.Union[TweetListOutSchema, TweetItemsOutSchema, TweetChangesOutSchema],
+    status_code=status.HTTP_200_OK,
+    tags=["tweets"],
+)
 async def get_tweets_list(
-    request: Request, permission: PermissionService = Depends(), tweet: TweetService = Depends()
-) -> TweetListOutSchema:
-    """Эндпоинт реализует получение всех твитов текущего автора.
+    request: Request,
+    limit: int = Query(default=settings.tweets_page_size, gt=0, le=settings.tweets_page_max),
+    before_id: t.Optional[int] = Query(default=None, gt=0),
+    after_id: t.Optional[int] = Query(default=None, gt=0),
+    cursor: t.Optional[str] = Query(default=None, max_length=128),
+    ids: t.Optional[str] = Query(default=None, max_length=settings.multi_get_max * 12),
+    since_version: t.Optional[int] = Query(default=None, ge=0),
+    since_id: t.Optional[int] = Query(default=None, ge=0),
+    permission: PermissionService = Depends(),
+    tweet: TweetService = Depends(),
+) -> Response:
+    """Эндпоинт реализует постраничное получение твитов текущего автора от новых к старым.
+    Курсор следующей страницы возвращается в заголовке ``X-Next-Cursor``, валидатор - в заголовке ``ETag``.
+    Если твиты автора не менялись с ``If-None-Match``, возвращается пустой ответ 304.
+
+    С параметром ``ids`` эндпоинт вместо страницы возвращает твиты любых авторов по списку идентификаторов
+    в схеме ``TweetItemsOutSchema``: каждый ненайденный твит получает свою ошибку, а не 404 на весь запрос.
+
+    Заголовок ``X-Changes-Version`` страницы - версия, с которой фронтенд опрашивает изменения. С параметром
+    ``since_version`` эндпоинт возвращает ``TweetChangesOutSchema``: новые твиты, лайки уже показанных твитов
+    и удалённые твиты, а если ничего не изменилось - пустой ответ 204. Новая версия приходит в том же заголовке.
 
     Parameters
     ----------
+    limit: int
+        Размер страницы.
+    before_id: int, optional
+        Вернуть твиты старше этого.
+    after_id: int, optional
+        Вернуть твиты новее этого.
+    cursor: str, optional
+        Курсор из заголовка ``X-Next-Cursor`` предыдущей страницы.
+    ids: str, optional
+        Идентификаторы твитов через запятую, не больше ``multi_get_max``.
+    since_version: int, optional
+        Версия из заголовка ``X-Changes-Version`` предыдущего ответа.
+    since_id: int, optional
+        Наибольший идентификатор твита, который уже есть у фронтенда.
     permission: PermissionService
         Зависимость для работы с правами.
     tweet: TweetService
@@ -36,14 +92,36 @@ async def get_tweets_list(
 
     Returns
     -------
-    TweetListOutSchema
-        Pydantic-схема списка твитов.
+    Response
+        Список твитов, склеенный из кэша отрисованных твитов, или ответ 304.
     """
     logger.debug("begin endpoint")
+    if ids is not None:
+        result = await tweet.get_tweets(ids)
+        logger.info("вызов эндпоинта завершен успешно", count=len(result.tweets))
+        return orjson_response(result, headers=forward_headers(permission.response))
     api_key = await permission.get_api_key()
-    result = await tweet.get_list(api_key)
+    if since_version is not None:
+        changes = await tweet.get_changes(api_key, since_version, since_id=since_id, limit=limit)
+        if changes is None:
+            headers = forward_headers(permission.response, {"X-Changes-Version": str(since_version)})
+            return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+        logger.info("вызов эндпоинта завершен успешно", version=changes.version)
+        headers = forward_headers(permission.response, {"X-Changes-Version": str(changes.version)})
+        return orjson_response(changes, headers=headers)
+    etag = make_etag("tweets", await tweet.get_list_version(api_key))
+    if response := not_modified(request, etag, forward_headers(permission.response)):
+        logger.info("твиты не изменились", etag=etag)
+        return response
+    result = await tweet.get_list(api_key, limit=limit, before_id=before_id, after_id=after_id, cursor=cursor)
+    headers = forward_headers(permission.response)
+    if result.next_cursor:
+        headers["X-Next-Cursor"] = result.next_cursor
+    # изменения после чтения страницы получат версии больше любой версии на ней
+    if versions := [item.version for item in result.tweets or [] if item.version is not None]:
+        headers["X-Changes-Version"] = str(max(versions))
     logger.info("вызов эндпоинта завершен успешно")
-    return result
+    return tweet_list_response(result, headers=validator_headers(etag, headers))
 
 
 @router.post("/api/tweets", response_model=TweetOutSchema, status_code=status.HTTP_201_CREATED, tags=["tweets"])
@@ -76,6 +154,215 @@ async def create_tweet(
     return result
 
 
+@router.post(
+    "/api/tweets/batch",
+    response_model=TweetBatchOutSchema,
+    status_code=status.HTTP_200_OK,
+    tags=["tweets"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/TweetInSchema"}}
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def create_tweets_batch(
+    request: Request,
+    permission: PermissionService = Depends(),
+    tweet: TweetService = Depends(),
+) -> TweetBatchOutSchema:
+    """Эндпоинт пакетной загрузки твитов: JSON-массив ``TweetInSchema`` или NDJSON, по твиту в строке.
+
+    Parameters
+    ----------
+    permission: PermissionService
+        Зависимость для работы с правами.
+    tweet: TweetService
+        Зависимость для работы с бизнес-логикой твитов.
+
+    Returns
+    -------
+    TweetBatchOutSchema
+        Pydantic-схема с результатом по каждому твиту.
+    """
+    make_context(request)
+    api_key = await permission.get_api_key()
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    result = await tweet.create_tweets(await request.body(), ndjson=ndjson, api_key=api_key)
+    logger.info(event="вызов эндпоинта завершен успешно")
+    return result
+
+
+@router.get("/api/tweets/search", response_model=TweetListOutSchema, status_code=status.HTTP_200_OK, tags=["tweets"])
+async def search_tweets(
+    request: Request,
+    q: str = Query(min_length=1, max_length=256),
+    limit: int = Query(default=settings.tweets_page_size, gt=0, le=settings.tweets_page_max),
+    cursor: t.Optional[str] = Query(default=None, max_length=128),
+    tweet: TweetService = Depends(),
+) -> Response:
+    """Эндпоинт полнотекстового поиска твитов. Курсор следующей страницы возвращается в заголовке ``X-Next-Cursor``.
+
+    Parameters
+    ----------
+    q: str
+        Поисковый запрос: слова, "фразы", -исключения, or.
+    limit: int
+        Размер страницы.
+    cursor: str, optional
+        Курсор из заголовка ``X-Next-Cursor`` предыдущей страницы.
+    tweet: TweetService
+        Зависимость для работы с бизнес-логикой твитов.
+
+    Returns
+    -------
+    Response
+        Список найденных твитов, склеенный из кэша отрисованных твитов.
+    """
+    make_context(request)
+    result = await tweet.search(q, limit=limit, cursor=cursor)
+    headers = {"X-Next-Cursor": result.next_cursor} if result.next_cursor else None
+    logger.info(event="вызов эндпоинта завершен успешно")
+    return tweet_list_response(result, headers=headers)
+
+
+@router.get("/api/tweets/feed", response_model=TweetListOutSchema, status_code=status.HTTP_200_OK, tags=["tweets"])
+async def get_timeline(
+    request: Request,
+    limit: int = Query(default=settings.tweets_page_size, gt=0, le=settings.tweets_page_max),
+    before_id: t.Optional[int] = Query(default=None, gt=0),
+    permission: PermissionService = Depends(),
+    tweet: TweetService = Depends(),
+) -> Response:
+    """Эндпоинт возвращает домашнюю ленту текущего автора: его твиты и твиты тех, кого он читает.
+
+    Parameters
+    ----------
+    limit: int
+        Размер страницы.
+    before_id: int, optional
+        Идентификатор последнего твита предыдущей страницы.
+    permission: PermissionService
+        Зависимость для работы с правами.
+    tweet: TweetService
+        Зависимость для работы с бизнес-логикой твитов.
+
+    Returns
+    -------
+    Response
+        Список твитов, склеенный из кэша отрисованных твитов.
+    """
+    make_context(request)
+    api_key = await permission.get_api_key()
+    result = await tweet.get_timeline(api_key, limit=limit, before_id=before_id)
+    logger.info(event="вызов эндпоинта завершен успешно")
+    return tweet_list_response(result, headers=forward_headers(permission.response))
+
+
+@router.get("/api/tweets/stream", status_code=status.HTTP_200_OK, response_class=StreamingResponse, tags=["tweets"])
+async def stream_tweets(
+    request: Request,
+    permission: PermissionService = Depends(),
+    tweet: TweetService = Depends(),
+) -> StreamingResponse:
+    """Эндпоинт открывает поток Server-Sent Events с твитами текущего автора и авторов, которых он читает.
+
+    Note
+    ----
+    События ``tweet`` (новый твит целиком), ``like`` и ``unlike`` (``tweet_id``, ``user_id``, ``name``),
+    ``delete`` (``tweet_id``) приходят по мере изменений. Событие ``reset`` закрывает поток: фронтенд не успевал
+    читать события или часть событий потеряна, и твиты нужно перечитать через ``/api/tweets``.
+
+    Parameters
+    ----------
+    permission: PermissionService
+        Зависимость для работы с правами.
+    tweet: TweetService
+        Зависимость для работы с бизнес-логикой твитов.
+
+    Returns
+    -------
+    StreamingResponse
+        Поток ``text/event-stream``.
+    """
+    make_context(request)
+    api_key = await permission.get_api_key()
+    subscriber = await tweet.open_stream(api_key)
+    logger.info(event="открыт поток событий твитов")
+    return StreamingResponse(
+        tweet_stream.frames(subscriber),
+        media_type="text/event-stream",
+        headers=forward_headers(permission.response, {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}),
+    )
+
+
+@router.get("/api/tags/trending", response_model=TrendingOutSchema, status_code=status.HTTP_200_OK, tags=["hashtags"])
+async def get_trending_tags(
+    request: Request,
+    limit: int = Query(default=settings.trending_limit, gt=0, le=100),
+    tweet: TweetService = Depends(),
+) -> TrendingOutSchema:
+    """Эндпоинт возвращает самые упоминаемые хэштеги за последние ``trending_window`` секунд.
+
+    Parameters
+    ----------
+    limit: int
+        Количество хэштегов.
+    tweet: TweetService
+        Зависимость для работы с бизнес-логикой твитов.
+
+    Returns
+    -------
+    TrendingOutSchema
+        Pydantic-схема популярных хэштегов.
+    """
+    make_context(request)
+    result = await tweet.get_trending(limit=limit)
+    logger.info(event="вызов эндпоинта завершен успешно")
+    return result
+
+
+@router.get(
+    "/api/tags/{tag}/tweets", response_model=TweetListOutSchema, status_code=status.HTTP_200_OK, tags=["hashtags"]
+)
+async def get_tag_tweets(
+    request: Request,
+    tag: str = Path(min_length=1, max_length=HASHTAG_MAX_LENGTH + 1),
+    limit: int = Query(default=settings.tweets_page_size, gt=0, le=settings.tweets_page_max),
+    cursor: t.Optional[str] = Query(default=None, max_length=128),
+    tweet: TweetService = Depends(),
+) -> Response:
+    """Эндпоинт возвращает твиты с хэштегом от новых к старым.
+    Курсор следующей страницы возвращается в заголовке ``X-Next-Cursor``.
+
+    Parameters
+    ----------
+    tag: str
+        Хэштег с решёткой или без, регистр не важен.
+    limit: int
+        Размер страницы.
+    cursor: str, optional
+        Курсор из заголовка ``X-Next-Cursor`` предыдущей страницы.
+    tweet: TweetService
+        Зависимость для работы с бизнес-логикой твитов.
+
+    Returns
+    -------
+    Response
+        Список твитов, склеенный из кэша отрисованных твитов.
+    """
+    make_context(request)
+    result = await tweet.get_tag_tweets(tag, limit=limit, cursor=cursor)
+    headers = {"X-Next-Cursor": result.next_cursor} if result.next_cursor else None
+    logger.info(event="вызов эндпоинта завершен успешно")
+    return tweet_list_response(result, headers=headers)
+
+
 @router.get(
     "/api/tweets/{tweet_id}", response_model=TweetModelOutSchema, status_code=status.HTTP_200_OK, tags=["tweets"]
 )
@@ -83,8 +370,9 @@ async def get_tweet(
     request: Request,
     tweet_id: int,
     tweet: TweetService = Depends(),
-) -> TweetModelOutSchema:
-    """Эндпоинт достаёт твит по идентификатору СУБД.
+) -> Response:
+    """Эндпоинт достаёт твит по идентификатору СУБД. Валидатор возвращается в заголовке ``ETag``,
+    и если твит не менялся с ``If-None-Match``, возвращается пустой ответ 304.
 
     Parameters
     ----------
@@ -95,13 +383,18 @@ async def get_tweet(
 
     Returns
     -------
-    TweetModelOutSchema
-        Pydantic-схема для фронтенда твита.
+    Response
+        Сериализованная pydantic-схема для фронтенда твита или ответ 304.
     """
     make_context(request)
+    if revalidating(request):
+        if response := not_modified(request, make_etag("tweet", tweet_id, await tweet.get_tweet_version(tweet_id))):
+            logger.info(event="твит не изменился", tweet_id=tweet_id)
+            return response
     result = await tweet.get_tweet(tweet_id=tweet_id)
+    etag = make_etag("tweet", tweet_id, result.tweet.version)
     logger.info(event="вызов эндпоинта завершен успешно")
-    return result
+    return orjson_response(result, headers=validator_headers(etag))
 
 
 @router.delete("/api/tweets/{tweet_id}", response_model=SuccessSchema, status_code=status.HTTP_200_OK, tags=["tweets"])
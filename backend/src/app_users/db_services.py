@@ -3,28 +3,108 @@ db_services.py
 --------------
 
 Модуль реализует взаимодействие с базой данных приложения app_users.
+
+Note
+----
+    Авторы кэшируются в два уровня. В памяти процесса хранится соответствие api-key автору запроса
+    (``api_key_cache``), в общем для воркеров хранилище ``cache_backend`` - соответствие api-key автору запроса
+    (``auth:<api-key>``) и сериализованные профили без пароля и api-key (``author:<id>``, ``AuthorCachedSchema``).
+    Поэтому из кэша отдаются только профили по идентификатору, а автор по api-key или имени вместе с паролем
+    всегда читается из СУБД.
+
+    Подписки хранятся в таблице ``follows``. Списки подписок профиля собираются из неё коррелированными
+    подзапросами в том же запросе, что и автор (``PROFILE_GRAPH``). Подписка и отписка меняют одну строку
+    ``follows`` и счётчики обоих авторов в одной транзакции. Отписка той же транзакцией убирает твиты
+    пишущего автора из домашней ленты читающего (``TIMELINES``).
 """
-from typing import Optional
+from typing import Any, List, Optional, Union
 
 import structlog
-from sqlalchemy import select, update
+from sqlalchemy import Integer, case, cast, column, delete, func, select, table, update
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by, insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql.elements import ColumnElement
 
 from app_users.interfaces import AbstractAuthorService
-from app_users.models import Author
-from app_users.schemas import AuthorModelSchema
+from app_users.models import AUTHOR_VERSIONS, Author, Follow
+from app_users.schemas import (
+    AuthorCachedSchema,
+    AuthorModelSchema,
+    AuthorPrincipalSchema,
+)
+from cache import TTLCache, cache_backend
 from db import session
 from exceptions import BackendException, ErrorsList, exc_handler
-from schemas import SuccessSchema
+from settings import settings
 
 TTL = 60
+NEGATIVE_TTL = 5
 logger = structlog.get_logger()
 
+# ленты и твиты принадлежат app_tweets: их модели не импортируются, чтобы пакеты приложений
+# не импортировали друг друга по кругу
+TIMELINES = table("timelines", column("owner_id", Integer), column("tweet_id", Integer))
+TWEETS = table("tweets", column("id", Integer), column("author_id", Integer))
+
+api_key_cache = TTLCache(name="api_key", maxsize=settings.api_key_cache_size, ttl=TTL)
+_NOT_CACHED = object()
+
+
+def auth_key(api_key: str) -> str:
+    """Функция возвращает ключ хранилища кэша для api-key."""
+    return f"auth:{api_key}"
+
+
+def author_key(author_id: int) -> str:
+    """Функция возвращает ключ хранилища кэша для профиля автора."""
+    return f"author:{author_id}"
+
+
+def follow_graph(owner: ColumnElement, member: ColumnElement) -> ColumnElement:
+    """Функция строит подзапрос списка подписок автора в виде JSONB-массива ``[{"id": ..., "name": ...}]``.
+
+    Parameters
+    ----------
+    owner: ColumnElement
+        Столбец ``follows``, равный идентификатору автора профиля.
+    member: ColumnElement
+        Столбец ``follows`` с идентификаторами авторов списка.
+    """
+    other = aliased(Author)
+    item = func.jsonb_build_object("id", other.id, "name", other.name)
+    return (
+        select(func.coalesce(func.jsonb_agg(aggregate_order_by(item, other.id)), cast([], JSONB)))
+        .select_from(Follow)
+        .join(other, other.id == member)
+        .where(owner == Author.id)
+        .scalar_subquery()
+    )
+
+
+PROFILE_GRAPH = (
+    follow_graph(Follow.follower_id, Follow.followee_id).label("followers"),
+    follow_graph(Follow.followee_id, Follow.follower_id).label("following"),
+)
+
+
+def profile_from_row(row: Row) -> AuthorModelSchema:
+    """Функция собирает профиль автора из строки запроса ``select(Author, *PROFILE_GRAPH)``."""
+    return AuthorModelSchema.from_orm(row.Author).copy(update=dict(followers=row.followers, following=row.following))
+
+
+def cached_profile(author: AuthorModelSchema) -> AuthorCachedSchema:
+    """Функция убирает из профиля автора пароль и api-key перед записью в общий кэш."""
+    return AuthorCachedSchema.parse_obj(author.dict(exclude={"password", "api_key"}))
+
 
 class AuthorDbService(AbstractAuthorService):
     """Класс инкапсулирует cruid для модели авторов"""
 
     @exc_handler(ConnectionRefusedError)
-    async def get_author(self, author_id: int = None, api_key: str = None, name: str = None) -> AuthorModelSchema:
+    async def get_author(
+        self, author_id: int = None, api_key: str = None, name: str = None
+    ) -> Union[AuthorCachedSchema, AuthorModelSchema]:
         """
         Метод ищет автора по одному из параметров.
 
@@ -39,27 +119,65 @@ class AuthorDbService(AbstractAuthorService):
 
         Returns
         -------
-         ProfileAuthorSchema
-            Pydantic-схема профиля автора.
+        AuthorCachedSchema
+            Pydantic-схема профиля автора без пароля и api-key при поиске по идентификатору.
+        AuthorModelSchema
+            Pydantic-схема автора с паролем и api-key при поиске по api-key или имени.
         """
         logger.info("запрос автора по ИД, ключу или имени", author_id=author_id, api_key=api_key, name=name)
+        if author_id and (cached := await cache_backend.get(author_key(author_id))):
+            result = AuthorCachedSchema.parse_raw(cached)
+            logger.info(event="автор найден в кэше", author_id=author_id)
+            return result
         if author_id:
-            query = select(Author).filter_by(id=author_id)
+            query = select(Author, *PROFILE_GRAPH).where(Author.id == author_id)
         elif api_key:
-            query = select(Author).filter_by(api_key=api_key)
+            query = select(Author, *PROFILE_GRAPH).where(Author.api_key == api_key)
         elif name:
-            query = select(Author).filter_by(name=name)
+            query = select(Author, *PROFILE_GRAPH).where(Author.name == name)
         else:
             logger.error("неверные параметры")
             raise BackendException(**ErrorsList.incorrect_parameters)
         async with session() as async_session:
             async with async_session.begin():
                 qs = await async_session.execute(query)
-                user = qs.scalars().first()
-                if user:
-                    result = AuthorModelSchema.from_orm(user)
-                    logger.info(event="найден автор", result=result.dict())
-                    return result
+                row = qs.first()
+        if row:
+            result = profile_from_row(row)
+            logger.info(event="найден автор", author_id=result.id)
+            await self._cache_authors([result])
+            return cached_profile(result) if author_id else result
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_authors(self, ids: List[int]) -> List[AuthorCachedSchema]:
+        """
+        Метод возвращает профили авторов по списку идентификаторов.
+        Профили из кэша запрашиваются одним обращением к хранилищу, недостающие - одним запросом к СУБД
+        и записываются в кэш тоже одним обращением.
+
+        Parameters
+        ----------
+        ids: List[int]
+            Список идентификаторов авторов.
+
+        Returns
+        -------
+        List[AuthorCachedSchema]
+            Pydantic-схемы профилей найденных авторов без паролей и api-key в порядке списка идентификаторов.
+        """
+        cached = await cache_backend.get_many([author_key(author_id) for author_id in ids])
+        authors = {author_id: AuthorCachedSchema.parse_raw(item) for author_id, item in zip(ids, cached) if item}
+        if missed := [author_id for author_id in ids if author_id not in authors]:
+            query = select(Author, *PROFILE_GRAPH).where(Author.id.in_(missed))
+            async with session() as async_session:
+                async with async_session.begin():
+                    qs = await async_session.execute(query)
+                    rows = qs.all()
+            loaded = [profile_from_row(row) for row in rows]
+            await self._cache_authors(loaded)
+            authors.update((author.id, cached_profile(author)) for author in loaded)
+        logger.info(event="запрос авторов по списку", ids=ids, cached=len(ids) - len(missed))
+        return [authors[author_id] for author_id in ids if author_id in authors]
 
     @exc_handler(ConnectionRefusedError)
     async def create_author(self, name: str, api_key: str, password: str) -> Optional[AuthorModelSchema]:
@@ -87,51 +205,125 @@ class AuthorDbService(AbstractAuthorService):
                 await async_session.flush()
                 qs = await async_session.execute(query)
                 user = qs.scalars().first()
-                if user:
-                    result = AuthorModelSchema.from_orm(user)
-                    logger.info("новый автор сохранен в postgres", result=result.dict())
-                    return result
+        await self.invalidate_api_key(api_key)
+        if user:
+            result = AuthorModelSchema.from_orm(user)
+            logger.info("новый автор сохранен в postgres", result=result.dict())
+            return result
 
     @exc_handler(ConnectionRefusedError)
-    async def update_follow(
-        self,
-        reading_author: AuthorModelSchema,
-        writing_author: AuthorModelSchema,
-        followers: list,
-        following: list,
-    ) -> SuccessSchema:
-        """Метод обновляет фоловеров и фоловингов.
+    async def follow(self, follower_id: int, followee_id: int) -> Optional[bool]:
+        """Метод подписывает читающего автора на пишущего.
 
         Parameters
         ----------
-        reading_author: ProfileAuthorSchema
-            Профиль читающего автора.
-        writing_author: ProfileAuthorSchema
-            Профиль пишущего автора.
-        followers: list
-            Список словарей всех писателей пользователя.
-        following: list
-            Список словарей всех читателей пользователя.
+        follower_id: int
+            Идентификатор читающего автора.
+        followee_id: int
+            Идентификатор пишущего автора.
 
         Returns
         -------
-        SuccessSchema
-            Pydantic-схема успешной операции
+        bool, optional
+            True, если подписка создана, False, если она уже была, None, если одного из авторов нет.
         """
+        return await self._change_follow(follower_id, followee_id, delta=1)
+
+    @exc_handler(ConnectionRefusedError)
+    async def unfollow(self, follower_id: int, followee_id: int) -> Optional[bool]:
+        """Метод отписывает читающего автора от пишущего.
+
+        Parameters
+        ----------
+        follower_id: int
+            Идентификатор читающего автора.
+        followee_id: int
+            Идентификатор пишущего автора.
 
-        logger.info(event="обновление фоловеров и фоловингов", followers=followers, following=following)
-        query_r = update(Author).where(Author.id == reading_author.id).values(followers=followers)
-        query_w = update(Author).where(Author.id == writing_author.id).values(following=following)
+        Returns
+        -------
+        bool, optional
+            True, если подписка удалена, False, если её не было, None, если одного из авторов нет.
+
+        Note
+        ----
+        Вместе с подпиской удаляются разложенные в ленту читающего твиты пишущего автора.
+        """
+        return await self._change_follow(follower_id, followee_id, delta=-1)
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_followee_ids(self, author_id: int) -> List[int]:
+        """Метод возвращает идентификаторы авторов, которых читает автор, по первичному ключу ``follows``.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор читающего автора.
+        """
         async with session() as async_session:
             async with async_session.begin():
-                await async_session.execute(query_r)
-                await async_session.execute(query_w)
-                await async_session.commit()
-        result = SuccessSchema()
-        logger.info(event="успешное завершение")
-        return result
+                qs = await async_session.execute(select(Follow.followee_id).where(Follow.follower_id == author_id))
+                return qs.scalars().all()
 
     @exc_handler(ConnectionRefusedError)
+    async def get_version(self, author_id: int) -> Optional[int]:
+        """Метод возвращает версию профиля автора, не загружая сам профиль.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор автора в СУБД.
+
+        Returns
+        -------
+        int, optional
+            Версия профиля или None, если автора нет.
+
+        Note
+        ----
+        Версия берётся из профиля в ``cache_backend``, если он там есть: подписка и отписка удаляют профиль
+        из кэша, поэтому закэшированная версия не старше самого профиля.
+        """
+        if cached := await cache_backend.get(author_key(author_id)):
+            return AuthorCachedSchema.parse_raw(cached).version
+        async with session() as async_session:
+            async with async_session.begin():
+                return await async_session.scalar(select(Author.version).where(Author.id == author_id))
+
+    @exc_handler(ConnectionRefusedError)
+    async def get_principal(self, api_key: str) -> Optional[AuthorPrincipalSchema]:
+        """Метод возвращает автора запроса по api-key.
+
+        Parameters
+        ----------
+        api_key: str
+            Ключ из заголовка запроса.
+
+        Returns
+        -------
+        AuthorPrincipalSchema, optional
+            Pydantic-схема автора запроса или None, если ключ не существует.
+
+        Note
+        ----
+        Результат кэшируется в памяти процесса: существующие ключи на ``TTL`` секунд,
+        несуществующие - на ``NEGATIVE_TTL`` секунд, чтобы новый автор не ждал минуту после регистрации
+        в соседнем воркере.
+        """
+        principal = await self._get_cached_principal(api_key)
+        if principal is _NOT_CACHED:
+            query = select(Author.id, Author.name).filter_by(api_key=api_key)
+            async with session() as async_session:
+                async with async_session.begin():
+                    qs = await async_session.execute(query)
+                    row = qs.first()
+            principal = AuthorPrincipalSchema(id=row.id, name=row.name, api_key=api_key) if row else None
+            api_key_cache.set(api_key, principal, ttl=TTL if principal else NEGATIVE_TTL)
+            if principal:
+                await cache_backend.set(auth_key(api_key), principal.json(), ttl=TTL)
+            logger.info(event="api-key запрошен из postgres", cache=api_key_cache.stats())
+        return principal
+
     async def verify_api_key_exist(self, api_key: str) -> bool:
         """Метод проверяет существование api-key
 
@@ -140,13 +332,100 @@ class AuthorDbService(AbstractAuthorService):
         api_key: str
             Ключ из заголовка запроса.
         """
-        query = select(Author.api_key).filter_by(api_key=api_key)
+        if await self.get_principal(api_key):
+            logger.info(event="существование api-key подтверждено")
+            return True
+        logger.info(event="api-key не существует")
+        return False
+
+    @staticmethod
+    async def invalidate_api_key(api_key: str) -> None:
+        """Метод удаляет api-key из кэша проверки ключей в памяти процесса и в общем хранилище.
+        Вызывается при создании и удалении автора.
+
+        Parameters
+        ----------
+        api_key: str
+            Ключ автора.
+        """
+        api_key_cache.invalidate(api_key)
+        await cache_backend.delete(auth_key(api_key))
+
+    @staticmethod
+    async def _get_cached_principal(api_key: str) -> Any:
+        """Внутренний метод ищет автора запроса по api-key в кэше процесса, затем в общем хранилище.
+
+        Returns
+        -------
+        AuthorPrincipalSchema, optional
+            Автор запроса, None для заведомо несуществующего ключа или ``_NOT_CACHED`` при промахе.
+        """
+        principal = api_key_cache.get(api_key, _NOT_CACHED)
+        if principal is not _NOT_CACHED:
+            return principal
+        if cached := await cache_backend.get(auth_key(api_key)):
+            principal = AuthorPrincipalSchema.parse_raw(cached)
+            api_key_cache.set(api_key, principal)
+            return principal
+        return _NOT_CACHED
+
+    @staticmethod
+    async def _change_follow(follower_id: int, followee_id: int, delta: int) -> Optional[bool]:
+        """Внутренний метод создаёт (``delta=1``) или удаляет (``delta=-1``) подписку и обновляет счётчики
+        и версии профилей обоих авторов.
+
+        Note
+        ----
+        Строки обоих авторов блокируются в порядке идентификаторов, поэтому встречные подписки не взаимоблокируются,
+        а счётчики меняются только если строка ``follows`` действительно добавлена или удалена: повторная
+        подписка и отписка ничего не меняют и не сбрасывают ``ETag`` профилей. Удалив подписку, транзакция
+        удаляет и записи ленты читающего с твитами пишущего, поэтому после фиксации отписки лента
+        не содержит его твитов.
+        """
+        authors = (follower_id, followee_id)
+        if delta > 0:
+            query = insert(Follow).values(follower_id=follower_id, followee_id=followee_id).on_conflict_do_nothing()
+        else:
+            query = delete(Follow).where(Follow.follower_id == follower_id, Follow.followee_id == followee_id)
         async with session() as async_session:
             async with async_session.begin():
-                qs = await async_session.execute(query)
-                user = qs.scalars().first()
-                if user:
-                    logger.info(event="существование api-key подтверждено")
-                    return True
-                logger.info(event="api-key не существует")
-                return False
+                qs = await async_session.execute(
+                    select(Author.id).where(Author.id.in_(authors)).order_by(Author.id).with_for_update()
+                )
+                if len(qs.all()) < 2:
+                    return None
+                if (await async_session.execute(query.returning(Follow.follower_id))).first() is None:
+                    return False
+                if delta < 0:
+                    await async_session.execute(
+                        delete(TIMELINES).where(
+                            TIMELINES.c.owner_id == follower_id,
+                            TIMELINES.c.tweet_id.in_(select(TWEETS.c.id).where(TWEETS.c.author_id == followee_id)),
+                        )
+                    )
+                await async_session.execute(
+                    update(Author)
+                    .where(Author.id.in_(authors))
+                    .values(
+                        following_count=Author.following_count + case((Author.id == follower_id, delta), else_=0),
+                        follower_count=Author.follower_count + case((Author.id == followee_id, delta), else_=0),
+                        version=AUTHOR_VERSIONS.next_value(),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+        await cache_backend.delete(author_key(follower_id), author_key(followee_id))
+        logger.info(event="подписки изменены", follower_id=follower_id, followee_id=followee_id, delta=delta)
+        return True
+
+    @staticmethod
+    async def _cache_authors(authors: List[AuthorModelSchema]) -> None:
+        """Внутренний метод сохраняет профили авторов без паролей и api-key и соответствие api-key автору
+        в кэш одним обращением к хранилищу.
+        """
+        items = {}
+        for author in authors:
+            principal = AuthorPrincipalSchema(id=author.id, name=author.name, api_key=author.api_key)
+            api_key_cache.set(author.api_key, principal)
+            items[auth_key(author.api_key)] = principal.json()
+            items[author_key(author.id)] = cached_profile(author).json()
+        await cache_backend.set_many(items, ttl=TTL)
@@ -9,8 +9,11 @@ import typing as t
 from abc import ABC, abstractmethod
 
 from app_users.models import Author
-from app_users.schemas import AuthorBaseSchema, AuthorProfileApiSchema
-from schemas import SuccessSchema
+from app_users.schemas import (
+    AuthorCachedSchema,
+    AuthorPrincipalSchema,
+    AuthorProfileApiSchema,
+)
 
 
 class AbstractAuthorService(ABC):
@@ -31,6 +34,39 @@ class AbstractAuthorService(ABC):
         """
         ...
 
+    @abstractmethod
+    async def get_authors(self, ids: t.List[int]) -> t.List[AuthorCachedSchema]:
+        """Абстрактный метод получения авторов по списку идентификаторов.
+
+        Parameters
+        ----------
+        ids: List[int]
+            Список идентификаторов авторов в СУБД.
+        """
+        ...
+
+    @abstractmethod
+    async def get_version(self, author_id: int) -> t.Optional[int]:
+        """Абстрактный метод получения версии профиля автора.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор автора в СУБД.
+        """
+        ...
+
+    @abstractmethod
+    async def get_principal(self, api_key: str) -> t.Optional[AuthorPrincipalSchema]:
+        """Абстрактный метод получения автора запроса по api-key.
+
+        Parameters
+        ----------
+        api_key: str
+            Уникальный ключ фронтенда.
+        """
+        ...
+
     @abstractmethod
     async def create_author(self, name: str, api_key: str, password: str) -> t.Optional[Author]:
         """Абстрактный метод создания автора
@@ -47,24 +83,38 @@ class AbstractAuthorService(ABC):
         ...
 
     @abstractmethod
-    async def update_follow(
-        self,
-        reading_author: AuthorBaseSchema,
-        writing_author: AuthorBaseSchema,
-        followers: dict,
-        following: dict,
-    ) -> SuccessSchema:
-        """Адстрактный метод создаёт связи между читающим и пишущим авторами.
+    async def follow(self, follower_id: int, followee_id: int) -> t.Optional[bool]:
+        """Абстрактный метод подписывает читающего автора на пишущего.
+
+        Parameters
+        ----------
+        follower_id: int
+            Идентификатор читающего автора.
+        followee_id: int
+            Идентификатор пишущего автора.
+        """
+        ...
+
+    @abstractmethod
+    async def unfollow(self, follower_id: int, followee_id: int) -> t.Optional[bool]:
+        """Абстрактный метод отписывает читающего автора от пишущего.
+
+        Parameters
+        ----------
+        follower_id: int
+            Идентификатор читающего автора.
+        followee_id: int
+            Идентификатор пишущего автора.
+        """
+        ...
+
+    @abstractmethod
+    async def get_followee_ids(self, author_id: int) -> t.List[int]:
+        """Абстрактный метод возвращает идентификаторы авторов, которых читает автор.
 
         Parameters
         ----------
-        reading_author: ProfileAuthorSchema
-            Профиль читающего автора.
-        writing_author: ProfileAuthorSchema
-            Профиль пишущего автора.
-        followers: dict
-            Словарь всех писателей пользователя.
-        following: dict
-            Сроварь всех читателей пользователя.
+        author_id: int
+            Идентификатор читающего автора.
         """
         ...
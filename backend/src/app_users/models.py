@@ -2,14 +2,26 @@
 models.py
 =========
 
-Модуль описывает ОРМ-модели авторов для SQLAlchemy.
+Модуль описывает ОРМ-модели авторов и подписок для SQLAlchemy.
 """
-from sqlalchemy import Boolean, Column, Integer, String
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    CheckConstraint,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    Sequence,
+    String,
+    text,
+)
 from sqlalchemy.orm import relationship
 
 from db import Base
 
+AUTHOR_VERSIONS = Sequence("author_versions", metadata=Base.metadata)
+
 
 class Author(Base):
     """Модель автора твита.
@@ -24,14 +36,25 @@ class Author(Base):
         Хэш пароля автора.
     api_key: str
         Идентификатор автора для фронтенда.
-    followers: dict
-        Кто читает автора.
-    following: dict
-        Кого читает автор.
+    follower_count: int
+        Денормализованное число читателей автора.
+    following_count: int
+        Денормализованное число авторов, которых читает автор.
     soft_delete: bool
         Флаг мягкого удаления автора.
     tweets: int
         Связь с ОРМ моделью твитов.
+    version: int
+        Версия профиля из последовательности ``author_versions``. Назначается заново при каждой подписке
+        и отписке автора и на автора.
+    tweets_version: int
+        Версия твитов автора из той же последовательности. Назначается заново при создании, удалении,
+        лайке и дизлайке любого твита автора.
+
+    Note
+    ----
+    Версии служат валидаторами ``ETag`` профиля и списка твитов автора: чтобы ответить 304 на условный запрос,
+    достаточно прочитать одно число по первичному ключу.
     """
 
     __tablename__ = "authors"
@@ -39,11 +62,41 @@ class Author(Base):
     name = Column(String(100), index=True, unique=True)
     password = Column(String(100), index=True, unique=False)
     api_key = Column(String(100), index=True, unique=True)
-    follower_count = Column(Integer, default=0)
-    followers = Column(JSONB, default=list())
-    following = Column(JSONB, default=list())
+    follower_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    following_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
     soft_delete = Column(Boolean, default=False)
     tweets = relationship("Tweet", back_populates="author")
+    version = Column(BigInteger, nullable=False, server_default=AUTHOR_VERSIONS.next_value())
+    tweets_version = Column(BigInteger, nullable=False, server_default=AUTHOR_VERSIONS.next_value())
 
     def __repr__(self):
         return f"{self.id} :: {self.name}"
+
+
+class Follow(Base):
+    """Модель подписки читателя на автора.
+
+    Arguments
+    ---------
+    follower_id: int
+        Идентификатор читающего автора.
+    followee_id: int
+        Идентификатор автора, которого читают.
+
+    Note
+    ----
+    Первичный ключ ``(follower_id, followee_id)`` служит индексом авторов, которых читает автор, и не даёт
+    подписаться дважды даже при конкурентных запросах. Индекс ``(followee_id, follower_id)`` отдаёт читателей
+    автора для раскладки твитов по лентам.
+
+    В профиле API списки названы наоборот: ``followers`` - авторы, которых читает автор, ``following`` - его
+    читатели. Схема ответа сохранена ради совместимости с фронтендом.
+    """
+
+    __tablename__ = "follows"
+    __table_args__ = (
+        Index("ix_follows_followee_id_follower_id", "followee_id", "follower_id"),
+        CheckConstraint("follower_id <> followee_id", name="ck_follows_not_self"),
+    )
+    follower_id = Column(Integer, ForeignKey("authors.id", ondelete="CASCADE"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("authors.id", ondelete="CASCADE"), primary_key=True)
@@ -10,7 +10,7 @@ Note
 """
 import typing as t
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class AuthorModelSchema(BaseModel):
@@ -20,10 +20,28 @@ class AuthorModelSchema(BaseModel):
     name: str
     password: str
     api_key: str
-    follower_count: int
+    follower_count: int = 0
+    following_count: int = 0
     followers: list = None
     following: list = None
     soft_delete: bool = False
+    version: t.Optional[int] = None
+
+    class Config:
+        orm_mode = True
+
+
+class AuthorCachedSchema(BaseModel):
+    """схема профиля автора в общем кэше: без пароля и api-key"""
+
+    id: int
+    name: str
+    follower_count: int = 0
+    following_count: int = 0
+    followers: list = None
+    following: list = None
+    soft_delete: bool = False
+    version: t.Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -35,6 +53,15 @@ class AuthorBaseSchema(BaseModel):
     id: int
     name: str
 
+    class Config:
+        orm_mode = True
+
+
+class AuthorPrincipalSchema(AuthorBaseSchema):
+    """автор, выполняющий запрос. определяется один раз при проверке api-key"""
+
+    api_key: str
+
 
 class AuthorLikeSchema(BaseModel):
     """короткая схема"""
@@ -42,12 +69,16 @@ class AuthorLikeSchema(BaseModel):
     user_id: int
     name: str
 
+    class Config:
+        orm_mode = True
+
 
 class AuthorProfileSchema(AuthorBaseSchema):
     """полная схема"""
 
     followers: t.Optional[t.List[AuthorBaseSchema]]
     following: t.Optional[t.List[AuthorBaseSchema]]
+    version: t.Optional[int] = Field(default=None, exclude=True)
 
 
 class AuthorProfileApiSchema(BaseModel):
@@ -57,6 +88,23 @@ class AuthorProfileApiSchema(BaseModel):
     user: AuthorProfileSchema
 
 
+class AuthorItemSchema(BaseModel):
+    """автор из выборки по списку идентификаторов"""
+
+    id: int
+    result: bool
+    user: t.Optional[AuthorProfileSchema]
+    error_type: t.Optional[str]
+    error_message: t.Optional[str]
+
+
+class AuthorItemsOutSchema(BaseModel):
+    """схема выборки авторов по списку идентификаторов для вывода апи"""
+
+    result: bool = True
+    users: t.List[AuthorItemSchema]
+
+
 class AuthorRegisterSchema(BaseModel):
     """регистрация автора"""
 
@@ -5,10 +5,19 @@ services.py
 
 pwd_context: CryptContext
     Мощное колдунство по борьбе с паролями.
+password_hasher: PasswordHasher
+    Пул потоков или процессов, в котором считаются хэши паролей.
+request_principal: ContextVar
+    Автор текущего запроса. Определяется один раз в зависимости проверки api-key и переиспользуется сервисами.
 
 """
+import asyncio
 import random
 import string
+import time
+import typing as t
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
 from typing import Optional
 
 import structlog
@@ -19,17 +28,164 @@ from pydantic import ValidationError
 
 from app_users.db_services import AuthorDbService as AuthorTransportService
 from app_users.schemas import (
-    AuthorBaseSchema,
-    AuthorModelSchema,
+    AuthorCachedSchema,
+    AuthorItemSchema,
+    AuthorItemsOutSchema,
+    AuthorPrincipalSchema,
     AuthorProfileApiSchema,
     AuthorProfileSchema,
 )
-from exceptions import AuthException, BackendException, ErrorsList
+from exceptions import (
+    AuthException,
+    BackendException,
+    ErrorsList,
+    ServiceUnavailableException,
+)
+from loaders import DataLoader, get_loader
+from pagination import parse_ids
 from schemas import SuccessSchema
+from settings import settings
 
 logger = structlog.get_logger()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+request_principal: ContextVar[Optional[AuthorPrincipalSchema]] = ContextVar("request_principal", default=None)
+
+
+def _hash_password(raw_password: str) -> str:
+    """Функция считает хэш пароля. Вынесена на уровень модуля, чтобы её можно было передать в пул процессов."""
+    return pwd_context.hash(raw_password)
+
+
+def _verify_password(raw_password: str, hashed_password: str) -> bool:
+    """Функция сверяет пароль с хэшем. Вынесена на уровень модуля, чтобы её можно было передать в пул процессов."""
+    return pwd_context.verify(raw_password, hashed_password)
+
+
+async def _load_authors(ids: t.List[int]) -> t.Dict[int, AuthorCachedSchema]:
+    """Функция пакетной загрузки авторов для ``author_loader``."""
+    return {author.id: author for author in await AuthorTransportService().get_authors(ids)}
+
+
+def author_loader() -> DataLoader:
+    """Функция возвращает загрузчик авторов по идентификаторам текущего HTTP-запроса."""
+    return get_loader("author", _load_authors)
+
+
+class PasswordHasher:
+    """Класс выполняет расчёт хэшей bcrypt вне цикла событий.
+
+    Parameters
+    ----------
+    executor_type: str
+        Тип пула: ``thread`` или ``process``.
+    workers: int
+        Размер пула.
+    concurrency: int
+        Максимальное количество одновременно считаемых хэшей. Остальные запросы ждут в очереди.
+    queue_timeout: float
+        Максимальное время ожидания в очереди в секундах. По истечении запрос отклоняется.
+
+    Attributes
+    ----------
+    waiting: int
+        Количество запросов в очереди.
+    active: int
+        Количество хэшей, считаемых прямо сейчас.
+    completed: int
+        Количество посчитанных хэшей.
+    rejected: int
+        Количество запросов, отклонённых по таймауту очереди.
+    max_wait: float
+        Максимальное время ожидания в очереди в секундах.
+    """
+
+    def __init__(self, executor_type: str, workers: int, concurrency: int, queue_timeout: float) -> None:
+        self.executor_type = executor_type
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._executor: t.Optional[Executor] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def executor(self) -> Executor:
+        """Пул создаётся при первом обращении, уже внутри воркера gunicorn."""
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, func: t.Callable, *args: t.Any) -> t.Any:
+        """Метод выполняет функцию в пуле, соблюдая ограничение одновременных вычислений.
+
+        Raises
+        ------
+        ServiceUnavailableException
+            Запрос простоял в очереди дольше ``queue_timeout``.
+        """
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.error(event="очередь расчёта хэшей переполнена", stats=self.stats())
+            raise ServiceUnavailableException(**ErrorsList.password_hash_busy)
+        finally:
+            self.waiting -= 1
+        wait = time.monotonic() - started
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.active += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, raw_password: str) -> str:
+        """Метод считает хэш пароля в пуле."""
+        return await self.run(_hash_password, raw_password)
+
+    async def verify(self, raw_password: str, hashed_password: str) -> bool:
+        """Метод сверяет пароль с хэшем в пуле."""
+        return await self.run(_verify_password, raw_password, hashed_password)
+
+    def stats(self) -> dict:
+        """Метод возвращает метрики очереди расчёта хэшей.
+
+        Returns
+        -------
+        dict
+            Словарь с длиной очереди, количеством активных, посчитанных и отклонённых расчётов и временем ожидания.
+        """
+        return dict(
+            executor=self.executor_type,
+            workers=self.workers,
+            waiting=self.waiting,
+            active=self.active,
+            completed=self.completed,
+            rejected=self.rejected,
+            avg_wait=self.total_wait / self.completed if self.completed else 0.0,
+            max_wait=self.max_wait,
+        )
+
+
+password_hasher = PasswordHasher(
+    executor_type=settings.password_hash_executor,
+    workers=settings.password_hash_workers,
+    concurrency=settings.password_hash_concurrency,
+    queue_timeout=settings.password_hash_queue_timeout,
+)
 
 
 class PermissionService:
@@ -48,6 +204,7 @@ class PermissionService:
         self.request = request
         self.response = response
         self.service = AuthorTransportService()
+        self.principal = None
         if api_key := self.request.headers.get("api-key"):
             structlog.contextvars.bind_contextvars(api_key=api_key)
             logger.info(event="получен api_key из заголовка запроса")
@@ -74,7 +231,7 @@ class PermissionService:
         raise AuthException(**ErrorsList.not_authorized)
 
     @staticmethod
-    def hash_password(raw_password: str) -> str:
+    async def hash_password(raw_password: str) -> str:
         """Метод рассчитывает хеш для сырого пароля.
 
         Parameters
@@ -87,12 +244,12 @@ class PermissionService:
         str, optional
             Хэш пароля.
         """
-        result = pwd_context.hash(raw_password)
-        logger.info(event="сделали хэш пароля", password=result)
+        result = await password_hasher.hash(raw_password)
+        logger.info(event="сделали хэш пароля", password=result, hasher=password_hasher.stats())
         return result
 
     @staticmethod
-    def verify_password(raw_password: str, hashed_password: str) -> bool:
+    async def verify_password(raw_password: str, hashed_password: str) -> bool:
         """Метод сравнивает хэш сырого пароля с сохраненным хэшем пользователя в базе данных.
 
         Parameters
@@ -107,12 +264,12 @@ class PermissionService:
         bool
             True если хэш совпал, иначе Else.
         """
-        result = pwd_context.verify(raw_password, hashed_password)
-        logger.info(event="результат проверки пароля", result=result)
+        result = await password_hasher.verify(raw_password, hashed_password)
+        logger.info(event="результат проверки пароля", result=result, hasher=password_hasher.stats())
         return result
 
     async def verify_api_key(self, api_key: str) -> bool:
-        """Метод проверяет наличие ключа в СУБД.
+        """Метод проверяет наличие ключа в СУБД и запоминает автора запроса.
 
         Parameters
         ----------
@@ -123,8 +280,15 @@ class PermissionService:
         -------
         bool
             True если api-key совпал, иначе Else.
+
+        Note
+        ----
+        Автор запроса сохраняется в ``self.principal`` и в ``request_principal``. Экземпляр PermissionService
+        один на запрос, а сервисы бизнес-логики берут автора из ``request_principal`` и не ходят за ним в СУБД.
         """
-        result = await self.service.verify_api_key_exist(api_key)
+        self.principal = await self.service.get_principal(api_key)
+        request_principal.set(self.principal)
+        result = self.principal is not None
         logger.info(event="проверка существования api-key в СУБД", result=result)
         return result
 
@@ -142,6 +306,31 @@ class AuthorService:
         """
         self.service = AuthorTransportService()
 
+    async def get_principal(self, api_key: str) -> AuthorPrincipalSchema:
+        """Метод возвращает автора запроса по api-key.
+
+        Parameters
+        ----------
+        api_key: str
+            Уникальный идентификатор от фронтенда.
+
+        Returns
+        -------
+        AuthorPrincipalSchema
+            Pydantic-схема автора запроса.
+
+        Note
+        ----
+        Если api-key уже проверен в текущем запросе, автор берётся из ``request_principal`` без обращения к СУБД.
+        """
+        principal = request_principal.get()
+        if principal is None or principal.api_key != api_key:
+            principal = await self.service.get_principal(api_key)
+        if principal is None:
+            logger.warning(event="не нашли автора по api-key")
+            raise BackendException(**ErrorsList.author_not_exists)
+        return principal
+
     async def get_or_create_user(self, name: str, password: str) -> tuple:
         """Метод получает или создаёт пользователя.
 
@@ -159,14 +348,14 @@ class AuthorService:
         """
         if author := await self.service.get_author(name=name):
             logger.info(event="автор уже существует. выполняем авторизацию.", name=name)
-            if PermissionService.verify_password(password, author.password):
+            if await PermissionService.verify_password(password, author.password):
                 logger.info("пароль совпал. возврат api-key и флага творения автора", flag=False)
                 return author.api_key, False
             logger.warning(event="введён неверный пароль")
             raise AuthException(**ErrorsList.not_authorized)
         else:
             api_key = self.generate_api_key(64)
-            if await self.service.create_author(name, api_key, PermissionService.hash_password(password)):
+            if await self.service.create_author(name, api_key, await PermissionService.hash_password(password)):
                 logger.info(event="создан новый автор", name=name, password=password, flag=True)
                 return api_key, True
 
@@ -184,11 +373,12 @@ class AuthorService:
         ProfileAuthorOutSchema
             Pydantic-схема профиля пользователя.
         """
-        if user := await self.service.get_author(api_key=api_key):
+        principal = await self.get_principal(api_key)
+        if user := await author_loader().load(principal.id):
             try:
                 result = AuthorProfileApiSchema(
                     result=True,
-                    user=AuthorProfileSchema(**user.dict(include={"id", "name", "followers", "following"})),
+                    user=AuthorProfileSchema(**user.dict(include={"id", "name", "followers", "following", "version"})),
                 )
             except ValidationError as e:
                 logger.exception(event="ошибка сериализации", exc_info=e)
@@ -199,6 +389,22 @@ class AuthorService:
         logger.warning(event="не нашли юзера по api-key")
         raise BackendException(**ErrorsList.author_not_exists)
 
+    async def get_version(self, api_key: str) -> Optional[int]:
+        """Метод возвращает версию профиля текущего пользователя для валидатора ``ETag``.
+
+        Parameters
+        ----------
+        api_key: str
+            Уникальный идентификатор от фронтенда.
+
+        Returns
+        -------
+        int, optional
+            Версия профиля.
+        """
+        principal = await self.get_principal(api_key)
+        return await self.service.get_version(author_id=principal.id)
+
     async def get_author(self, author_id: int = None, api_key: str = None, name: str = None) -> AuthorProfileApiSchema:
         """Метод возвращает информацио о пользователе по одному из параметров.
 
@@ -215,13 +421,22 @@ class AuthorService:
         -------
         ProfileAuthorOutSchema
             Pydantic-схема профиля пользователя.
+
+        Note
+        ----
+        Автор по одному идентификатору запрашивается через загрузчик запроса: параллельные запросы авторов
+        собираются в один запрос к СУБД, а повторные берутся из памяти загрузчика.
         """
         logger.info("запрос автора по параметрам", author_id=author_id, api_key=api_key, name=name)
-        if user := await self.service.get_author(author_id, api_key, name):
+        if author_id is not None and api_key is None and name is None:
+            user = await author_loader().load(author_id)
+        else:
+            user = await self.service.get_author(author_id, api_key, name)
+        if user:
             try:
                 result = AuthorProfileApiSchema(
                     result=True,
-                    user=AuthorProfileSchema(**user.dict(include={"id", "name", "followers", "following"})),
+                    user=AuthorProfileSchema(**user.dict(include={"id", "name", "followers", "following", "version"})),
                 )
             except ValidationError as e:
                 logger.exception(event="ошибка сериализации", exc_info=e)
@@ -232,8 +447,40 @@ class AuthorService:
         logger.error("пользователь не найден")
         raise BackendException(**ErrorsList.postgres_query_error)
 
+    async def get_authors(self, ids: str) -> AuthorItemsOutSchema:
+        """Метод возвращает профили авторов по списку идентификаторов.
+
+        Parameters
+        ----------
+        ids: str
+            Идентификаторы авторов через запятую, не больше ``multi_get_max``.
+
+        Returns
+        -------
+        AuthorItemsOutSchema
+            Pydantic-схема с результатом по каждому идентификатору в порядке запроса.
+
+        Note
+        ----
+        Авторы загружаются одной пачкой загрузчика запроса. Ненайденный автор не мешает выдаче остальных.
+        """
+        author_ids = parse_ids(ids)
+        users = await author_loader().load_many(author_ids)
+        items = [
+            AuthorItemSchema(
+                id=author_id,
+                result=True,
+                user=AuthorProfileSchema(**user.dict(include={"id", "name", "followers", "following", "version"})),
+            )
+            if user
+            else AuthorItemSchema(id=author_id, result=False, **ErrorsList.author_not_exists)
+            for author_id, user in zip(author_ids, users)
+        ]
+        logger.info(event="запрос авторов по списку", count=len(author_ids))
+        return AuthorItemsOutSchema(result=True, users=items)
+
     async def add_follow(self, writing_author_id: int, api_key: str) -> SuccessSchema:
-        """Метод добавляет читателя к пишущему автору, а писателя - в список авторов читателя.
+        """Метод подписывает текущего пользователя на пишущего автора. Повторная подписка ничего не меняет.
 
         Parameters
         ----------
@@ -248,37 +495,12 @@ class AuthorService:
             Pydantic-схема успешной операции
         """
         logger.info("добавим follower")
-        reading_author = await self.service.get_author(api_key=api_key)
-        writing_author = await self.service.get_author(author_id=writing_author_id)
-        self._check_follower_authors(reading_author, writing_author)
-
-        followers = reading_author.followers
-        new_follower = AuthorBaseSchema(id=writing_author.id, name=writing_author.name)
-        if new_follower not in followers:
-            followers.append(new_follower.dict())
-        following = writing_author.following
-        new_following = AuthorBaseSchema(id=reading_author.id, name=reading_author.name)
-        if new_following not in following:
-            following.append(new_following.dict())
-
-        result = await self.service.update_follow(
-            reading_author=reading_author,
-            writing_author=writing_author,
-            followers=followers,
-            following=following,
-        )
-        logger.info(
-            event="добавлен фоловер",
-            result=result,
-            new_follower=new_follower.dict(),
-            new_following=new_following.dict,
-            followers=followers,
-            following=following,
-        )
-        return result
+        reading_author = await self._get_reading_author(writing_author_id, api_key)
+        changed = await self.service.follow(reading_author.id, writing_author_id)
+        return self._follow_result(changed, reading_author.id, writing_author_id, event="добавлен фоловер")
 
     async def remove_follow(self, writing_author_id: int, api_key: str) -> SuccessSchema:
-        """Метод удаляет читателя из списка читателей пишущего автора, а писателя из список авторов у читателя.
+        """Метод отписывает текущего пользователя от пишущего автора. Повторная отписка ничего не меняет.
 
         Parameters
         ----------
@@ -293,36 +515,19 @@ class AuthorService:
             Pydantic-схема успешной операции
         """
         logger.info("удалим follower")
-        reading_author = await self.service.get_author(api_key=api_key)
-        writing_author = await self.service.get_author(author_id=writing_author_id)
-        self._check_follower_authors(reading_author, writing_author)
-        followers = reading_author.dict(include={"followers"}).get("followers", [])
-
-        new_follower = AuthorBaseSchema(id=writing_author.id, name=writing_author.name)
-        if new_follower.dict() in followers:
-            followers.remove(new_follower.dict())
-
-        following = writing_author.dict(include={"following"}).get("following", [])
-        new_following = AuthorBaseSchema(id=reading_author.id, name=reading_author.name)
-        if new_following.dict() in following:
-            following.remove(new_following.dict())
-
-        result = await self.service.update_follow(
-            reading_author=reading_author,
-            writing_author=writing_author,
-            followers=followers,
-            following=following,
-        )
-        logger.info(
-            event="удалён фоловер",
-            result=result,
-            new_follower=new_follower.dict(),
-            new_following=new_following.dict,
-            followers=followers,
-            following=following,
-        )
+        reading_author = await self._get_reading_author(writing_author_id, api_key)
+        changed = await self.service.unfollow(reading_author.id, writing_author_id)
+        return self._follow_result(changed, reading_author.id, writing_author_id, event="удалён фоловер")
 
-        return result
+    async def get_followee_ids(self, author_id: int) -> t.List[int]:
+        """Метод возвращает идентификаторы авторов, которых читает автор.
+
+        Parameters
+        ----------
+        author_id: int
+            Идентификатор читающего автора в базе данных.
+        """
+        return await self.service.get_followee_ids(author_id)
 
     def generate_api_key(self, length: int) -> str:
         """Метод генерирует строку заданной длины случайных символов.
@@ -342,29 +547,41 @@ class AuthorService:
         logger.info(event="генерация нового ключа", key=key)
         return key
 
-    def _check_follower_authors(
-        self,
-        reading_author: Optional[AuthorModelSchema],
-        writing_author: Optional[AuthorModelSchema],
-    ):
+    async def _get_reading_author(self, writing_author_id: int, api_key: str) -> AuthorPrincipalSchema:
         """
-        Внутренний метод проверки авторов перед установлением связей.
-        Проверяет существование авторов и ссылки автора на самого себя.
+        Внутренний метод возвращает читающего автора и проверяет, что он не подписывается сам на себя.
 
         Raises
         ------
         RecursiveFollowerException
             Подписка автора на самого себя
         AuthorNotExistsException
-            Операции с несуществующими авторами
+            Api-key не принадлежит ни одному автору
         """
-        if reading_author:
-            logger.info(event="передан читающий автор", reading_author=reading_author.dict())
-        if writing_author:
-            logger.info(event="передан пишущий автор", writing_author=writing_author.dict())
-        if reading_author is None or writing_author is None:
-            logger.error(event="нет читающего или пишущего автора")
-            raise BackendException(**ErrorsList.recursive_follow)
-        if reading_author.id == writing_author.id:
+        reading_author = await self.get_principal(api_key)
+        if reading_author.id == writing_author_id:
             logger.error(event="автор follow-ит сам себя")
             raise BackendException(**ErrorsList.recursive_follow)
+        return reading_author
+
+    @staticmethod
+    def _follow_result(
+        changed: Optional[bool], reading_author_id: int, writing_author_id: int, event: str
+    ) -> SuccessSchema:
+        """
+        Внутренний метод проверяет результат подписки или отписки и забывает изменённые профили в загрузчике запроса.
+
+        Raises
+        ------
+        RecursiveFollowerException
+            Пишущего автора не существует
+        """
+        if changed is None:
+            logger.error(event="нет читающего или пишущего автора", writing_author_id=writing_author_id)
+            raise BackendException(**ErrorsList.recursive_follow)
+        if changed:
+            author_loader().clear(reading_author_id, writing_author_id)
+        logger.info(
+            event=event, reading_author_id=reading_author_id, writing_author_id=writing_author_id, changed=changed
+        )
+        return SuccessSchema()
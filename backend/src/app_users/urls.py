@@ -5,12 +5,26 @@ urls.py
 
 """
 import structlog
-from fastapi import APIRouter, Depends, Request, status
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse
 
-from app_users.schemas import AuthorProfileApiSchema, AuthorRegisterSchema
+from app_users.schemas import (
+    AuthorItemsOutSchema,
+    AuthorProfileApiSchema,
+    AuthorRegisterSchema,
+)
 from app_users.services import AuthorService, PermissionService
 from log_fab import make_context
+from responses import (
+    forward_headers,
+    make_etag,
+    not_modified,
+    orjson_response,
+    revalidating,
+    validator_headers,
+)
 from schemas import SuccessSchema
+from settings import settings
 
 router = APIRouter()
 
@@ -56,8 +70,9 @@ async def me(
     request: Request,
     user: AuthorService = Depends(),
     permission: PermissionService = Depends(),
-) -> AuthorProfileApiSchema:
-    """Эндпоинт возвращает информацию о текущем пользователе.
+) -> Response:
+    """Эндпоинт возвращает информацию о текущем пользователе. Валидатор возвращается в заголовке ``ETag``,
+    и если подписки пользователя не менялись с ``If-None-Match``, возвращается пустой ответ 304.
 
     Parameters
     ----------
@@ -68,14 +83,46 @@ async def me(
 
     Returns
     -------
-    ProfileAuthorOutSchema
-        pydantic-схема профиля пользователя.
+    Response
+        Сериализованная pydantic-схема профиля пользователя или ответ 304.
     """
     make_context(request)
     api_key = await permission.get_api_key()
+    headers = forward_headers(permission.response)
+    if revalidating(request):
+        if response := not_modified(request, make_etag("author", await user.get_version(api_key)), headers):
+            logger.info("профиль не изменился")
+            return response
     result = await user.me(api_key)
     logger.info("эндпоинт завершен", result=result.dict())
-    return result
+    return orjson_response(result, headers=validator_headers(make_etag("author", result.user.version), headers))
+
+
+@router.get("/api/users", status_code=status.HTTP_200_OK, response_model=AuthorItemsOutSchema, tags=["users"])
+async def get_authors_by_ids(
+    request: Request,
+    ids: str = Query(max_length=settings.multi_get_max * 12),
+    user: AuthorService = Depends(),
+) -> ORJSONResponse:
+    """Эндпоинт возвращает профили авторов по списку идентификаторов.
+    Каждый ненайденный автор получает свою ошибку, а не 404 на весь запрос.
+
+    Parameters
+    ----------
+    ids: str
+        Идентификаторы авторов через запятую, не больше ``multi_get_max``.
+    user: AuthorService
+        Зависимость реализующая бизнес-логику для работы с пользователями.
+
+    Returns
+    -------
+    ORJSONResponse
+        Сериализованная pydantic-схема профилей авторов.
+    """
+    make_context(request)
+    result = await user.get_authors(ids)
+    logger.info("эндпоинт завершен", count=len(result.users))
+    return orjson_response(result)
 
 
 @router.get(
@@ -86,7 +133,7 @@ async def get_author_by_id(
     author_id: int,
     user: AuthorService = Depends(),
     permission: PermissionService = Depends(),
-) -> AuthorProfileApiSchema:
+) -> ORJSONResponse:
     """Эндпоинт возвращает автора по идентификатору в базе данных.
 
     Parameters
@@ -100,15 +147,15 @@ async def get_author_by_id(
 
     Returns
     -------
-    ProfileAuthorOutSchema
-        pydantic-схема профиля пользователя.
+    ORJSONResponse
+        Сериализованная pydantic-схема профиля пользователя.
 
     """
     make_context(request)
     await permission.get_api_key()
     result = await user.get_author(author_id=author_id)
     logger.info("эндпоинт завершен", result=result.dict())
-    return result
+    return orjson_response(result, headers=forward_headers(permission.response))
 
 
 @router.post(
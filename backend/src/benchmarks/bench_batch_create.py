@@ -0,0 +1,48 @@
+"""
+bench_batch_create.py
+---------------------
+
+Сравнение пропускной способности пакетной загрузки твитов с созданием по одному.
+
+Examples
+--------
+Запуск из каталога backend/src на базе из настроек приложения::
+
+    $ python -m benchmarks.bench_batch_create --count 5000 --batch 500
+"""
+import argparse
+import asyncio
+import secrets
+import time
+
+from app_tweets.db_services import TweetDbService
+from app_tweets.schemas import TweetInSchema
+from app_users.db_services import AuthorDbService
+
+
+async def main(count: int, batch: int) -> None:
+    api_key = secrets.token_hex(32)
+    author = await AuthorDbService().create_author(name=f"bench-{api_key[:8]}", api_key=api_key, password="-")
+    service = TweetDbService()
+    tweets = [TweetInSchema(tweet_data=f"твит номер {index}", tweet_media_ids=[]) for index in range(count)]
+
+    started = time.perf_counter()
+    for new_tweet in tweets:
+        await service.create_tweet(new_tweet, author.id, media_ids=new_tweet.tweet_media_ids)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for offset in range(0, count, batch):
+        await service.create_tweets(tweets[offset : offset + batch], author.id)
+    batched = time.perf_counter() - started
+
+    print(f"по одному: {count / single:10.0f} твитов/с")
+    print(f"пачками по {batch}: {count / batched:10.0f} твитов/с ({single / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.count, args.batch))
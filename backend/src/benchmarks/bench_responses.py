@@ -0,0 +1,85 @@
+"""
+bench_responses.py
+------------------
+
+Сравнение процессорного времени на сериализацию списка твитов стандартным путём FastAPI
+(валидация по ``response_model``, ``jsonable_encoder``, ``json``), быстрым путём ``orjson_response``
+и склейкой из прогретого кэша отрисованных твитов ``tweet_list_response``.
+
+Examples
+--------
+Запуск из каталога backend/src, СУБД не нужна::
+
+    $ python -m benchmarks.bench_responses --tweets 500 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app_tweets.render import tweet_list_response
+from app_tweets.schemas import TweetListOutSchema, TweetSchema
+from app_users.schemas import AuthorBaseSchema, AuthorLikeSchema
+from responses import orjson_response
+
+
+def make_list(count: int) -> TweetListOutSchema:
+    tweets = [
+        TweetSchema(
+            id=index,
+            version=index,
+            content=f"твит номер {index} о том, кто роняет мишек на пол и отрывает мишкам лапы",
+            attachments=[f"/static/media/{index}-{number}.jpg" for number in range(index % 3)],
+            author=AuthorBaseSchema(id=index % 100, name=f"автор {index % 100}"),
+            likes=[AuthorLikeSchema(user_id=user_id, name=f"автор {user_id}") for user_id in range(index % 5)],
+        )
+        for index in range(count)
+    ]
+    return TweetListOutSchema(tweets=tweets, next_cursor="cursor")
+
+
+async def default_path(field, content: TweetListOutSchema) -> bytes:
+    return JSONResponse(await serialize_response(field=field, response_content=content, is_coroutine=True)).body
+
+
+async def fast_path(field, content: TweetListOutSchema) -> bytes:
+    return orjson_response(content).body
+
+
+async def fragment_path(field, content: TweetListOutSchema) -> bytes:
+    return tweet_list_response(content).body
+
+
+async def measure(render, field, content: TweetListOutSchema, requests: int) -> float:
+    started = time.process_time()
+    for _ in range(requests):
+        await render(field, content)
+    return (time.process_time() - started) / requests * 1000
+
+
+async def main(count: int, requests: int) -> None:
+    content = make_list(count)
+    field = create_response_field(name="Response_bench", type_=TweetListOutSchema)
+    default_body, fast_body = await default_path(field, content), await fast_path(field, content)
+    fragment_body = await fragment_path(field, content)
+    assert json.loads(default_body) == json.loads(fast_body) == json.loads(fragment_body)
+    default_ms = await measure(default_path, field, content, requests)
+    fast_ms = await measure(fast_path, field, content, requests)
+    fragment_ms = await measure(fragment_path, field, content, requests)
+    print(f"твитов в ответе: {count}, запросов: {requests}")
+    print(f"response_model + json: {default_ms:8.2f} мс CPU на запрос")
+    print(f"orjson_response:       {fast_ms:8.2f} мс CPU на запрос ({default_ms / fast_ms:.1f}x)")
+    print(f"кэш фрагментов:        {fragment_ms:8.2f} мс CPU на запрос ({default_ms / fragment_ms:.1f}x)")
+    print(f"сэкономлено:           {default_ms - fragment_ms:8.2f} мс CPU на запрос")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tweets", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.tweets, args.requests))
@@ -0,0 +1,82 @@
+"""
+bench_search.py
+---------------
+
+Замер задержки полнотекстового поиска твитов на засеянной базе.
+
+Examples
+--------
+Засеять миллион твитов и выполнить 500 поисковых запросов::
+
+    $ python -m benchmarks.bench_search --seed 1000000 --queries 500
+
+Повторный замер без засева::
+
+    $ python -m benchmarks.bench_search --queries 500
+"""
+import argparse
+import asyncio
+import random
+import secrets
+import statistics
+import time
+
+from faker import Faker
+from sqlalchemy import text
+
+from app_tweets.db_services import TweetDbService
+from app_users.db_services import AuthorDbService
+from db import session
+
+SEED_QUERY = text(
+    """
+    INSERT INTO tweets (content, author_id, attachments, soft_delete, like_count)
+    SELECT (
+        SELECT string_agg((CAST(:words AS text[]))[1 + floor(random() * CAST(:size AS int))::int], ' ')
+        FROM generate_series(1, 8 + g % 16)
+    ), :author_id, '[]'::jsonb, g % 50 = 0, 0
+    FROM generate_series(CAST(:start AS int), CAST(:stop AS int)) AS g
+    """
+)
+
+
+async def seed(count: int, words: list, chunk: int = 100000) -> None:
+    api_key = secrets.token_hex(32)
+    author = await AuthorDbService().create_author(name=f"bench-{api_key[:8]}", api_key=api_key, password="-")
+    for start in range(1, count + 1, chunk):
+        async with session() as async_session:
+            async with async_session.begin():
+                params = dict(
+                    words=words, size=len(words), author_id=author.id, start=start, stop=min(start + chunk - 1, count)
+                )
+                await async_session.execute(SEED_QUERY, params)
+        print(f"засеяно {min(start + chunk - 1, count)} твитов")
+    async with session() as async_session:
+        await async_session.execute(text("ANALYZE tweets"))
+
+
+async def main(seed_count: int, queries: int, limit: int) -> None:
+    words = sorted({word.lower() for word in Faker("ru_RU").words(3000)})
+    if seed_count:
+        await seed(seed_count, words)
+    service = TweetDbService()
+    timings = []
+    for _ in range(queries):
+        terms = " ".join(random.sample(words, random.choice((1, 1, 2))))
+        started = time.perf_counter()
+        found = await service.search(terms, limit=limit)
+        if len(found) == limit:
+            await service.search(terms, limit=limit, rank=found[-1][1], before_id=found[-1][0].id)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"запросов: {queries}, p50: {statistics.median(timings) * 1000:.1f} мс, p95: {p95 * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="сколько твитов засеять перед замером")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.seed, args.queries, args.limit))
@@ -0,0 +1,118 @@
+"""
+bench_tweet_projection.py
+-------------------------
+
+Сравнение задержки и памяти на чтение страницы твитов авторов с большим графом подписок:
+полная загрузка авторов (как до проекции ``TWEET_PROJECTION``) и проекция ``TweetDbService.get_list``.
+
+С переносом подписок в таблицу ``follows`` граф больше не хранится в строке автора, поэтому ``--followers``
+задаёт только счётчик читателей, а разница между загрузками сводится к остальным полям автора.
+
+Examples
+--------
+Запуск из каталога backend/src на базе из настроек приложения::
+
+    $ python -m benchmarks.bench_tweet_projection --followers 100000 --likers 1 --limit 20
+"""
+import argparse
+import asyncio
+import secrets
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import false, select, text
+from sqlalchemy.orm import selectinload
+
+from app_tweets.db_services import TweetDbService
+from app_tweets.models import Like, Tweet
+from app_tweets.schemas import TweetModelSchema
+from app_users.schemas import AuthorModelSchema
+from db import session
+
+SEED_AUTHOR = text(
+    """
+    INSERT INTO authors (name, password, api_key, follower_count, soft_delete)
+    VALUES (:name, 'x', :name, CAST(:count AS int), false)
+    RETURNING id
+    """
+)
+SEED_TWEETS = text(
+    """
+    INSERT INTO tweets (content, author_id, attachments, soft_delete, like_count)
+    SELECT 'твит номер ' || g, :author_id, '[]', false, 0 FROM generate_series(1, CAST(:count AS int)) AS g
+    RETURNING id
+    """
+)
+
+
+class FullTweetSchema(TweetModelSchema):
+    """Схема твита с полным автором, как до проекции."""
+
+    author: AuthorModelSchema = None
+
+
+async def seed(followers: int, likers: int, tweets: int) -> int:
+    prefix = f"bench-{secrets.token_hex(4)}"
+    async with session() as async_session:
+        async with async_session.begin():
+            names = [f"{prefix}-{index}" for index in range(likers + 1)]
+            ids = [
+                (await async_session.execute(SEED_AUTHOR, dict(name=name, count=followers))).scalar_one()
+                for name in names
+            ]
+            qs = await async_session.execute(SEED_TWEETS, dict(author_id=ids[0], count=tweets))
+            tweet_ids = qs.scalars().all()
+            likes = [dict(tweet_id=tweet_id, author_id=author_id) for tweet_id in tweet_ids for author_id in ids[1:]]
+            await async_session.execute(text("INSERT INTO likes VALUES (:tweet_id, :author_id)"), likes)
+    return ids[0]
+
+
+async def full_load(author_id: int, limit: int) -> list:
+    query = (
+        select(Tweet)
+        .where(Tweet.author_id == author_id, Tweet.soft_delete == false())
+        .order_by(Tweet.id.desc())
+        .limit(limit)
+        .options(selectinload(Tweet.author), selectinload(Tweet.likes).joinedload(Like.author))
+    )
+    async with session() as async_session:
+        async with async_session.begin():
+            qs = await async_session.execute(query)
+            return [FullTweetSchema.from_orm(item) for item in qs.scalars().all()]
+
+
+async def projected_load(author_id: int, limit: int) -> list:
+    return await TweetDbService().get_list(author_id=author_id, limit=limit)
+
+
+async def measure(load, author_id: int, limit: int, runs: int) -> tuple:
+    await load(author_id, limit)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await load(author_id, limit)
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    await load(author_id, limit)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+async def main(followers: int, likers: int, limit: int, runs: int) -> None:
+    author_id = await seed(followers, likers, limit)
+    print(f"автор и {likers} лайкающих с {followers} подписчиками, страница из {limit} твитов")
+    for title, load in (("полные авторы", full_load), ("проекция", projected_load)):
+        latency, peak = await measure(load, author_id, limit, runs)
+        print(f"{title:14}: p50 {latency:8.1f} мс, пик памяти {peak:8.1f} МиБ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--followers", type=int, default=100000)
+    parser.add_argument("--likers", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.followers, args.likers, args.limit, args.runs))
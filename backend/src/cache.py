@@ -0,0 +1,502 @@
+"""
+cache.py
+--------
+
+Модуль содержит кэши приложения: внутрипроцессный кэш с ограничением размера (LRU) и временем жизни записей (TTL),
+подключаемые хранилища кэша, общие для всех воркеров, и рассылку инвалидаций между воркерами.
+
+Note
+----
+    Внутрипроцессный кэш живёт в памяти одного воркера gunicorn и не требует блокировок: весь код приложения
+    выполняется в одном цикле событий, а методы кэша синхронные.
+
+Attributes
+----------
+cache_backend: AbstractCacheBackend
+    Хранилище кэша, выбранное в настройках ``cache_backend``: ``memory`` или ``redis``.
+"""
+import asyncio
+import json
+import os
+import time
+import typing as t
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import structlog
+from redis.exceptions import RedisError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from db import redis
+from settings import settings
+
+logger = structlog.get_logger()
+
+
+class TTLCache:
+    """Класс реализует ограниченный по размеру кэш с вытеснением давно не использованных записей.
+
+    Parameters
+    ----------
+    name: str
+        Имя кэша для логов и метрик.
+    maxsize: int
+        Максимальное количество записей. При переполнении вытесняется самая давно использованная запись.
+    ttl: float
+        Время жизни записи в секундах по умолчанию.
+
+    Attributes
+    ----------
+    hits: int
+        Количество попаданий в кэш.
+    misses: int
+        Количество промахов, включая просроченные записи.
+    evictions: int
+        Количество записей, вытесненных из-за переполнения.
+    expirations: int
+        Количество записей, удалённых по истечении времени жизни.
+    max_hit_age: float
+        Максимальный возраст записи в секундах, отданной из кэша. Показывает, насколько устаревшими могут быть ответы.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[t.Hashable, t.Tuple[float, float, t.Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.hit_age_sum = 0.0
+        self.max_hit_age = 0.0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: t.Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > time.monotonic()
+
+    def get(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        """Метод возвращает значение из кэша и помечает запись как недавно использованную.
+
+        Parameters
+        ----------
+        key: Hashable
+            Ключ записи.
+        default: Any
+            Значение, возвращаемое при промахе.
+
+        Returns
+        -------
+        Any
+            Закэшированное значение или ``default``.
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, stored_at, value = item
+        now = time.monotonic()
+        if expires_at <= now:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        self.hit_age_sum += now - stored_at
+        self.max_hit_age = max(self.max_hit_age, now - stored_at)
+        return value
+
+    def set(self, key: t.Hashable, value: t.Any, ttl: t.Optional[float] = None) -> None:
+        """Метод сохраняет значение в кэш.
+
+        Parameters
+        ----------
+        key: Hashable
+            Ключ записи.
+        value: Any
+            Сохраняемое значение.
+        ttl: float, optional
+            Время жизни записи в секундах. По умолчанию используется время жизни кэша.
+        """
+        now = time.monotonic()
+        self._data[key] = (now + (self.ttl if ttl is None else ttl), now, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: t.Hashable) -> bool:
+        """Метод удаляет запись из кэша.
+
+        Parameters
+        ----------
+        key: Hashable
+            Ключ записи.
+
+        Returns
+        -------
+        bool
+            True, если запись была в кэше.
+        """
+        if self._data.pop(key, None) is not None:
+            logger.info(event="запись удалена из кэша", cache=self.name)
+            return True
+        return False
+
+    def clear(self) -> None:
+        """Метод очищает кэш. Счётчики при этом сохраняются."""
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Метод возвращает счётчики кэша.
+
+        Returns
+        -------
+        dict
+            Словарь с размером кэша, счётчиками попаданий, промахов и вытеснений и возрастом отданных записей.
+        """
+        requests = self.hits + self.misses
+        return dict(
+            name=self.name,
+            size=len(self._data),
+            maxsize=self.maxsize,
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=round(self.hits / requests, 4) if requests else 0.0,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            avg_hit_age=round(self.hit_age_sum / self.hits, 4) if self.hits else 0.0,
+            max_hit_age=round(self.max_hit_age, 4),
+        )
+
+
+class AbstractCacheBackend(ABC):
+    """Абстрактный класс хранилища кэша. Значения хранятся в виде строк, сериализацией занимается вызывающий код."""
+
+    @abstractmethod
+    async def get(self, key: str) -> t.Optional[str]:
+        """Абстрактный метод возвращает значение по ключу.
+
+        Parameters
+        ----------
+        key: str
+            Ключ записи.
+        """
+        ...
+
+    @abstractmethod
+    async def get_many(self, keys: t.List[str]) -> t.List[t.Optional[str]]:
+        """Абстрактный метод возвращает значения по списку ключей за одно обращение к хранилищу.
+
+        Parameters
+        ----------
+        keys: List[str]
+            Список ключей. Порядок значений в ответе совпадает с порядком ключей.
+        """
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        """Абстрактный метод сохраняет значение.
+
+        Parameters
+        ----------
+        key: str
+            Ключ записи.
+        value: str
+            Сериализованное значение.
+        ttl: int
+            Время жизни записи в секундах.
+        """
+        ...
+
+    @abstractmethod
+    async def set_many(self, items: t.Dict[str, str], ttl: int) -> None:
+        """Абстрактный метод сохраняет несколько значений за одно обращение к хранилищу.
+
+        Parameters
+        ----------
+        items: Dict[str, str]
+            Сериализованные значения по ключам.
+        ttl: int
+            Время жизни записей в секундах.
+        """
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """Абстрактный метод удаляет записи.
+
+        Parameters
+        ----------
+        keys: str
+            Ключи удаляемых записей.
+        """
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str) -> None:
+        """Абстрактный метод рассылает сообщение всем подписчикам канала.
+
+        Parameters
+        ----------
+        channel: str
+            Имя канала.
+        message: str
+            Сообщение.
+        """
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> t.AsyncIterator[str]:
+        """Абстрактный метод подписывается на канал и возвращает асинхронный итератор сообщений.
+
+        Parameters
+        ----------
+        channel: str
+            Имя канала.
+        """
+        ...
+
+
+class MemoryCacheBackend(AbstractCacheBackend):
+    """Хранилище кэша в памяти процесса. Для тестов и запуска в один воркер."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.cache = TTLCache(name="memory_backend", maxsize=maxsize, ttl=0)
+        self._subscribers: t.Dict[str, t.List[asyncio.Queue]] = {}
+
+    async def get(self, key: str) -> t.Optional[str]:
+        return self.cache.get(key)
+
+    async def get_many(self, keys: t.List[str]) -> t.List[t.Optional[str]]:
+        return [self.cache.get(key) for key in keys]
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        self.cache.set(key, value, ttl=ttl)
+
+    async def set_many(self, items: t.Dict[str, str], ttl: int) -> None:
+        for key, value in items.items():
+            self.cache.set(key, value, ttl=ttl)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.cache.invalidate(key)
+
+    async def publish(self, channel: str, message: str) -> None:
+        for queue in self._subscribers.get(channel, []):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> t.AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].remove(queue)
+
+
+class RedisCacheBackend(AbstractCacheBackend):
+    """Хранилище кэша в redis, общее для всех воркеров.
+
+    Parameters
+    ----------
+    client
+        Асинхронный клиент redis.
+    timeout: float
+        Максимальное время ожидания ответа redis в секундах.
+    retry_after: float
+        Пауза в секундах, в течение которой после ошибки redis не опрашивается.
+
+    Note
+    ----
+    Медленный или недоступный redis не должен ронять запросы: при ошибке или таймауте чтение возвращает промах,
+    запись пропускается, и данные берутся из postgres.
+    """
+
+    def __init__(self, client, timeout: float, retry_after: float) -> None:
+        self.client = client
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._down_until = 0.0
+        self.errors = 0
+
+    async def _call(self, coro: t.Awaitable, default: t.Any = None) -> t.Any:
+        """Внутренний метод выполняет команду redis с таймаутом и переходом на postgres при ошибке."""
+        if self._down_until > time.monotonic():
+            coro.close()
+            return default
+        try:
+            return await asyncio.wait_for(coro, self.timeout)
+        except (RedisError, OSError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning(event="redis недоступен, работаем через postgres", error=repr(e))
+            return default
+
+    async def get(self, key: str) -> t.Optional[str]:
+        return await self._call(self.client.get(key))
+
+    async def get_many(self, keys: t.List[str]) -> t.List[t.Optional[str]]:
+        if not keys:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+        return await self._call(pipe.execute(), default=[None] * len(keys))
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self._call(self.client.set(key, value, ex=ttl))
+
+    async def set_many(self, items: t.Dict[str, str], ttl: int) -> None:
+        if not items:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, value, ex=ttl)
+        await self._call(pipe.execute())
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._call(self.client.delete(*keys))
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self._call(self.client.publish(channel, message))
+
+    async def subscribe(self, channel: str) -> t.AsyncIterator[str]:
+        """Метод читает сообщения канала. При обрыве соединения переподписывается через ``retry_after`` секунд,
+        пропущенные за это время сообщения теряются, и устаревшие записи живут не дольше своего TTL.
+        """
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(channel)
+                while True:
+                    try:
+                        message = await pubsub.get_message(timeout=1.0)
+                    except (RedisTimeoutError, asyncio.TimeoutError):
+                        continue
+                    if message:
+                        yield message["data"]
+            except (RedisError, OSError) as e:
+                self.errors += 1
+                logger.warning(event="потеряна подписка redis", channel=channel, error=repr(e))
+                await asyncio.sleep(self.retry_after)
+            finally:
+                await pubsub.reset()
+
+
+class CacheInvalidator:
+    """Класс удаляет записи из кэша воркера и рассылает инвалидацию остальным воркерам через канал хранилища кэша.
+
+    Parameters
+    ----------
+    cache: TTLCache
+        Внутрипроцессный кэш.
+    channel: str
+        Канал рассылки инвалидаций.
+    backend: AbstractCacheBackend
+        Хранилище кэша, через которое идёт рассылка.
+
+    Attributes
+    ----------
+    received: int
+        Количество инвалидаций, полученных от других воркеров.
+    max_lag: float
+        Максимальная задержка доставки инвалидации в секундах.
+    """
+
+    def __init__(self, cache: TTLCache, channel: str, backend: AbstractCacheBackend) -> None:
+        self.cache = cache
+        self.channel = channel
+        self.backend = backend
+        self.origin = f"{os.getpid()}:{id(self)}"
+        self._task: t.Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    async def invalidate(self, *keys: t.Union[int, str]) -> None:
+        """Метод удаляет записи из кэша воркера и сообщает о них остальным воркерам.
+
+        Parameters
+        ----------
+        keys: int | str
+            Ключи удаляемых записей.
+        """
+        for key in keys:
+            self.cache.invalidate(key)
+        if keys:
+            message = json.dumps(dict(keys=list(keys), origin=self.origin, sent_at=time.time()))
+            await self.backend.publish(self.channel, message)
+            self.published += 1
+
+    async def listen(self) -> None:
+        """Метод принимает инвалидации других воркеров, пока его не отменят."""
+        async for message in self.backend.subscribe(self.channel):
+            try:
+                payload = json.loads(message)
+                keys, origin, sent_at = payload["keys"], payload["origin"], payload["sent_at"]
+            except (ValueError, KeyError, TypeError):
+                logger.warning(event="неверное сообщение инвалидации", channel=self.channel, message=message)
+                continue
+            if origin == self.origin:
+                continue
+            for key in keys:
+                self.cache.invalidate(key)
+            self.received += 1
+            self.last_lag = max(time.time() - sent_at, 0.0)
+            self.max_lag = max(self.max_lag, self.last_lag)
+
+    def start(self) -> None:
+        """Метод запускает приём инвалидаций в цикле событий воркера."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.listen())
+
+    async def stop(self) -> None:
+        """Метод останавливает приём инвалидаций."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        """Метод возвращает метрики кэша и доставки инвалидаций.
+
+        Returns
+        -------
+        dict
+            Метрики кэша, количество отправленных и полученных инвалидаций и задержка их доставки в секундах.
+        """
+        return dict(
+            **self.cache.stats(),
+            invalidations_published=self.published,
+            invalidations_received=self.received,
+            invalidation_last_lag=round(self.last_lag, 4),
+            invalidation_max_lag=round(self.max_lag, 4),
+        )
+
+
+def make_cache_backend() -> AbstractCacheBackend:
+    """Функция создаёт хранилище кэша по настройкам приложения.
+
+    Returns
+    -------
+    AbstractCacheBackend
+        Хранилище кэша.
+    """
+    if settings.cache_backend == "redis":
+        return RedisCacheBackend(redis, timeout=settings.redis_timeout, retry_after=settings.redis_retry_after)
+    return MemoryCacheBackend(maxsize=settings.memory_cache_size)
+
+
+cache_backend = make_cache_backend()
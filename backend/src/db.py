@@ -17,6 +17,7 @@ session
 redis
     Асинхронное подключение к нереляционной СУБД.
 """
+from redis import asyncio as aioredis
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
@@ -38,4 +39,9 @@ engine = create_async_engine(
 Base = declarative_base()
 session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-# redis = aioredis.from_url(f"redis://{settings.redis_host}:{settings.redis_port}/1")
+redis = aioredis.from_url(
+    f"redis://{settings.redis_host}:{settings.redis_port}/1",
+    decode_responses=True,
+    socket_connect_timeout=settings.redis_timeout,
+    socket_timeout=settings.redis_timeout,
+)
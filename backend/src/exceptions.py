@@ -36,6 +36,12 @@ class InternalServerException(BackendException):
     ...
 
 
+class ServiceUnavailableException(BackendException):
+    """Сервер перегружен, запрос стоит повторить позже. Код 503"""
+
+    ...
+
+
 class ErrorsList:
     """Класс инкапсулирует сообщения об ошибках для фронтенда.
 
@@ -64,6 +70,11 @@ class ErrorsList:
     )
     incorrect_password = dict(error_type="INCORRECT_PASSWORD", error_message="неверный пароль")
     incorrect_parameters = dict(error_type="INCORRECT_PARAMETERS", error_message="неверные параметры")
+    invalid_cursor = dict(error_type="INVALID_CURSOR", error_message="неверный курсор страницы")
+    batch_too_large = dict(error_type="BATCH_TOO_LARGE", error_message="слишком много твитов в одном запросе")
+    too_many_ids = dict(error_type="TOO_MANY_IDS", error_message="слишком много идентификаторов в одном запросе")
+    invalid_ids = dict(error_type="INVALID_IDS", error_message="неверный список идентификаторов")
+    invalid_tweet = dict(error_type="VALIDATION_ERROR", error_message="твит не прошёл валидацию")
     not_authorized = dict(error_type="AUTH_ERROR", error_message="отсутствует api-key в HTTP-заголовке")
     api_key_not_exists = dict(error_type="AUTH_ERROR", error_message="неправильный api-key")
     connection_refused = dict(
@@ -71,6 +82,10 @@ class ErrorsList:
     )
     postgres_query_error = dict(error_type="POSTGRES_QUERY_ERROR", error_message="Неверный запрос к БД")
     serialize_error = dict(error_type="PYDANTIC_SERIALIZE_ERROR", error_message="Ошибка сериализации данных")
+    stream_disabled = dict(error_type="STREAM_DISABLED", error_message="поток событий твитов отключён")
+    password_hash_busy = dict(
+        error_type="SERVICE_BUSY", error_message="слишком много одновременных входов, повторите попытку позже"
+    )
 
 
 def exc_handler(ExceptionClass):
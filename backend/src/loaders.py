@@ -0,0 +1,167 @@
+"""
+loaders.py
+----------
+
+Модуль реализует загрузчики, которые собирают одиночные запросы объектов по ключу в пачки
+и запоминают результат до конца HTTP-запроса.
+
+Note
+----
+    Сервис, которому нужен автор по идентификатору, вызывает ``load`` загрузчика, а не метод сервиса СУБД.
+    Загрузчик откладывает запрос до конца текущего шага цикла событий: все ключи, запрошенные за этот шаг,
+    например из корутин одного ``asyncio.gather``, загружаются одним запросом ``IN (...)``.
+    Повторный запрос того же ключа в том же HTTP-запросе отдаётся из памяти загрузчика без обращения к СУБД.
+
+    Загрузчики живут в ``request_loaders`` и создаются заново для каждого HTTP-запроса (``loader_scope``),
+    поэтому не отдают данные, изменённые другими запросами. Изменения, сделанные в самом запросе, сервис
+    сообщает загрузчику через ``clear`` или ``prime``. Вне ``loader_scope``, например в фоновых задачах,
+    загрузчик создаётся на каждый вызов и ничего не запоминает.
+
+Attributes
+----------
+request_loaders: ContextVar
+    Загрузчики текущего HTTP-запроса по именам.
+"""
+import asyncio
+import typing as t
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import structlog
+
+from settings import settings
+
+logger = structlog.get_logger()
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+BatchLoad = t.Callable[[t.List[K]], t.Awaitable[t.Dict[K, V]]]
+
+request_loaders: ContextVar[t.Optional[t.Dict[str, "DataLoader"]]] = ContextVar("request_loaders", default=None)
+
+
+class DataLoader(t.Generic[K, V]):
+    """Класс собирает запросы объектов по ключу за один шаг цикла событий в пачку.
+
+    Parameters
+    ----------
+    name: str
+        Имя загрузчика для логов.
+    batch_load: Callable[[List[K]], Awaitable[Dict[K, V]]]
+        Корутина загружает объекты по списку уникальных ключей одним запросом и возвращает словарь
+        найденных объектов по ключам.
+    max_batch_size: int
+        Максимальное количество ключей в одном запросе. Более длинная пачка делится на несколько запросов.
+
+    Attributes
+    ----------
+    batches: int
+        Количество вызовов ``batch_load``.
+    """
+
+    def __init__(self, name: str, batch_load: BatchLoad, max_batch_size: int = settings.loader_max_batch_size) -> None:
+        self.name = name
+        self.batch_load = batch_load
+        self.max_batch_size = max(max_batch_size, 1)
+        self.batches = 0
+        self._futures: t.Dict[K, asyncio.Future] = {}
+        self._queue: t.List[K] = []
+
+    def load(self, key: K) -> "asyncio.Future[t.Optional[V]]":
+        """Метод ставит ключ в текущую пачку.
+
+        Returns
+        -------
+        Future
+            Объект или None, если его нет. Для уже запрошенного ключа возвращается прежний результат.
+        """
+        if (future := self._futures.get(key)) is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._futures[key] = loop.create_future()
+        if not self._queue:
+            loop.call_soon(self._dispatch)
+        self._queue.append(key)
+        return future
+
+    async def load_many(self, keys: t.Iterable[K]) -> t.List[t.Optional[V]]:
+        """Метод загружает объекты по списку ключей одной пачкой.
+
+        Returns
+        -------
+        List[V | None]
+            Объекты в порядке ключей, None на месте ненайденных.
+        """
+        return list(await asyncio.gather(*map(self.load, keys)))
+
+    def prime(self, key: K, value: V) -> None:
+        """Метод запоминает объект, который сервис уже получил, например только что созданный."""
+        self.clear(key)
+        if (future := self._futures.get(key)) is None:
+            future = self._futures[key] = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+
+    def clear(self, *keys: K) -> None:
+        """Метод забывает объекты, изменённые в текущем запросе. Ключи из ещё не загруженной пачки не трогаются."""
+        for key in keys:
+            if (future := self._futures.get(key)) is not None and future.done():
+                del self._futures[key]
+
+    def _dispatch(self) -> None:
+        """Внутренний метод отправляет накопленную пачку в фоновые задачи загрузки."""
+        keys, self._queue = self._queue, []
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = keys[start : start + self.max_batch_size]
+            self.batches += 1
+            task = asyncio.create_task(self.batch_load(batch))
+            task.add_done_callback(lambda task, batch=batch: self._resolve(batch, task))
+
+    def _resolve(self, keys: t.List[K], task: asyncio.Task) -> None:
+        """Внутренний метод раздаёт результаты пачки. Ошибка загрузки достаётся всей пачке и не запоминается."""
+        if task.cancelled() or (error := task.exception()) is not None:
+            logger.warning(event="пачка не загружена", loader=self.name, keys=len(keys), cancelled=task.cancelled())
+            for key in keys:
+                if (future := self._futures.pop(key)).done():
+                    continue
+                if task.cancelled():
+                    future.cancel()
+                else:
+                    future.set_exception(error)
+            return
+        values = task.result()
+        logger.info(event="загружена пачка", loader=self.name, keys=len(keys), found=len(values))
+        for key in keys:
+            if not (future := self._futures[key]).done():
+                future.set_result(values.get(key))
+
+
+def get_loader(name: str, batch_load: BatchLoad) -> DataLoader:
+    """Функция возвращает загрузчик текущего HTTP-запроса, создавая его при первом обращении.
+
+    Parameters
+    ----------
+    name: str
+        Имя загрузчика.
+    batch_load: Callable[[List[K]], Awaitable[Dict[K, V]]]
+        Корутина пакетной загрузки для нового загрузчика.
+
+    Returns
+    -------
+    DataLoader
+        Загрузчик запроса или новый загрузчик без памяти, если вызов выполняется вне ``loader_scope``.
+    """
+    if (loaders := request_loaders.get()) is None:
+        return DataLoader(name, batch_load)
+    if (loader := loaders.get(name)) is None:
+        loader = loaders[name] = DataLoader(name, batch_load)
+    return loader
+
+
+@contextmanager
+def loader_scope() -> t.Iterator[t.Dict[str, DataLoader]]:
+    """Контекстный менеджер открывает набор загрузчиков на время обработки HTTP-запроса."""
+    token = request_loaders.set({})
+    try:
+        yield request_loaders.get()
+    finally:
+        request_loaders.reset(token)
@@ -0,0 +1,62 @@
+"""
+maintenance.py
+--------------
+
+Команды обслуживания СУБД.
+
+Examples
+--------
+Секционировать таблицу твитов по диапазонам идентификаторов::
+
+    $ python -m maintenance partition
+
+Заранее создать секции твитов (запускать по расписанию, например раз в час из cron)::
+
+    $ python -m maintenance create-partitions
+
+Показать секции твитов::
+
+    $ python -m maintenance partitions
+
+Вернуть обычную таблицу твитов::
+
+    $ python -m maintenance unpartition
+"""
+import argparse
+import asyncio
+
+from app_tweets import partitions
+from db import engine
+from settings import settings
+
+
+async def main(command: str, size: int, ahead: int) -> None:
+    async with engine.begin() as conn:
+        partitioned = await conn.run_sync(partitions.is_partitioned)
+        if command == "partition":
+            if partitioned:
+                print("таблица твитов уже секционирована")
+                return
+            created = await conn.run_sync(partitions.partition_tweets, size, ahead)
+            print(f"таблица твитов секционирована: {', '.join(created)}")
+        elif not partitioned:
+            print("таблица твитов не секционирована")
+        elif command == "create-partitions":
+            created = await conn.run_sync(partitions.ensure_partitions, size, ahead)
+            print(f"созданы секции: {', '.join(created)}" if created else "все секции уже созданы")
+        elif command == "partitions":
+            for name, lower, upper in await conn.run_sync(partitions.list_partitions):
+                print(f"{name}: [{'MINVALUE' if lower is None else lower}, {upper})")
+        elif command == "unpartition":
+            await conn.run_sync(partitions.unpartition_tweets)
+            print("таблица твитов больше не секционирована")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание СУБД")
+    parser.add_argument("command", choices=("partition", "create-partitions", "partitions", "unpartition"))
+    parser.add_argument("--size", type=int, default=settings.tweets_partition_size, help="идентификаторов в секции")
+    parser.add_argument("--ahead", type=int, default=settings.tweets_partitions_ahead, help="секций вперёд")
+    args = parser.parse_args()
+    asyncio.run(main(args.command, args.size, args.ahead))
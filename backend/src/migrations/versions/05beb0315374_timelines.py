@@ -0,0 +1,44 @@
+"""timelines
+
+Revision ID: 05beb0315374
+Revises: 473b289ca8c2
+Create Date: 2026-10-17 10:12:31.481220
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "05beb0315374"
+down_revision = "473b289ca8c2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "timelines",
+        sa.Column("owner_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["owner_id"], ["authors.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("owner_id", "tweet_id"),
+    )
+    # ленты существующих авторов: свои твиты и твиты тех, кого автор читает
+    op.execute(
+        """
+        INSERT INTO timelines (owner_id, tweet_id)
+        SELECT author_id, id FROM tweets WHERE NOT coalesce(soft_delete, false)
+        UNION
+        SELECT (reader.value ->> 'id')::integer, tweets.id
+        FROM tweets
+        JOIN authors ON authors.id = tweets.author_id
+        JOIN jsonb_array_elements(coalesce(authors.following, '[]'::jsonb)) AS reader ON true
+        WHERE NOT coalesce(tweets.soft_delete, false)
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("timelines")
@@ -0,0 +1,67 @@
+"""likes
+
+Revision ID: 2742a5212d47
+Revises: 976d67756f15
+Create Date: 2026-10-17 11:48:05.119342
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "2742a5212d47"
+down_revision = "976d67756f15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "likes",
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["author_id"], ["authors.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("tweet_id", "author_id"),
+    )
+    op.create_index("ix_likes_author_id", "likes", ["author_id"], unique=False)
+    op.add_column("tweets", sa.Column("like_count", sa.Integer(), server_default=sa.text("0"), nullable=False))
+    # перенос лайков из JSONB-массива; лайки удалённых авторов отбрасываются
+    op.execute(
+        """
+        INSERT INTO likes (tweet_id, author_id)
+        SELECT tweets.id, authors.id
+        FROM tweets
+        JOIN jsonb_array_elements(coalesce(tweets.likes, '[]'::jsonb)) AS item ON true
+        JOIN authors ON authors.id = (item.value ->> 'user_id')::integer
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.execute(
+        """
+        UPDATE tweets SET like_count = counters.count
+        FROM (SELECT tweet_id, count(*) AS count FROM likes GROUP BY tweet_id) AS counters
+        WHERE counters.tweet_id = tweets.id
+        """
+    )
+    op.drop_column("tweets", "likes")
+
+
+def downgrade() -> None:
+    op.add_column("tweets", sa.Column("likes", postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.execute(
+        """
+        UPDATE tweets SET likes = coalesce(
+            (
+                SELECT jsonb_agg(jsonb_build_object('user_id', authors.id, 'name', authors.name) ORDER BY authors.id)
+                FROM likes JOIN authors ON authors.id = likes.author_id
+                WHERE likes.tweet_id = tweets.id
+            ),
+            '[]'::jsonb
+        )
+        """
+    )
+    op.drop_column("tweets", "like_count")
+    op.drop_index("ix_likes_author_id", table_name="likes")
+    op.drop_table("likes")
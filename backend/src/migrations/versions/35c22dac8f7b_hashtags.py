@@ -0,0 +1,64 @@
+"""hashtags
+
+Revision ID: 35c22dac8f7b
+Revises: add9f7691442
+Create Date: 2026-10-17 14:05:12.318406
+
+"""
+import re
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "35c22dac8f7b"
+down_revision = "add9f7691442"
+branch_labels = None
+depends_on = None
+
+HASHTAG_RE = re.compile(r"(?<![\w#])#(\w+)")
+BATCH = 5000
+
+
+def upgrade() -> None:
+    op.create_table(
+        "hashtags",
+        sa.Column("tag", sa.String(length=100), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("tag", "tweet_id"),
+    )
+    op.create_index("ix_hashtags_tweet_id", "hashtags", ["tweet_id"], unique=False)
+    op.create_table(
+        "hashtag_counters",
+        sa.Column("tag", sa.String(length=100), nullable=False),
+        sa.Column("bucket", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("count", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.PrimaryKeyConstraint("tag", "bucket"),
+    )
+    op.create_index("ix_hashtag_counters_bucket", "hashtag_counters", ["bucket"], unique=False)
+    # обратный индекс для существующих твитов. регулярное выражение то же, что в app_tweets.services:
+    # \w в postgres зависит от локали базы, поэтому хэштеги разбираются здесь, а не в SQL.
+    # счётчики популярности не заполняются - старые твиты не попадают в окно
+    conn = op.get_bind()
+    last_id = 0
+    while rows := conn.execute(
+        sa.text("SELECT id, content FROM tweets WHERE id > :last_id ORDER BY id LIMIT :batch"),
+        dict(last_id=last_id, batch=BATCH),
+    ).all():
+        pairs = {
+            (tag.lower(), row.id) for row in rows for tag in HASHTAG_RE.findall(row.content or "") if len(tag) <= 100
+        }
+        if pairs:
+            conn.execute(
+                sa.text("INSERT INTO hashtags (tag, tweet_id) VALUES (:tag, :tweet_id) ON CONFLICT DO NOTHING"),
+                [dict(tag=tag, tweet_id=tweet_id) for tag, tweet_id in pairs],
+            )
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    op.drop_index("ix_hashtag_counters_bucket", table_name="hashtag_counters")
+    op.drop_table("hashtag_counters")
+    op.drop_index("ix_hashtags_tweet_id", table_name="hashtags")
+    op.drop_table("hashtags")
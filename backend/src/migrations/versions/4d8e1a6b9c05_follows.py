@@ -0,0 +1,93 @@
+"""follows
+
+Revision ID: 4d8e1a6b9c05
+Revises: a1c7e4d9b362
+Create Date: 2026-10-17 22:14:51.607193
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "4d8e1a6b9c05"
+down_revision = "a1c7e4d9b362"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "follows",
+        sa.Column("follower_id", sa.Integer(), nullable=False),
+        sa.Column("followee_id", sa.Integer(), nullable=False),
+        sa.CheckConstraint("follower_id <> followee_id", name="ck_follows_not_self"),
+        sa.ForeignKeyConstraint(["followee_id"], ["authors.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["follower_id"], ["authors.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("follower_id", "followee_id"),
+    )
+    # перенос подписок из JSONB-массивов: в followers читателя лежат авторы, которых он читает,
+    # в following писателя - его читатели. Массивы обновлялись без блокировок и могли разойтись,
+    # поэтому подписка переносится, если она записана хотя бы в одном из них;
+    # подписки удалённых авторов и на самого себя отбрасываются
+    op.execute(
+        """
+        INSERT INTO follows (follower_id, followee_id)
+        SELECT edges.follower_id, edges.followee_id
+        FROM (
+            SELECT authors.id AS follower_id, (item.value ->> 'id')::integer AS followee_id
+            FROM authors JOIN jsonb_array_elements(coalesce(authors.followers, '[]'::jsonb)) AS item ON true
+            UNION
+            SELECT (item.value ->> 'id')::integer, authors.id
+            FROM authors JOIN jsonb_array_elements(coalesce(authors.following, '[]'::jsonb)) AS item ON true
+        ) AS edges
+        JOIN authors AS followers ON followers.id = edges.follower_id
+        JOIN authors AS followees ON followees.id = edges.followee_id
+        WHERE edges.follower_id <> edges.followee_id
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.create_index("ix_follows_followee_id_follower_id", "follows", ["followee_id", "follower_id"], unique=False)
+    op.add_column("authors", sa.Column("following_count", sa.Integer(), server_default=sa.text("0"), nullable=False))
+    op.execute(
+        """
+        UPDATE authors SET
+            follower_count = (SELECT count(*) FROM follows WHERE follows.followee_id = authors.id),
+            following_count = (SELECT count(*) FROM follows WHERE follows.follower_id = authors.id)
+        """
+    )
+    op.alter_column(
+        "authors", "follower_count", existing_type=sa.Integer(), server_default=sa.text("0"), nullable=False
+    )
+    op.drop_column("authors", "followers")
+    op.drop_column("authors", "following")
+
+
+def downgrade() -> None:
+    op.add_column("authors", sa.Column("followers", postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column("authors", sa.Column("following", postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.execute(
+        """
+        UPDATE authors SET
+            followers = coalesce(
+                (
+                    SELECT jsonb_agg(jsonb_build_object('id', other.id, 'name', other.name) ORDER BY other.id)
+                    FROM follows JOIN authors AS other ON other.id = follows.followee_id
+                    WHERE follows.follower_id = authors.id
+                ),
+                '[]'::jsonb
+            ),
+            following = coalesce(
+                (
+                    SELECT jsonb_agg(jsonb_build_object('id', other.id, 'name', other.name) ORDER BY other.id)
+                    FROM follows JOIN authors AS other ON other.id = follows.follower_id
+                    WHERE follows.followee_id = authors.id
+                ),
+                '[]'::jsonb
+            )
+        """
+    )
+    op.alter_column("authors", "follower_count", existing_type=sa.Integer(), server_default=None, nullable=True)
+    op.drop_column("authors", "following_count")
+    op.drop_index("ix_follows_followee_id_follower_id", table_name="follows")
+    op.drop_table("follows")
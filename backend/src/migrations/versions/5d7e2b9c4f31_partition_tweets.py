@@ -0,0 +1,41 @@
+"""partition tweets
+
+Revision ID: 5d7e2b9c4f31
+Revises: c3a91e5f7d20
+Create Date: 2026-10-17 16:10:44.902117
+
+Секционирование таблицы твитов включается явно::
+
+    $ alembic -x partition_tweets=true upgrade head
+
+Размер секции и число секций вперёд по умолчанию берутся из настроек, их можно переопределить
+аргументами ``-x tweets_partition_size=...`` и ``-x tweets_partitions_ahead=...``. Без ``partition_tweets``
+ревизия ничего не меняет; секционировать таблицу позже можно командой ``python -m maintenance partition``.
+"""
+from alembic import context, op
+
+from app_tweets import partitions
+from settings import settings
+
+# revision identifiers, used by Alembic.
+revision = "5d7e2b9c4f31"
+down_revision = "c3a91e5f7d20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    arguments = context.get_x_argument(as_dictionary=True)
+    if arguments.get("partition_tweets", "false").lower() not in ("1", "true", "yes"):
+        return
+    conn = op.get_bind()
+    if not partitions.is_partitioned(conn):
+        size = int(arguments.get("tweets_partition_size", settings.tweets_partition_size))
+        ahead = int(arguments.get("tweets_partitions_ahead", settings.tweets_partitions_ahead))
+        partitions.partition_tweets(conn, size, ahead)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if partitions.is_partitioned(conn):
+        partitions.unpartition_tweets(conn)
@@ -0,0 +1,48 @@
+"""soft delete aware indexes
+
+Revision ID: 8f0c4b6e2d19
+Revises: 35c22dac8f7b
+Create Date: 2026-10-17 14:48:30.127734
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8f0c4b6e2d19"
+down_revision = "35c22dac8f7b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_author_id_id_live",
+            "tweets",
+            ["author_id", "id"],
+            unique=False,
+            postgresql_where=sa.text("NOT soft_delete"),
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_tweets_author_id_id", table_name="tweets", postgresql_concurrently=True)
+        op.create_index(
+            "ix_timelines_tweet_id",
+            "timelines",
+            ["tweet_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_timelines_tweet_id", table_name="timelines", postgresql_concurrently=True)
+        op.create_index(
+            "ix_tweets_author_id_id",
+            "tweets",
+            ["author_id", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_tweets_author_id_id_live", table_name="tweets", postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""tweets author_id id index
+
+Revision ID: 976d67756f15
+Revises: 05beb0315374
+Create Date: 2026-10-17 11:02:47.903115
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "976d67756f15"
+down_revision = "05beb0315374"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_author_id_id",
+            "tweets",
+            ["author_id", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tweets_author_id_id", table_name="tweets", postgresql_concurrently=True)
@@ -0,0 +1,49 @@
+"""tweet versions
+
+Revision ID: 9b4f1c7a2e58
+Revises: 5d7e2b9c4f31
+Create Date: 2026-10-17 17:02:51.630418
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9b4f1c7a2e58"
+down_revision = "5d7e2b9c4f31"
+branch_labels = None
+depends_on = None
+
+BATCH = 50000
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("tweet_versions")))
+    # столбец добавляется без значения по умолчанию, чтобы не перезаписывать таблицу целиком под блокировкой,
+    # версии существующих твитов назначаются пачками по возрастанию идентификатора
+    op.add_column("tweets", sa.Column("version", sa.BigInteger(), nullable=True))
+    op.alter_column("tweets", "version", server_default=sa.text("nextval('tweet_versions')"))
+    conn = op.get_bind()
+    last_id = 0
+    while (
+        stop := conn.scalar(
+            sa.text("SELECT max(id) FROM (SELECT id FROM tweets WHERE id > :last_id ORDER BY id LIMIT :batch) AS t"),
+            dict(last_id=last_id, batch=BATCH),
+        )
+    ) is not None:
+        conn.execute(
+            sa.text(
+                "UPDATE tweets SET version = nextval('tweet_versions') "
+                "WHERE id > :last_id AND id <= :stop AND version IS NULL"
+            ),
+            dict(last_id=last_id, stop=stop),
+        )
+        last_id = stop
+    op.alter_column("tweets", "version", nullable=False)
+    op.add_column("tweets_archive", sa.Column("version", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("tweets_archive", "version")
+    op.drop_column("tweets", "version")
+    op.execute(sa.schema.DropSequence(sa.Sequence("tweet_versions")))
@@ -0,0 +1,50 @@
+"""tweet change indexes
+
+Revision ID: a1c7e4d9b362
+Revises: e6a2d8f41b73
+Create Date: 2026-10-17 21:05:37.418260
+
+"""
+from alembic import op
+
+from app_tweets import partitions
+
+# revision identifiers, used by Alembic.
+revision = "a1c7e4d9b362"
+down_revision = "e6a2d8f41b73"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # секционированную таблицу нельзя индексировать конкурентно: индекс строится по секциям под блокировкой
+    concurrently = not partitions.is_partitioned(op.get_bind())
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_author_id_version",
+            "tweets",
+            ["author_id", "version"],
+            unique=False,
+            postgresql_concurrently=concurrently,
+        )
+        op.create_index(
+            "ix_tweets_archive_author_id_version",
+            "tweets_archive",
+            ["author_id", "version"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_tweets_archive_author_id", table_name="tweets_archive", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_archive_author_id",
+            "tweets_archive",
+            ["author_id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_tweets_archive_author_id_version", table_name="tweets_archive", postgresql_concurrently=True)
+    op.drop_index("ix_tweets_author_id_version", table_name="tweets")
@@ -0,0 +1,44 @@
+"""tweets search vector
+
+Revision ID: add9f7691442
+Revises: 2742a5212d47
+Create Date: 2026-10-17 13:26:40.558021
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "add9f7691442"
+down_revision = "2742a5212d47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # добавление вычисляемого столбца переписывает таблицу под эксклюзивной блокировкой
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('russian'::regconfig, content)", persisted=True),
+            nullable=True,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_search_vector",
+            "tweets",
+            ["search_vector"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tweets_search_vector", table_name="tweets", postgresql_concurrently=True)
+    op.drop_column("tweets", "search_vector")
@@ -0,0 +1,60 @@
+"""tweets archive
+
+Revision ID: c3a91e5f7d20
+Revises: 8f0c4b6e2d19
+Create Date: 2026-10-17 15:32:08.541903
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "c3a91e5f7d20"
+down_revision = "8f0c4b6e2d19"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("tweets", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    # момент удаления уже удалённых твитов неизвестен: отсчитываем срок хранения от миграции
+    op.execute("UPDATE tweets SET deleted_at = now() WHERE soft_delete")
+    op.create_table(
+        "tweets_archive",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=True),
+        sa.Column("attachments", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column("like_count", sa.Integer(), server_default=sa.text("0"), nullable=False),
+        sa.Column(
+            "likes", postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'[]'::jsonb"), nullable=False
+        ),
+        sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["author_id"], ["authors.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tweets_archive_author_id", "tweets_archive", ["author_id"], unique=False)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_deleted_at",
+            "tweets",
+            ["deleted_at"],
+            unique=False,
+            postgresql_where=sa.text("soft_delete"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    # архивные твиты возвращаются в таблицу tweets удалёнными, лайки из снимка не восстанавливаются
+    op.execute(
+        "INSERT INTO tweets (id, content, author_id, like_count, attachments, soft_delete) "
+        "SELECT id, content, author_id, like_count, attachments, true FROM tweets_archive"
+    )
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tweets_deleted_at", table_name="tweets", postgresql_concurrently=True)
+    op.drop_index("ix_tweets_archive_author_id", table_name="tweets_archive")
+    op.drop_table("tweets_archive")
+    op.drop_column("tweets", "deleted_at")
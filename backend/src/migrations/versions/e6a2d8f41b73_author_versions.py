@@ -0,0 +1,31 @@
+"""author versions
+
+Revision ID: e6a2d8f41b73
+Revises: 9b4f1c7a2e58
+Create Date: 2026-10-17 19:24:08.113905
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e6a2d8f41b73"
+down_revision = "9b4f1c7a2e58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("author_versions")))
+    # как и для твитов, столбцы добавляются без значения по умолчанию, чтобы не перезаписывать таблицу дважды
+    op.add_column("authors", sa.Column("version", sa.BigInteger(), nullable=True))
+    op.add_column("authors", sa.Column("tweets_version", sa.BigInteger(), nullable=True))
+    op.execute("UPDATE authors SET version = nextval('author_versions'), tweets_version = nextval('author_versions')")
+    for column in ("version", "tweets_version"):
+        op.alter_column("authors", column, nullable=False, server_default=sa.text("nextval('author_versions')"))
+
+
+def downgrade() -> None:
+    op.drop_column("authors", "tweets_version")
+    op.drop_column("authors", "version")
+    op.execute(sa.schema.DropSequence(sa.Sequence("author_versions")))
@@ -0,0 +1,183 @@
+"""
+pagination.py
+-------------
+
+Модуль реализует непрозрачные курсоры для постраничной выдачи по ключу (keyset pagination).
+
+Note
+----
+    Курсор хранит направление и идентификатор границы страницы. Следующая страница выбирается условием
+    ``id < before_id`` или ``id > after_id`` по индексу, поэтому глубокие страницы стоят столько же, сколько первая,
+    в отличие от OFFSET. Для выдачи, упорядоченной по релевантности, курсор хранит пару ``(rank, id)``.
+
+    Выборка по списку ключей (``?ids=1,2,3``) не постраничная: размер списка ограничен ``multi_get_max``.
+
+    Идентификаторы из запроса и курсоров ограничены диапазоном ``integer`` в postgres (``MAX_ID``): большее число
+    asyncpg не передаст в запрос, и клиент получил бы ошибку СУБД вместо ``INVALID_IDS`` или ``INVALID_CURSOR``.
+"""
+import base64
+import json
+import typing as t
+
+from exceptions import BackendException, ErrorsList
+from settings import settings
+
+BEFORE = "b"
+AFTER = "a"
+RANK = "r"
+MAX_ID = 2**31 - 1
+
+
+def _pack(payload: dict) -> str:
+    """Внутренняя функция упаковывает словарь в строку курсора."""
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _unpack(cursor: str) -> dict:
+    """Внутренняя функция распаковывает строку курсора в словарь."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise BackendException(**ErrorsList.invalid_cursor)
+    if not isinstance(payload, dict):
+        raise BackendException(**ErrorsList.invalid_cursor)
+    return payload
+
+
+def encode_cursor(before_id: t.Optional[int] = None, after_id: t.Optional[int] = None) -> str:
+    """Функция упаковывает границу страницы в непрозрачный курсор.
+
+    Parameters
+    ----------
+    before_id: int, optional
+        Следующая страница содержит твиты старше этого.
+    after_id: int, optional
+        Следующая страница содержит твиты новее этого.
+
+    Returns
+    -------
+    str
+        Курсор для фронтенда.
+    """
+    return _pack({AFTER: after_id} if after_id else {BEFORE: before_id})
+
+
+def decode_cursor(cursor: str) -> t.Tuple[t.Optional[int], t.Optional[int]]:
+    """Функция распаковывает курсор.
+
+    Parameters
+    ----------
+    cursor: str
+        Курсор, полученный фронтендом с предыдущей страницей.
+
+    Returns
+    -------
+    Tuple[int, int]
+        Пара ``(before_id, after_id)``, один из элементов которой None.
+
+    Raises
+    ------
+    BackendException
+        Курсор повреждён или подделан.
+    """
+    payload = _unpack(cursor)
+    before_id, after_id = payload.get(BEFORE), payload.get(AFTER)
+    if not any(isinstance(value, int) and 0 < value <= MAX_ID for value in (before_id, after_id)):
+        raise BackendException(**ErrorsList.invalid_cursor)
+    return before_id, after_id
+
+
+def next_cursor(ids: t.List[int], limit: int, after_id: t.Optional[int] = None) -> t.Optional[str]:
+    """Функция возвращает курсор следующей страницы.
+
+    Parameters
+    ----------
+    ids: List[int]
+        Идентификаторы текущей страницы от новых к старым.
+    limit: int
+        Запрошенный размер страницы.
+    after_id: int, optional
+        Граница текущей страницы при листании к новым записям.
+
+    Returns
+    -------
+    str, optional
+        Курсор или None, если страница последняя.
+    """
+    if len(ids) < limit:
+        return None
+    return encode_cursor(after_id=ids[0]) if after_id else encode_cursor(before_id=ids[-1])
+
+
+def encode_rank_cursor(rank: float, before_id: int) -> str:
+    """Функция упаковывает границу страницы выдачи, упорядоченной по релевантности.
+
+    Parameters
+    ----------
+    rank: float
+        Релевантность последнего твита страницы.
+    before_id: int
+        Идентификатор последнего твита страницы.
+
+    Returns
+    -------
+    str
+        Курсор для фронтенда.
+    """
+    return _pack({RANK: rank, BEFORE: before_id})
+
+
+def decode_rank_cursor(cursor: str) -> t.Tuple[float, int]:
+    """Функция распаковывает курсор выдачи, упорядоченной по релевантности.
+
+    Parameters
+    ----------
+    cursor: str
+        Курсор, полученный фронтендом с предыдущей страницей.
+
+    Returns
+    -------
+    Tuple[float, int]
+        Пара ``(rank, before_id)``.
+
+    Raises
+    ------
+    BackendException
+        Курсор повреждён или подделан.
+    """
+    payload = _unpack(cursor)
+    rank, before_id = payload.get(RANK), payload.get(BEFORE)
+    if not isinstance(rank, (int, float)) or not isinstance(before_id, int) or not 0 < before_id <= MAX_ID:
+        raise BackendException(**ErrorsList.invalid_cursor)
+    return float(rank), before_id
+
+
+def parse_ids(ids: str, limit: int = settings.multi_get_max) -> t.List[int]:
+    """Функция разбирает список идентификаторов из параметра запроса.
+
+    Parameters
+    ----------
+    ids: str
+        Идентификаторы через запятую.
+    limit: int
+        Максимальное количество идентификаторов.
+
+    Returns
+    -------
+    List[int]
+        Уникальные идентификаторы в порядке первого упоминания.
+
+    Raises
+    ------
+    BackendException
+        Список пуст, содержит не натуральные числа или числа больше ``MAX_ID``, или длиннее ``limit``.
+    """
+    try:
+        result = list(dict.fromkeys(int(item) for item in ids.split(",") if item.strip()))
+    except ValueError:
+        raise BackendException(**ErrorsList.invalid_ids)
+    if not result or min(result) <= 0 or max(result) > MAX_ID:
+        raise BackendException(**ErrorsList.invalid_ids)
+    if len(result) > limit:
+        raise BackendException(**ErrorsList.too_many_ids)
+    return result
@@ -0,0 +1,153 @@
+"""
+responses.py
+------------
+
+Модуль реализует быстрый путь сериализации ответов и условные GET-запросы.
+
+Note
+----
+    Если эндпоинт возвращает pydantic-схему, FastAPI превращает её в словарь, заново валидирует его
+    по ``response_model``, ещё раз обходит результат ``jsonable_encoder`` и только потом сериализует
+    стандартным модулем ``json``. Сервисы и так собирают ответ в схеме ``response_model``, поэтому горячие
+    эндпоинты возвращают готовый ``ORJSONResponse``: FastAPI не трогает возвращённые ``Response``,
+    схема превращается в словарь один раз и сериализуется orjson. ``response_model`` в декораторе
+    остаётся для документации OpenAPI.
+
+    Заголовки, которые зависимости выставили во внедрённый ``response: Response`` (например, ``api-key``
+    из ``PermissionService``), FastAPI к возвращённому ``Response`` не добавляет. Эндпоинты переносят их
+    в готовый ответ через ``forward_headers``.
+
+    Валидатор ``ETag`` строится из версии данных, которую СУБД хранит рядом с ними (``make_etag``). Эндпоинт
+    сначала читает версию и отвечает 304 без загрузки и сериализации ответа, если она совпала с ``If-None-Match``
+    (``not_modified``). Версия читается до ответа: если данные изменились между двумя запросами, клиент получит
+    более новый ответ со старым ``ETag`` и лишний раз скачает его, но не застрянет на устаревшем.
+    Запрос без ``If-None-Match`` версию отдельно не читает (``revalidating``): ``ETag`` ответа строится
+    из версии, загруженной вместе с данными.
+    ``Last-Modified`` не выставляется: время изменения в СУБД не хранится, а версии точнее секундных меток.
+
+Examples
+--------
+Замер на списке из 500 твитов::
+
+    $ python -m benchmarks.bench_responses --tweets 500
+"""
+import typing as t
+
+from fastapi import Request, Response, status
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+REVALIDATE = "private, no-cache"
+FRAMING_HEADERS = ("content-length", "content-type")
+
+
+def orjson_response(
+    content: BaseModel, status_code: int = status.HTTP_200_OK, headers: t.Optional[t.Dict[str, str]] = None
+) -> ORJSONResponse:
+    """Функция сериализует уже провалидированную схему ответа без повторной валидации.
+
+    Parameters
+    ----------
+    content: BaseModel
+        Схема ответа, совпадающая с ``response_model`` эндпоинта.
+    status_code: int
+        HTTP-статус. Статус из декоратора к готовому ответу не применяется.
+    headers: Dict[str, str], optional
+        Заголовки ответа. Заголовки, выставленные в параметре ``response: Response``, нужно передать
+        через ``forward_headers``.
+
+    Returns
+    -------
+    ORJSONResponse
+        Готовый ответ.
+    """
+    return ORJSONResponse(content.dict(by_alias=True), status_code=status_code, headers=headers)
+
+
+def forward_headers(response: Response, headers: t.Optional[t.Dict[str, str]] = None) -> t.Dict[str, str]:
+    """Функция переносит в заголовки готового ответа заголовки, выставленные во внедрённый ``response: Response``.
+
+    Parameters
+    ----------
+    response: Response
+        Внедрённый FastAPI ответ, в который писали зависимости.
+    headers: Dict[str, str], optional
+        Заголовки готового ответа. При совпадении имён они важнее перенесённых.
+
+    Returns
+    -------
+    Dict[str, str]
+        Объединённые заголовки без ``content-length`` и ``content-type`` пустого внедрённого ответа.
+    """
+    forwarded = {name: value for name, value in response.headers.items() if name not in FRAMING_HEADERS}
+    return {**forwarded, **(headers or {})}
+
+
+def make_etag(*parts: t.Any) -> t.Optional[str]:
+    """Функция строит сильный ``ETag`` из вида ресурса и его версии.
+
+    Returns
+    -------
+    str, optional
+        ``ETag`` вида ``"tweet-1-42"`` или None, если версия неизвестна.
+    """
+    return None if None in parts else '"' + "-".join(map(str, parts)) + '"'
+
+
+def etag_matches(if_none_match: t.Optional[str], etag: str) -> bool:
+    """Функция проверяет, совпадает ли ``ETag`` с одним из перечисленных в ``If-None-Match``.
+
+    Note
+    ----
+        Для ``If-None-Match`` применяется слабое сравнение: префикс ``W/`` не учитывается.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def revalidating(request: Request) -> bool:
+    """Функция проверяет, прислал ли клиент ``If-None-Match``, то есть стоит ли читать версию до загрузки данных."""
+    return bool(request.headers.get("if-none-match"))
+
+
+def validator_headers(
+    etag: t.Optional[str], headers: t.Optional[t.Dict[str, str]] = None
+) -> t.Optional[t.Dict[str, str]]:
+    """Функция добавляет к заголовкам ответа ``ETag`` и требование перепроверять его при каждом запросе.
+
+    Parameters
+    ----------
+    etag: str, optional
+        Валидатор ответа. Если не задан, заголовки возвращаются как есть.
+    headers: Dict[str, str], optional
+        Остальные заголовки ответа.
+    """
+    if etag is None:
+        return headers
+    return {**(headers or {}), "ETag": etag, "Cache-Control": REVALIDATE, "Vary": "api-key"}
+
+
+def not_modified(
+    request: Request, etag: t.Optional[str], headers: t.Optional[t.Dict[str, str]] = None
+) -> t.Optional[Response]:
+    """Функция отвечает 304, если клиент прислал в ``If-None-Match`` текущий ``ETag``.
+
+    Parameters
+    ----------
+    request: Request
+        Запрос фронтенда.
+    etag: str, optional
+        Текущий валидатор ресурса.
+    headers: Dict[str, str], optional
+        Остальные заголовки ответа.
+
+    Returns
+    -------
+    Response, optional
+        Пустой ответ 304 или None, если ресурс нужно отдать целиком.
+    """
+    if etag is not None and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, headers))
+    return None
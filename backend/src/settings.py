@@ -14,8 +14,45 @@ class Settings(BaseSettings):
     web_db: str = "postgres"
     redis_host: str = "localhost"
     redis_port: str = 5479
+    redis_timeout: float = 0.05
+    redis_retry_after: float = 5
+    cache_backend: str = "memory"
+    memory_cache_size: int = 50000
     docker_media_root: str = "/tmp/test-diploma/media"
     media_url: str = "/static/media"
+    api_key_cache_size: int = 10000
+    password_hash_executor: str = "thread"
+    password_hash_workers: int = 4
+    password_hash_concurrency: int = 8
+    password_hash_queue_timeout: float = 5
+    timeline_fanout_limit: int = 10000
+    tweets_page_size: int = 50
+    tweets_page_max: int = 200
+    like_write_mode: str = "sync"
+    like_flush_interval: float = 0.5
+    like_flush_size: int = 1000
+    tweet_cache_size: int = 10000
+    tweet_cache_ttl: float = 30
+    tweets_batch_max: int = 1000
+    multi_get_max: int = 100
+    tweet_fragment_cache_size: int = 50000
+    tweet_fragment_cache_ttl: float = 600
+    trending_window: int = 3600
+    trending_bucket: int = 60
+    trending_limit: int = 10
+    archive_after: float = 30 * 24 * 3600
+    archive_interval: float = 3600
+    archive_batch_size: int = 1000
+    archive_max_batches: int = 100
+    tweets_partition_size: int = 10_000_000
+    tweets_partitions_ahead: int = 2
+    tweet_stream_enabled: bool = True
+    tweet_stream_channel: str = "tweet_events"
+    tweet_stream_queue_size: int = 100
+    tweet_stream_backlog: int = 10000
+    tweet_stream_heartbeat: float = 15
+    tweet_stream_retry_after: float = 1
+    loader_max_batch_size: int = 500
 
 
 if os.path.exists("./.env"):
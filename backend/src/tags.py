@@ -11,4 +11,12 @@ tags_metadata = [
         "name": "tweets",
         "description": "Хочешь узнать чужие секреты? Кто роняет мишек на пол, отрывает мишкам лапы?",
     },
+    {
+        "name": "hashtags",
+        "description": "Твиты по хэштегу и хэштеги, о которых все говорят прямо сейчас.",
+    },
+    {
+        "name": "metrics",
+        "description": "Метрики кэшей и буферов воркера, обработавшего запрос.",
+    },
 ]
@@ -5,12 +5,14 @@ conftest.py
 Модуль содержит фикстуры для фреймворка тестирования pytest
 """
 import asyncio
-from typing import List, Tuple
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Tuple
 
 import pytest
 from faker import Factory
 from fastapi import Depends, FastAPI
 from loguru import logger
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -24,7 +26,7 @@ from app_users import router as app_users_router
 from app_users.db_services import AuthorDbService
 from app_users.schemas import AuthorModelSchema
 from app_users.services import AuthorService
-from db import Base
+from db import Base, engine
 from settings import settings
 
 user_count = 6
@@ -142,6 +144,33 @@ def get_media_parameters():
     return [("111", "file1.jpg"), ("222", "file2.jpg"), ("333", "file3.jpg")]
 
 
+@pytest.fixture
+def count_queries() -> Callable:
+    """
+    Фикстура возвращает контекстный менеджер, собирающий запросы приложения к СУБД, выполненные внутри него.
+
+    Returns
+    -------
+    Callable[[], ContextManager[List[str]]]
+        Фабрика контекстных менеджеров со списком текстов запросов.
+    """
+
+    @contextmanager
+    def collect() -> Iterator[List[str]]:
+        statements: List[str] = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+    return collect
+
+
 @pytest.fixture
 def author_service():
     """
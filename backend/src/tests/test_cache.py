@@ -0,0 +1,109 @@
+"""
+test_cache.py
+-------------
+
+Модуль содержит тесты внутрипроцессного кэша.
+"""
+import asyncio
+import time
+
+import pytest
+from redis import asyncio as aioredis
+
+from cache import CacheInvalidator, MemoryCacheBackend, RedisCacheBackend, TTLCache
+
+
+@pytest.mark.cache
+def test_ttl_cache_hit_miss():
+    """тест попаданий и промахов"""
+    cache = TTLCache(name="test", maxsize=10, ttl=60)
+    assert cache.get("key") is None
+    cache.set("key", 1)
+    assert cache.get("key") == 1
+    assert "key" in cache
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.cache
+def test_ttl_cache_lru_eviction():
+    """тест вытеснения давно не использованных записей"""
+    cache = TTLCache(name="test", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.evictions == 1
+
+
+@pytest.mark.cache
+def test_ttl_cache_expiration():
+    """тест истечения времени жизни и инвалидации"""
+    cache = TTLCache(name="test", maxsize=10, ttl=60)
+    cache.set("short", 1, ttl=0.01)
+    cache.set("long", 2)
+    time.sleep(0.02)
+    assert cache.get("short", "default") == "default"
+    assert cache.expirations == 1
+    assert cache.invalidate("long") is True
+    assert cache.invalidate("long") is False
+    assert len(cache) == 0
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_memory_cache_backend():
+    """тест хранилища кэша в памяти процесса"""
+    backend = MemoryCacheBackend(maxsize=10)
+    await backend.set("a", "1", ttl=60)
+    await backend.set("b", "2", ttl=60)
+    assert await backend.get("a") == "1"
+    assert await backend.get_many(["a", "b", "c"]) == ["1", "2", None]
+    await backend.delete("a", "c")
+    assert await backend.get("a") is None
+    await backend.set_many({"a": "3", "c": "4"}, ttl=60)
+    assert await backend.get_many(["a", "b", "c"]) == ["3", "2", "4"]
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_redis_cache_backend_unavailable():
+    """тест перехода на postgres при недоступном redis"""
+    client = aioredis.from_url("redis://127.0.0.1:1/0", decode_responses=True)
+    backend = RedisCacheBackend(client, timeout=0.5, retry_after=60)
+    assert await backend.get("a") is None
+    assert backend.errors == 1
+    assert await backend.get_many(["a", "b"]) == [None, None]
+    await backend.set("a", "1", ttl=60)
+    await backend.set_many({"a": "1", "b": "2"}, ttl=60)
+    await backend.delete("a")
+    assert backend.errors == 1
+
+
+@pytest.mark.cache
+@pytest.mark.asyncio
+async def test_cache_invalidator():
+    """тест рассылки инвалидаций между воркерами"""
+    backend = MemoryCacheBackend(maxsize=10)
+    workers = [
+        CacheInvalidator(TTLCache(name="test", maxsize=10, ttl=60), "invalidate:test", backend) for _ in range(2)
+    ]
+    for worker in workers:
+        worker.cache.set(1, "tweet")
+        worker.start()
+    await asyncio.sleep(0)
+    assert workers[1].cache.get(1) == "tweet"
+    await workers[0].invalidate(1)
+    await asyncio.sleep(0.01)
+    assert 1 not in workers[0].cache
+    assert 1 not in workers[1].cache
+    assert workers[1].received == 1
+    assert workers[0].received == 0
+    stats = workers[1].stats()
+    assert stats["hit_ratio"] == 1.0
+    assert stats["max_hit_age"] >= 0
+    for worker in workers:
+        await worker.stop()
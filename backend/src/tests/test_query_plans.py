@@ -0,0 +1,272 @@
+"""
+test_query_plans.py
+-------------------
+
+Проверка планов запросов слоя СУБД на засеянных данных.
+
+Note
+----
+    Каждый запрос методов ``*DbService`` перехватывается до выполнения и прогоняется через ``EXPLAIN``:
+    SELECT - с ``ANALYZE``, изменяющие запросы - без него, чтобы не выполнять их дважды.
+    Тест падает, если в плане есть последовательное сканирование таблицы, в которой больше
+    ``LARGE_TABLE_ROWS`` строк.
+"""
+import json
+import secrets
+import typing as t
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import event, text
+
+from app_media.db_services import MediaDbService
+from app_tweets import partitions
+from app_tweets.db_services import TweetDbService
+from app_tweets.schemas import TweetInSchema
+from app_users.db_services import AuthorDbService
+from db import engine, session
+
+LARGE_TABLE_ROWS = 10000
+SEED_AUTHORS = 20000
+SEED_TWEETS = 50000
+PARTITION_SIZE = 10000
+SEED_FOLLOWS = 3
+SEED_TABLES = ("authors", "follows", "tweets", "likes", "timelines", "hashtags", "medias")
+
+Plan = t.Tuple[str, dict]
+
+
+@contextmanager
+def explain_plans() -> t.Iterator[t.List[Plan]]:
+    """Контекстный менеджер собирает планы всех запросов, выполненных внутри него."""
+    plans: t.List[Plan] = []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            return
+        analyze = "ANALYZE, " if statement.lstrip().upper().startswith("SELECT") else ""
+        cursor.execute(f"EXPLAIN ({analyze}FORMAT JSON) {statement}", parameters)
+        plan = cursor.fetchone()[0]
+        plans.append((statement, (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", explain)
+    try:
+        yield plans
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", explain)
+
+
+def seq_scans(plan: dict) -> t.Iterator[str]:
+    """Функция возвращает таблицы, которые план читает последовательным сканированием."""
+    if plan["Node Type"] == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def index_scans(plan: dict) -> t.Iterator[str]:
+    """Функция возвращает индексы, которые использует план."""
+    if "Index Name" in plan:
+        yield plan["Index Name"]
+    for child in plan.get("Plans", []):
+        yield from index_scans(child)
+
+
+def id_range(first: int, last: int) -> range:
+    """Функция возвращает диапазон идентификаторов от первого до последнего включительно."""
+    return range(first, last + 1)
+
+
+async def seed(prefix: str) -> t.Tuple[range, range, range]:
+    """Функция засевает СУБД авторами, подписками, твитами, лайками, лентами, хэштегами и медиа.
+
+    Returns
+    -------
+    Tuple[range, range, range]
+        Диапазоны идентификаторов засеянных авторов, твитов и медиа.
+    """
+    bounds = "WITH inserted AS ({}) SELECT min(id), max(id) FROM inserted"
+    async with session() as async_session:
+        async with async_session.begin():
+            qs = await async_session.execute(
+                text(
+                    bounds.format(
+                        "INSERT INTO authors (name, password, api_key, soft_delete) "
+                        "SELECT :prefix || g, 'x', :prefix || g, false "
+                        "FROM generate_series(1, CAST(:count AS int)) AS g RETURNING id"
+                    )
+                ),
+                dict(prefix=prefix, count=SEED_AUTHORS),
+            )
+            authors = id_range(*qs.one())
+            await async_session.execute(
+                text(
+                    "INSERT INTO follows SELECT a, CAST(:first AS int) + (a - CAST(:first AS int) + k) % :authors "
+                    "FROM generate_series(CAST(:first AS int), CAST(:last AS int)) AS a, "
+                    "generate_series(1, :follows) AS k"
+                ),
+                dict(first=authors[0], last=authors[-1], authors=SEED_AUTHORS, follows=SEED_FOLLOWS),
+            )
+            qs = await async_session.execute(
+                text(
+                    bounds.format(
+                        "INSERT INTO tweets (content, author_id, attachments, soft_delete, like_count) "
+                        "SELECT 'засеянный твит номер ' || g || ' #' || :prefix || (g % 100), "
+                        "CAST(:first AS int) + g % CAST(:authors AS int), '[]', g % 10 = 0, 0 "
+                        "FROM generate_series(1, CAST(:count AS int)) AS g RETURNING id"
+                    )
+                ),
+                dict(prefix=prefix, first=authors.start, authors=SEED_AUTHORS, count=SEED_TWEETS),
+            )
+            tweets = id_range(*qs.one())
+            seeded = "SELECT id, author_id FROM tweets WHERE id BETWEEN :first AND :last"
+            params = dict(first=tweets[0], last=tweets[-1], prefix=prefix)
+            await async_session.execute(text(f"INSERT INTO likes SELECT id, author_id FROM ({seeded}) AS t"), params)
+            await async_session.execute(
+                text(f"INSERT INTO timelines SELECT author_id, id FROM ({seeded}) AS t"), params
+            )
+            await async_session.execute(
+                text(f"INSERT INTO hashtags SELECT :prefix || (id % 100), id FROM ({seeded}) AS t"), params
+            )
+            qs = await async_session.execute(
+                text(
+                    bounds.format(
+                        "INSERT INTO medias (link, hash) SELECT '/static/media/' || :prefix || g, md5(:prefix || g) "
+                        "FROM generate_series(1, CAST(:count AS int)) AS g RETURNING id"
+                    )
+                ),
+                dict(prefix=prefix, count=SEED_AUTHORS),
+            )
+            medias = id_range(*qs.one())
+    # VACUUM переносит строки из списка ожидания GIN-индекса в сам индекс, как это делает autovacuum
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in SEED_TABLES:
+            await conn.execute(text(f"VACUUM ANALYZE {table}"))
+    return authors, tweets, medias
+
+
+async def unseed(prefix: str, tweets: range) -> None:
+    """Функция удаляет засеянные твиты и всё, что на них ссылается, чтобы они не влияли на остальные тесты.
+    Авторы и медиа остаются: их имена и хэши уникальны для каждого запуска.
+    """
+    async with session() as async_session:
+        async with async_session.begin():
+            params = dict(first=tweets[0], last=tweets[-1], prefix=prefix)
+            await async_session.execute(text("DELETE FROM tweets WHERE id BETWEEN :first AND :last"), params)
+            await async_session.execute(text("DELETE FROM hashtag_counters WHERE tag LIKE :prefix || '%'"), params)
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_no_seq_scans_on_large_tables():
+    """тест планов всех запросов слоя СУБД на засеянных данных"""
+    prefix = f"plan{secrets.token_hex(4)}"
+    author_ids, tweet_ids, media_ids = await seed(prefix)
+    author_id, other_id = author_ids[SEED_AUTHORS // 2], author_ids[SEED_AUTHORS // 2 + 1]
+    tweet_id, tweet_author_id = tweet_ids[SEED_TWEETS // 2], author_ids[(SEED_TWEETS // 2 + 1) % SEED_AUTHORS]
+    tweets, authors, medias = TweetDbService(), AuthorDbService(), MediaDbService()
+    bucket = datetime.now(timezone.utc).replace(microsecond=0)
+    try:
+        async with session() as async_session:
+            qs = await async_session.execute(
+                text("SELECT relname FROM pg_class WHERE relname = ANY(:tables) AND reltuples > :rows"),
+                dict(tables=list(SEED_TABLES), rows=LARGE_TABLE_ROWS),
+            )
+            large_tables = set(qs.scalars().all())
+        assert large_tables == set(SEED_TABLES)
+
+        with explain_plans() as plans:
+            await tweets.get_list(author_id=author_id, limit=10)
+            await tweets.get_list(author_id=author_id, limit=10, before_id=tweet_ids[-1])
+            await tweets.get_list(author_id=author_id, limit=10, after_id=tweet_ids[0])
+            new_tweet = TweetInSchema(tweet_data=f"новый #{prefix}1", tweet_media_ids=list(media_ids[:2]))
+            created = await tweets.create_tweet(new_tweet, author_id, media_ids=list(media_ids[:2]))
+            await tweets.create_tweets([new_tweet, new_tweet], author_id)
+            publish = dict(bucket=bucket, fanout_limit=10000, notify=True)
+            await tweets.create_tweet(new_tweet, author_id, tags=[f"{prefix}1"], **publish)
+            await tweets.create_tweets([new_tweet, new_tweet], author_id, tags=[[f"{prefix}1"], []], **publish)
+            await tweets.get_tag_tweets(f"{prefix}1", limit=10)
+            await tweets.get_tag_tweets(f"{prefix}1", limit=10, before_id=tweet_ids[-1])
+            await tweets.get_trending(since=bucket, limit=10)
+            await tweets.prune_hashtag_counters(before=bucket.replace(year=2000))
+            await tweets.get_timeline(owner_id=author_id, fanout_limit=10000, limit=10)
+            await tweets.get_timeline(owner_id=author_id, fanout_limit=10000, limit=10, before_id=tweet_ids[-1])
+            await tweets.search("777", limit=10)
+            await tweets.get_tweet_by_id(tweet_id)
+            await tweets.add_like(tweet_id, author_id)
+            await tweets.like_exists(tweet_id, author_id)
+            await tweets.remove_like(tweet_id, author_id)
+            await tweets.flush_likes(added=[(tweet_id, other_id)], removed=[(tweet_id, tweet_author_id)])
+            await tweets.update_like_in_tweet(tweet_id, [dict(user_id=author_id, name=f"{prefix}1")])
+            await tweets.delete_tweet(created.id, author_id)
+            await tweets.archive_tweets(deleted_before=bucket.replace(year=2000), limit=10)
+            await authors.get_author(author_id=author_id)
+            await authors.get_author(api_key=f"{prefix}3")
+            await authors.get_author(name=f"{prefix}4")
+            await authors.get_authors([author_ids[5], author_ids[6]])
+            await authors.get_principal(f"{prefix}7")
+            await authors.follow(author_ids[8], other_id)
+            await authors.get_followee_ids(author_ids[8])
+            await authors.unfollow(author_ids[8], other_id)
+            await authors.create_author(name=f"{prefix}new", api_key=f"{prefix}new", password="x")
+            await medias.get_media(media_id=media_ids[3])
+            await medias.get_media(hash="0" * 32)
+            await medias.create_media(hash=f"{prefix}hash", file_name=f"{prefix}.jpg")
+            await medias.get_many_media(list(media_ids[4:8]))
+    finally:
+        await unseed(prefix, tweet_ids)
+
+    assert len(plans) > 30
+    assert "ix_tweets_author_id_id_live" in {index for _, plan in plans for index in index_scans(plan)}
+    offenders = [(table, statement) for statement, plan in plans for table in seq_scans(plan) if table in large_tables]
+    assert offenders == []
+
+
+def partition_scans(plan: dict) -> t.Iterator[str]:
+    """Функция возвращает секции твитов, которые план действительно читает."""
+    if plan.get("Relation Name", "").startswith("tweets_p") and plan.get("Actual Loops", 1) > 0:
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from partition_scans(child)
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_partition_pruning():
+    """тест отсечения секций запросами слоя СУБД к секционированной таблице твитов"""
+    async with engine.begin() as conn:
+        await conn.run_sync(partitions.partition_tweets, PARTITION_SIZE, SEED_TWEETS // PARTITION_SIZE + 2)
+    prefix = f"part{secrets.token_hex(4)}"
+    tweet_ids = range(0)
+    try:
+        author_ids, tweet_ids, media_ids = await seed(prefix)
+        author_id, other_id = author_ids[SEED_AUTHORS // 2], author_ids[SEED_AUTHORS // 2 + 1]
+        tweet_id, tweet_author_id = tweet_ids[SEED_TWEETS // 2], author_ids[(SEED_TWEETS // 2 + 1) % SEED_AUTHORS]
+        tweets = TweetDbService()
+        async with engine.connect() as conn:
+            tweet_partitions = await conn.run_sync(partitions.list_partitions)
+        with explain_plans() as point_plans:
+            await tweets.get_tweet_by_id(tweet_id)
+            await tweets.add_like(tweet_id, author_id)
+            await tweets.like_exists(tweet_id, author_id)
+            await tweets.remove_like(tweet_id, author_id)
+            await tweets.flush_likes(added=[(tweet_id, other_id)], removed=[(tweet_id, tweet_author_id)])
+            await tweets.update_like_in_tweet(tweet_id, [])
+            await tweets.delete_tweet(tweet_id, tweet_author_id)
+        with explain_plans() as page_plans:
+            await tweets.get_list(author_id=author_id, limit=10, before_id=tweet_id)
+            await tweets.get_timeline(owner_id=author_id, fanout_limit=10000, limit=10, before_id=tweet_id)
+            await tweets.get_tag_tweets(f"{prefix}1", limit=10, before_id=tweet_id)
+    finally:
+        if tweet_ids:
+            await unseed(prefix, tweet_ids)
+        async with engine.begin() as conn:
+            await conn.run_sync(partitions.unpartition_tweets)
+
+    (home,) = [name for name, lower, upper in tweet_partitions if (lower or 0) <= tweet_id < upper]
+    assert {name for _, plan in point_plans for name in partition_scans(plan)} == {home}
+    newer = {name for name, lower, _ in tweet_partitions if lower is not None and lower > tweet_id}
+    assert len(newer) >= 2
+    assert {name for _, plan in page_plans for name in partition_scans(plan)} & newer == set()
@@ -1,11 +1,19 @@
+import json
+
 import pytest
 from fastapi import status
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
 from httpx import AsyncClient
 from loguru import logger
 
+from app_tweets.db_services import tweet_cache
+from app_tweets.render import tweet_fragments
 from app_tweets.schemas import TweetListOutSchema
 from app_users.schemas import AuthorLikeSchema
 from exceptions import BackendException
+from responses import orjson_response
+from settings import settings
 
 
 @pytest.mark.api
@@ -25,6 +33,87 @@ async def test_get_tweet_list_api(get_tweet_schemas_list, get_app, faker):
     logger.info("complete")
 
 
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_get_tweet_list_pages_api(get_tweet_schemas_list, get_app):
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    author = author_list[0]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/api/tweets", headers={"api-key": author.api_key}, params={"limit": 6})
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.json().keys()) == {"result", "tweets"}
+        first_page = [tweet["id"] for tweet in response.json()["tweets"]]
+        cursor = response.headers["X-Next-Cursor"]
+        response = await ac.get("/api/tweets", headers={"api-key": author.api_key}, params={"cursor": cursor})
+        second_page = [tweet["id"] for tweet in response.json()["tweets"]]
+        assert "X-Next-Cursor" not in response.headers
+        assert len(first_page) == 6 and len(second_page) == 4
+        assert first_page + second_page == sorted(first_page + second_page, reverse=True)
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_orjson_response_api(get_tweet_schemas_list, get_app):
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    author = author_list[0]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.get("/api/tweets", headers={"api-key": author.api_key}, params={"limit": 6})
+    assert response.headers["content-type"] == "application/json"
+    content = TweetListOutSchema(**response.json(), next_cursor=response.headers["X-Next-Cursor"])
+    field = create_response_field(name="Response_test", type_=TweetListOutSchema)
+    expected = await serialize_response(field=field, response_content=content, is_coroutine=True)
+    fast = orjson_response(content, headers={"X-Next-Cursor": content.next_cursor})
+    assert json.loads(fast.body) == expected == response.json()
+    assert fast.headers["X-Next-Cursor"] == response.headers["X-Next-Cursor"]
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_tweet_fragments_api(get_tweet_schemas_list, tweet_db_service, get_app):
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    author = author_list[0]
+    headers, params = {"api-key": author.api_key}, {"limit": 5}
+    tweet_fragments.clear()
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        first = await ac.get("/api/tweets", headers=headers, params=params)
+        hits = tweet_fragments.stats()["hits"]
+        second = await ac.get("/api/tweets", headers=headers, params=params)
+        assert second.content == first.content
+        assert tweet_fragments.stats()["hits"] - hits == len(first.json()["tweets"]) == 5
+        liked = first.json()["tweets"][0]["id"]
+        version = (await tweet_db_service.get_tweet_by_id(liked)).version
+        await ac.post(f"/api/tweets/{liked}/likes", headers=headers)
+        assert (await tweet_db_service.get_tweet_by_id(liked)).version > version
+        third = await ac.get("/api/tweets", headers=headers, params=params)
+    assert third.headers["content-type"] == "application/json"
+    assert third.json()["tweets"][0]["likes"] == [{"user_id": author.id, "name": author.name}]
+    assert third.json()["tweets"][1:] == first.json()["tweets"][1:]
+    assert json.loads(third.content) == TweetListOutSchema(**third.json()).dict()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_get_timeline_api(get_authors_schemas_list, get_app, faker):
+    app = await get_app
+    reader, writer = (await get_authors_schemas_list)[:2]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post(f"/api/users/{writer.id}/follow", headers={"api-key": reader.api_key})
+        assert response.status_code == status.HTTP_200_OK
+        data = dict(tweet_data=faker.text(200), tweet_media_ids=[])
+        response = await ac.post("/api/tweets", headers={"api-key": writer.api_key}, json=data)
+        tweet_id = response.json()["tweet_id"]
+        response = await ac.get("/api/tweets/feed", headers={"api-key": reader.api_key}, params={"limit": 5})
+        assert response.status_code == status.HTTP_200_OK
+        response_dict = response.json()
+        assert set(response_dict.keys()) == {"result", "tweets"}
+        assert [tweet["id"] for tweet in response_dict["tweets"]] == [tweet_id]
+        response = await ac.get("/api/tweets/feed", headers={"api-key": reader.api_key}, params={"limit": 0})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 @pytest.mark.api
 @pytest.mark.asyncio
 async def test_create_tweet_api(get_authors_api_key_list, get_app, faker):
@@ -44,6 +133,70 @@ async def test_create_tweet_api(get_authors_api_key_list, get_app, faker):
     logger.info("complete")
 
 
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_create_tweets_batch_api(get_authors_api_key_list, get_app, faker):
+    app = await get_app
+    api_key = (await get_authors_api_key_list)[0]
+    lines = [json.dumps(dict(tweet_data=faker.text(100))) for _ in range(3)] + ["{not json"]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/tweets/batch",
+            headers={"api-key": api_key, "content-type": "application/x-ndjson"},
+            content="\n".join(lines).encode(),
+        )
+        assert response.status_code == status.HTTP_200_OK
+        response_dict = response.json()
+        assert set(response_dict.keys()) == {"result", "tweets"}
+        assert [item["result"] for item in response_dict["tweets"]] == [True, True, True, False]
+        for item in response_dict["tweets"][:3]:
+            response = await ac.get(f"/api/tweets/{item['tweet_id']}", headers={"api-key": api_key})
+            assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_search_tweets_api(get_authors_api_key_list, get_app, faker):
+    app = await get_app
+    api_key = (await get_authors_api_key_list)[0]
+    marker = faker.pystr(min_chars=12, max_chars=12).lower()
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        for _ in range(3):
+            data = dict(tweet_data=f"{faker.text(50)} {marker}", tweet_media_ids=[])
+            await ac.post("/api/tweets", headers={"api-key": api_key}, json=data)
+        response = await ac.get("/api/tweets/search", headers={"api-key": api_key}, params={"q": marker, "limit": 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.json().keys()) == {"result", "tweets"}
+        assert len(response.json()["tweets"]) == 2
+        params = {"q": marker, "limit": 2, "cursor": response.headers["X-Next-Cursor"]}
+        response = await ac.get("/api/tweets/search", headers={"api-key": api_key}, params=params)
+        assert len(response.json()["tweets"]) == 1
+        response = await ac.get("/api/tweets/search", headers={"api-key": api_key}, params={"q": ""})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_hashtags_api(get_authors_api_key_list, get_app, faker):
+    app = await get_app
+    api_key = (await get_authors_api_key_list)[0]
+    tag = f"tag{faker.pystr(min_chars=10, max_chars=10).lower()}"
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        for _ in range(3):
+            data = dict(tweet_data=f"{faker.text(50)} #{tag}", tweet_media_ids=[])
+            await ac.post("/api/tweets", headers={"api-key": api_key}, json=data)
+        response = await ac.get(f"/api/tags/{tag}/tweets", headers={"api-key": api_key}, params={"limit": 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.json().keys()) == {"result", "tweets"}
+        assert len(response.json()["tweets"]) == 2
+        params = {"limit": 2, "cursor": response.headers["X-Next-Cursor"]}
+        response = await ac.get(f"/api/tags/{tag}/tweets", headers={"api-key": api_key}, params=params)
+        assert len(response.json()["tweets"]) == 1
+        response = await ac.get("/api/tags/trending", headers={"api-key": api_key}, params={"limit": 100})
+        assert response.status_code == status.HTTP_200_OK
+        assert {"tag": tag, "count": 3} in response.json()["tags"]
+
+
 @pytest.mark.api
 @pytest.mark.asyncio
 async def test_get_tweet_api(get_tweet_schemas_list, get_app, faker):
@@ -115,3 +268,149 @@ async def test_add_remove_like_api(get_tweet_schemas_list, tweet_db_service, get
             assert AuthorLikeSchema(user_id=verify_author.id, name=verify_author.name).dict() not in verify_tweet.likes
             logger.info(verify_tweet)
     logger.info("complete")
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_conditional_get_api(get_tweet_schemas_list, get_app):
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    author, liker = author_list[0], author_list[1]
+    headers = {"api-key": author.api_key}
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        first = await ac.get("/api/tweets", headers=headers)
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "private, no-cache"
+        for if_none_match in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+            response = await ac.get("/api/tweets", headers={**headers, "if-none-match": if_none_match})
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response.content == b""
+            assert response.headers["etag"] == etag
+
+        tweet_id = first.json()["tweets"][0]["id"]
+        single = await ac.get(f"/api/tweets/{tweet_id}", headers=headers)
+        tweet_etag = single.headers["etag"]
+        response = await ac.get(f"/api/tweets/{tweet_id}", headers={**headers, "if-none-match": tweet_etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        await ac.post(f"/api/tweets/{tweet_id}/likes", headers={"api-key": liker.api_key})
+        response = await ac.get(f"/api/tweets/{tweet_id}", headers={**headers, "if-none-match": tweet_etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != tweet_etag
+        assert response.json()["tweet"]["likes"] == [{"user_id": liker.id, "name": liker.name}]
+        response = await ac.get("/api/tweets", headers={**headers, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        etag = response.headers["etag"]
+
+        await ac.post("/api/tweets", headers=headers, json={"tweet_data": "условный запрос"})
+        response = await ac.get("/api/tweets", headers={**headers, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["tweets"][0]["content"] == "условный запрос"
+        response = await ac.get("/api/tweets", headers={"api-key": liker.api_key, "if-none-match": etag})
+        assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_get_tweets_by_ids_api(get_tweet_schemas_list, get_app, count_queries):
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    ids = [tweet.id for tweet in tweet_list[:5]]
+    missing = max(tweet.id for tweet in tweet_list) + 1000
+    tweet_cache.clear()
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with count_queries() as queries:
+            response = await ac.get(
+                "/api/tweets", params={"ids": ",".join(map(str, [missing, *ids, ids[0]]))}, headers={"api-key": "test"}
+            )
+        assert response.status_code == status.HTTP_200_OK
+        items = response.json()["tweets"]
+        assert [item["id"] for item in items] == [missing, *ids]
+        assert items[0]["result"] is False and items[0]["error_type"] == "TWEET_NOT_EXIST"
+        assert all(item["result"] and item["tweet"]["id"] == item["id"] for item in items[1:])
+        assert len([query for query in queries if "FROM tweets " in query]) == 1
+        with pytest.raises(BackendException):
+            await ac.get("/api/tweets", params={"ids": "1,x"}, headers={"api-key": "test"})
+        with pytest.raises(BackendException) as error:
+            await ac.get("/api/tweets", params={"ids": f"{ids[0]},3000000000"}, headers={"api-key": "test"})
+        assert error.value.error_type == "INVALID_IDS"
+        with pytest.raises(BackendException):
+            too_many = ",".join(map(str, range(1, settings.multi_get_max + 2)))
+            await ac.get("/api/tweets", params={"ids": too_many}, headers={"api-key": "test"})
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_tweet_changes_api(get_tweet_schemas_list, get_app):
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    author, liker = author_list[0], author_list[1]
+    headers = {"api-key": author.api_key}
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        page = await ac.get("/api/tweets", headers=headers)
+        version = page.headers["x-changes-version"]
+        since_id = page.json()["tweets"][0]["id"]
+        params = {"since_version": version, "since_id": since_id}
+        response = await ac.get("/api/tweets", params=params, headers=headers)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert response.content == b"" and response.headers["x-changes-version"] == version
+
+        await ac.post(f"/api/tweets/{since_id}/likes", headers={"api-key": liker.api_key})
+        response = await ac.get("/api/tweets", params=params, headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert body["likes"] == [
+            {"id": since_id, "like_count": 1, "likes": [{"user_id": liker.id, "name": liker.name}]}
+        ]
+        assert body["tweets"] == [] and body["deleted"] == []
+        assert response.headers["x-changes-version"] == str(body["version"])
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_api_key_header_api(get_tweet_schemas_list, get_app):
+    """тест: эндпоинты, возвращающие готовый ответ, отдают заголовок api-key, как и эндпоинты со схемами"""
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    author = author_list[0]
+    headers = {"api-key": author.api_key}
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        first = await ac.get("/api/tweets", headers=headers)
+        me = await ac.get("/api/users/me", headers=headers)
+        responses = [
+            first,
+            await ac.get("/api/tweets", headers={**headers, "if-none-match": first.headers["etag"]}),
+            await ac.get("/api/tweets", headers=headers, params={"ids": str(tweet_list[0].id)}),
+            await ac.get("/api/tweets", headers=headers, params={"since_version": first.headers["x-changes-version"]}),
+            await ac.get("/api/tweets/feed", headers=headers),
+            me,
+            await ac.get("/api/users/me", headers={**headers, "if-none-match": me.headers["etag"]}),
+            await ac.get(f"/api/users/{author.id}", headers=headers),
+        ]
+    assert [response.status_code for response in responses] == [200, 304, 200, 204, 200, 200, 304, 200]
+    assert [response.headers.get("api-key") for response in responses] == [author.api_key] * len(responses)
+    assert responses[0].headers["content-type"] == "application/json"
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_conditional_get_queries_api(get_tweet_schemas_list, get_app, count_queries):
+    """тест: версия читается только для условного запроса и берётся из кэша твита или профиля"""
+    app = await get_app
+    author_list, tweet_list = await get_tweet_schemas_list
+    author, tweet_id = author_list[0], tweet_list[0].id
+    headers = {"api-key": author.api_key}
+    tweet_cache.clear()
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with count_queries() as queries:
+            first = await ac.get(f"/api/tweets/{tweet_id}", headers=headers)
+        assert len([query for query in queries if "tweets" in query]) == 1
+        me = await ac.get("/api/users/me", headers=headers)
+        with count_queries() as queries:
+            responses = [
+                await ac.get(f"/api/tweets/{tweet_id}", headers=headers),
+                await ac.get(f"/api/tweets/{tweet_id}", headers={**headers, "if-none-match": first.headers["etag"]}),
+                await ac.get("/api/users/me", headers={**headers, "if-none-match": me.headers["etag"]}),
+            ]
+        assert [response.status_code for response in responses] == [200, 304, 304]
+        assert queries == []
@@ -1,9 +1,19 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
 import pytest
 from loguru import logger
+from sqlalchemy import BigInteger, cast, func, insert, select, update
 
+from app_media.services import MediaService
+from app_tweets.archiver import TweetArchiver
+from app_tweets.db_services import ARCHIVE_LOCK_KEY, tweet_cache
+from app_tweets.models import HashtagCounter, Like, Timeline, Tweet, TweetArchive
 from app_tweets.schemas import TweetInSchema, TweetModelSchema
+from db import session
 from schemas import SuccessSchema
-from tests.test_media_service import create_many_medias
+from tests.test_media_service import RandomColorRectangle, create_many_medias
 
 
 @pytest.mark.dbtest
@@ -30,6 +40,7 @@ async def test_create_tweet(get_authors_id_list, author_service, tweet_db_servic
             "likes",
             "attachments",
             "author",
+            "version",
         }
 
 
@@ -51,6 +62,7 @@ async def test_get_tweet_by_id(get_tweet_schemas_list, tweet_db_service):
             "likes",
             "attachments",
             "author",
+            "version",
         }
         assert selected_tweet == tweet
 
@@ -74,10 +86,31 @@ async def test_get_tweet_list_by_author_id(get_tweet_schemas_list, tweet_db_serv
                 "likes",
                 "attachments",
                 "author",
+                "version",
             }
             assert tweet == tweet_dict.get(tweet.id)
 
 
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_tweet_projection(get_tweet_schemas_list, tweet_db_service, count_queries):
+    """тест проекции: чтение твитов не выбирает графы подписок и секреты авторов"""
+    authors_list, tweet_list = await get_tweet_schemas_list
+    tweet = tweet_list[0]
+    await tweet_db_service.add_like(tweet.id, authors_list[1].id)
+    tweet_cache.invalidate(tweet.id)
+    with count_queries() as queries:
+        selected_tweet = await tweet_db_service.get_tweet_by_id(tweet.id)
+        await tweet_db_service.get_list(author_id=tweet.author_id)
+        await tweet_db_service.get_timeline(owner_id=tweet.author_id, fanout_limit=10, limit=10)
+    assert len(queries) > 0
+    selected = [query.split(" FROM ")[0] for query in queries]
+    for column in ("password", "api_key", "search_vector"):
+        assert [columns for columns in selected if f".{column} AS" in columns] == []
+    assert set(selected_tweet.author.dict()) == {"id", "name"}
+    assert [like.name for like in selected_tweet.likes] == [authors_list[1].name]
+
+
 @pytest.mark.dbtest
 @pytest.mark.asyncio
 async def test_update_likes_for_tweet(get_tweet_schemas_list, tweet_db_service, faker):
@@ -93,6 +126,68 @@ async def test_update_likes_for_tweet(get_tweet_schemas_list, tweet_db_service,
     logger.info("verify likes in tweets")
 
 
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_create_tweet_with_media_ids(get_authors_id_list, tweet_db_service, faker, count_queries):
+    """тест создания твита одним запросом со ссылками на картинки по идентификаторам"""
+    user_id = (await get_authors_id_list)[0]
+    media_service = MediaService()
+    medias = [
+        await media_service.get_or_create_media(
+            RandomColorRectangle().random_rectangle((50, 70), (100, 250)).as_upload_file()
+        )
+        for _ in range(3)
+    ]
+    media_ids = [media.media_id for media in reversed(medias)]
+    links = [(await media_service.get_many_media([media_id]))[0] for media_id in media_ids]
+    with count_queries() as queries:
+        tweet = await tweet_db_service.create_tweet(
+            TweetInSchema(tweet_data=faker.text(100)), author_id=user_id, media_ids=media_ids
+        )
+    assert len(queries) == 1
+    assert tweet.attachments == links
+    assert tweet.author.id == user_id
+    assert tweet == await tweet_db_service.get_tweet_by_id(tweet.id)
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_get_tweet_by_id_cache(get_tweet_schemas_list, tweet_db_service, count_queries):
+    """тест кэша твитов и его инвалидации лайком"""
+    authors_list, tweet_list = await get_tweet_schemas_list
+    tweet = tweet_list[0]
+    await tweet_db_service.get_tweet_by_id(tweet.id)
+    with count_queries() as queries:
+        assert await tweet_db_service.get_tweet_by_id(tweet.id) == tweet
+        assert queries == []
+        await tweet_db_service.add_like(tweet.id, authors_list[1].id)
+        queries.clear()
+        selected_tweet = await tweet_db_service.get_tweet_by_id(tweet.id)
+    assert len(queries) > 0
+    assert [like.user_id for like in selected_tweet.likes] == [authors_list[1].id]
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_add_remove_like(get_tweet_schemas_list, tweet_db_service):
+    """тест атомарных лайков и счётчика"""
+    authors_list, tweet_list = await get_tweet_schemas_list
+    tweet = tweet_list[0]
+    results = await asyncio.gather(*(tweet_db_service.add_like(tweet.id, authors_list[1].id) for _ in range(5)))
+    assert sorted(results) == [False, False, False, False, True]
+    assert await tweet_db_service.add_like(tweet.id, authors_list[2].id) is True
+    assert await tweet_db_service.add_like(10**9, authors_list[2].id) is False
+    assert await tweet_db_service.remove_like(tweet.id, authors_list[2].id) is True
+    assert await tweet_db_service.remove_like(tweet.id, authors_list[2].id) is False
+    selected_tweet = await tweet_db_service.get_tweet_by_id(tweet_id=tweet.id)
+    assert [like.dict() for like in selected_tweet.likes] == [
+        dict(user_id=authors_list[1].id, name=authors_list[1].name)
+    ]
+    async with session() as async_session:
+        like_count = await async_session.scalar(select(Tweet.like_count).filter_by(id=tweet.id))
+    assert like_count == 1
+
+
 @pytest.mark.dbtest
 @pytest.mark.asyncio
 async def test_delete_tweet(get_tweet_schemas_list, tweet_db_service):
@@ -106,3 +201,110 @@ async def test_delete_tweet(get_tweet_schemas_list, tweet_db_service):
         assert selected_tweet.id == tweet.id
         assert selected_tweet.soft_delete is True
     logger.info("delete tweets")
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_archive_deleted_tweets(get_tweet_schemas_list, tweet_db_service):
+    """тест переноса удалённых твитов в архив"""
+    authors_list, tweet_list = await get_tweet_schemas_list
+    kept, fresh = tweet_list[2], tweet_list[3]
+    archived = [
+        await tweet_db_service.create_tweet(TweetInSchema(tweet_data=tweet.content), tweet.author_id, fanout_limit=10)
+        for tweet in tweet_list[:2]
+    ]
+    await tweet_db_service.add_like(archived[0].id, authors_list[1].id)
+    for tweet in (*archived, fresh):
+        await tweet_db_service.delete_tweet(tweet_id=tweet.id, author_id=tweet.author_id)
+    async with session() as async_session:
+        async with async_session.begin():
+            await async_session.execute(
+                update(Tweet)
+                .where(Tweet.id.in_([tweet.id for tweet in archived]))
+                .values(deleted_at=datetime.now(timezone.utc) - timedelta(hours=2))
+            )
+
+    async with session() as async_session:
+        async with async_session.begin():
+            await async_session.execute(select(func.pg_advisory_xact_lock(cast(ARCHIVE_LOCK_KEY, BigInteger))))
+            assert await tweet_db_service.archive_tweets(datetime.now(timezone.utc), limit=10) is None
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    tag = f"prune{archived[0].id}"
+    counters = [dict(tag=tag, bucket=now - timedelta(hours=2), count=1), dict(tag=tag, bucket=now, count=1)]
+    async with session() as async_session:
+        async with async_session.begin():
+            await async_session.execute(insert(HashtagCounter).values(counters))
+
+    archiver = TweetArchiver(
+        tweet_db_service, archive_after=3600, interval=1, batch_size=1, max_batches=10, trending_window=3600
+    )
+    assert await archiver.run_once() == 2
+    assert archiver.stats()["archived"] == 2 and archiver.stats()["batches"] == 3
+    assert archiver.stats()["pruned"] >= 1
+    assert await archiver.run_once() == 0
+    async with session() as async_session:
+        buckets = select(HashtagCounter.bucket).where(HashtagCounter.tag == tag)
+        assert list((await async_session.execute(buckets)).scalars()) == [now]
+
+    ids = [tweet.id for tweet in (*archived, kept, fresh)]
+    async with session() as async_session:
+        assert set((await async_session.execute(select(Tweet.id).where(Tweet.id.in_(ids)))).scalars()) == {
+            kept.id,
+            fresh.id,
+        }
+        rows = (await async_session.execute(select(TweetArchive).where(TweetArchive.id.in_(ids)))).scalars().all()
+        assert {row.id for row in rows} == {tweet.id for tweet in archived}
+        leftovers = select(func.count()).select_from(Like).where(Like.tweet_id.in_(ids[:2]))
+        assert await async_session.scalar(leftovers) == 0
+        leftovers = select(func.count()).select_from(Timeline).where(Timeline.tweet_id.in_(ids[:2]))
+        assert await async_session.scalar(leftovers) == 0
+
+    tweet_cache.invalidate(archived[0].id)
+    selected_tweet = await tweet_db_service.get_tweet_by_id(archived[0].id)
+    assert selected_tweet.soft_delete is True
+    assert selected_tweet.content == archived[0].content
+    assert selected_tweet.author.id == archived[0].author_id
+    assert [like.user_id for like in selected_tweet.likes] == [authors_list[1].id]
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_changes_commit_order(get_tweet_schemas_list, tweet_db_service, monkeypatch):
+    """тест курсора изменений: версия, взятая раньше, не фиксируется после версии, которую уже вернул опрос"""
+    authors_list, tweet_list = await get_tweet_schemas_list
+    author = authors_list[0]
+    deleted = next(tweet for tweet in tweet_list if tweet.author_id == author.id)
+    since = max(tweet.version for tweet in tweet_list if tweet.author_id == author.id)
+    paused, resume = asyncio.Event(), asyncio.Event()
+
+    @asynccontextmanager
+    async def pausing_session():
+        """первый запрос транзакции выполняется, после чего транзакция ждёт, не фиксируясь"""
+        async with session() as async_session:
+            execute = async_session.execute
+
+            async def pause(*args, **kwargs):
+                result = await execute(*args, **kwargs)
+                async_session.execute = execute
+                paused.set()
+                await resume.wait()
+                return result
+
+            async_session.execute = pause
+            yield async_session
+
+    monkeypatch.setattr("app_tweets.db_services.session", pausing_session)
+    slow = asyncio.create_task(tweet_db_service.create_tweets([TweetInSchema(tweet_data="медленный")], author.id))
+    await asyncio.wait_for(paused.wait(), 5)
+    monkeypatch.setattr("app_tweets.db_services.session", session)
+    fast = asyncio.create_task(tweet_db_service.delete_tweet(tweet_id=deleted.id, author_id=author.id))
+    await asyncio.sleep(0.3)
+    _, _, polled = await tweet_db_service.get_changes(author.id, since, limit=100)
+    resume.set()
+    created = await asyncio.wait_for(slow, 5)
+    await asyncio.wait_for(fast, 5)
+
+    tweets, deleted_ids, _ = await tweet_db_service.get_changes(author.id, polled or since, limit=100)
+    assert [tweet.id for tweet in tweets] == created
+    assert deleted_ids == [deleted.id]
@@ -1,14 +1,28 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import orjson
 import pytest
 
+from app_media.services import MediaService
+from app_tweets.buffers import like_buffer
+from app_tweets.db_services import TweetDbService
 from app_tweets.schemas import (
     AuthorLikeSchema,
+    TrendingOutSchema,
+    TweetBatchOutSchema,
     TweetInSchema,
     TweetModelOutSchema,
     TweetOutSchema,
     TweetSchema,
 )
+from app_tweets.services import TweetService, extract_hashtags
+from app_tweets.stream import RESET, TweetStreamHub, tweet_stream
 from exceptions import BackendException
 from schemas import SuccessSchema
+from settings import settings
+from tests.test_media_service import RandomColorRectangle
 
 
 @pytest.mark.service
@@ -84,3 +98,319 @@ async def test_tweet_delete(get_tweet_schemas_list, tweet_service, faker):
             check_tweet = await tweet_service.get_tweet(tweet.id)
             assert check_tweet.tweet.soft_delete is True
             assert check_tweet.tweet.id == tweet.id
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_get_timeline(get_authors_schemas_list, tweet_service, author_service, faker, monkeypatch):
+    reader, writer, celebrity, stranger = (await get_authors_schemas_list)[:4]
+    await author_service.add_follow(writer.id, reader.api_key)
+    await author_service.add_follow(celebrity.id, reader.api_key)
+    monkeypatch.setattr("app_tweets.services.settings.timeline_fanout_limit", 0)
+    celebrity_tweet = await tweet_service.create_tweet(
+        TweetInSchema(tweet_data=faker.text(100), tweet_media_ids=[]), celebrity.api_key
+    )
+    monkeypatch.undo()
+    created = {}
+    for author in (reader, writer, stranger):
+        tweet = await tweet_service.create_tweet(
+            TweetInSchema(tweet_data=faker.text(100), tweet_media_ids=[]), author.api_key
+        )
+        created[author.id] = tweet.tweet_id
+
+    timeline = await tweet_service.get_timeline(reader.api_key, limit=10)
+    ids = [tweet.id for tweet in timeline.tweets]
+    assert created[stranger.id] not in ids
+    assert ids == [created[writer.id], created[reader.id]]
+
+    monkeypatch.setattr("app_tweets.services.settings.timeline_fanout_limit", 0)
+    timeline = await tweet_service.get_timeline(reader.api_key, limit=10)
+    assert [tweet.id for tweet in timeline.tweets] == [
+        created[writer.id],
+        created[reader.id],
+        celebrity_tweet.tweet_id,
+    ]
+    page = await tweet_service.get_timeline(reader.api_key, limit=2, before_id=created[reader.id])
+    assert [tweet.id for tweet in page.tweets] == [celebrity_tweet.tweet_id]
+
+    # после отписки в ленте не остаётся твитов автора: ни разложенных, ни прочитанных из таблицы твитов
+    monkeypatch.undo()
+    await author_service.remove_follow(writer.id, reader.api_key)
+    await author_service.remove_follow(celebrity.id, reader.api_key)
+    for fanout_limit in (settings.timeline_fanout_limit, 0):
+        monkeypatch.setattr("app_tweets.services.settings.timeline_fanout_limit", fanout_limit)
+        timeline = await tweet_service.get_timeline(reader.api_key, limit=10)
+        assert [tweet.id for tweet in timeline.tweets] == [created[reader.id]]
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_get_tweet_list_pages(get_tweet_schemas_list, tweet_service, faker):
+    authors_list, tweet_list = await get_tweet_schemas_list
+    author = authors_list[0]
+    expected = sorted((tweet.id for tweet in tweet_list if tweet.author_id == author.id), reverse=True)
+    seen, cursor = [], None
+    while True:
+        page = await tweet_service.get_list(author.api_key, limit=3, cursor=cursor)
+        seen.extend(tweet.id for tweet in page.tweets)
+        if not (cursor := page.next_cursor):
+            break
+    assert seen == expected
+
+    newer = await tweet_service.get_list(author.api_key, limit=3, after_id=expected[-1])
+    assert [tweet.id for tweet in newer.tweets] == expected[-4:-1]
+    with pytest.raises(BackendException):
+        await tweet_service.get_list(author.api_key, cursor=faker.pystr(10))
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_tweet_changes(get_authors_schemas_list, tweet_service, tweet_db_service, count_queries):
+    authors_list = await get_authors_schemas_list
+    author, liker = authors_list[0], authors_list[1]
+    first = await tweet_service.create_tweet(TweetInSchema(tweet_data="до опроса"), author.api_key)
+    page = await tweet_service.get_list(author.api_key)
+    version = max(tweet.version for tweet in page.tweets)
+    since_id = page.tweets[0].id
+    with count_queries() as queries:
+        assert await tweet_service.get_changes(author.api_key, version, since_id=since_id) is None
+    assert len([query for query in queries if "tweets" in query]) == 1
+
+    await tweet_service.add_like_to_tweet(first.tweet_id, liker.api_key)
+    second = await tweet_service.create_tweet(TweetInSchema(tweet_data="после опроса"), author.api_key)
+    changes = await tweet_service.get_changes(author.api_key, version, since_id=since_id)
+    assert [tweet.id for tweet in changes.tweets] == [second.tweet_id]
+    assert [(item.id, item.like_count) for item in changes.likes] == [(first.tweet_id, 1)]
+    assert changes.likes[0].likes == [AuthorLikeSchema(user_id=liker.id, name=liker.name)]
+    assert changes.deleted == [] and changes.version > version
+    assert await tweet_service.get_changes(author.api_key, changes.version, since_id=second.tweet_id) is None
+
+    limited = await tweet_service.get_changes(author.api_key, version, limit=1)
+    assert [tweet.id for tweet in limited.tweets] == [first.tweet_id] and limited.version < changes.version
+
+    version = changes.version
+    await tweet_service.delete_tweet(first.tweet_id, author.api_key)
+    changes = await tweet_service.get_changes(author.api_key, version, since_id=second.tweet_id)
+    assert changes.deleted == [first.tweet_id] and changes.tweets == [] and changes.likes == []
+    await tweet_db_service.archive_tweets(datetime.now(timezone.utc) + timedelta(seconds=1), limit=1000)
+    archived = await tweet_service.get_changes(author.api_key, version, since_id=second.tweet_id)
+    assert archived.deleted == [first.tweet_id] and archived.version == changes.version
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_buffered_likes(get_tweet_schemas_list, tweet_service, monkeypatch):
+    authors_list, tweet_list = await get_tweet_schemas_list
+    tweet = tweet_list[0]
+    monkeypatch.setattr("app_tweets.services.settings.like_write_mode", "buffer")
+    for author in authors_list[1:4]:
+        await tweet_service.add_like_to_tweet(tweet.id, author.api_key)
+    with pytest.raises(BackendException):
+        await tweet_service.add_like_to_tweet(tweet.id, authors_list[1].api_key)
+    await tweet_service.remove_like_from_tweet(tweet.id, authors_list[3].api_key)
+    with pytest.raises(BackendException):
+        await tweet_service.remove_like_from_tweet(tweet.id, authors_list[4].api_key)
+    with pytest.raises(BackendException):
+        await tweet_service.add_like_to_tweet(10**9, authors_list[1].api_key)
+    assert len(like_buffer) == 2
+    assert (await tweet_service.get_tweet(tweet.id)).tweet.likes == []
+
+    await like_buffer.flush()
+    await tweet_service.remove_like_from_tweet(tweet.id, authors_list[2].api_key)
+    await like_buffer.flush()
+    verify_tweet = await tweet_service.get_tweet(tweet.id)
+    assert verify_tweet.tweet.likes == [AuthorLikeSchema(user_id=authors_list[1].id, name=authors_list[1].name)]
+    assert like_buffer.stats()["flushed_likes"] >= 2
+    assert len(like_buffer) == 0
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_create_tweets_batch(get_authors_schemas_list, tweet_service, faker):
+    author = (await get_authors_schemas_list)[0]
+    media_service = MediaService()
+    media_ids = [
+        (
+            await media_service.get_or_create_media(
+                RandomColorRectangle().random_rectangle((50, 70), (100, 250)).as_upload_file()
+            )
+        ).media_id
+        for _ in range(2)
+    ]
+    medias = [(await media_service.get_many_media([media_id]))[0] for media_id in media_ids]
+    batch = [
+        dict(tweet_data=faker.text(100)),
+        dict(tweet_media_ids=[1]),
+        dict(tweet_data=faker.text(100), tweet_media_ids=media_ids[::-1]),
+    ]
+    result = await tweet_service.create_tweets(json.dumps(batch).encode(), ndjson=False, api_key=author.api_key)
+    assert isinstance(result, TweetBatchOutSchema)
+    assert [item.result for item in result.tweets] == [True, False, True]
+    assert result.tweets[1].error_type == "VALIDATION_ERROR"
+    assert result.tweets[0].tweet_id < result.tweets[2].tweet_id
+    tweet = await tweet_service.get_tweet(result.tweets[2].tweet_id)
+    assert tweet.tweet.content == batch[2]["tweet_data"]
+    assert tweet.tweet.attachments == medias[::-1]
+    with pytest.raises(BackendException):
+        await tweet_service.create_tweets(b"{}", ndjson=False, api_key=author.api_key)
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_search_tweets(get_authors_schemas_list, tweet_service, faker):
+    author = (await get_authors_schemas_list)[0]
+    marker = faker.pystr(min_chars=12, max_chars=12).lower()
+    contents = [
+        f"{marker} летят над городом",
+        f"{marker} {marker} летели вчера",
+        f"{marker} сидят дома",
+        "совсем другой твит",
+    ]
+    created = []
+    for content in contents:
+        tweet = await tweet_service.create_tweet(TweetInSchema(tweet_data=content, tweet_media_ids=[]), author.api_key)
+        created.append(tweet.tweet_id)
+    await tweet_service.delete_tweet(created[2], author.api_key)
+
+    result = await tweet_service.search(marker, limit=10)
+    assert [tweet.id for tweet in result.tweets] == [created[1], created[0]]
+    result = await tweet_service.search(f"{marker} города", limit=10)
+    assert [tweet.id for tweet in result.tweets] == [created[0]]
+    result = await tweet_service.search(f"{marker} -вчера", limit=10)
+    assert [tweet.id for tweet in result.tweets] == [created[0]]
+
+    first_page = await tweet_service.search(marker, limit=1)
+    assert [tweet.id for tweet in first_page.tweets] == [created[1]]
+    second_page = await tweet_service.search(marker, limit=1, cursor=first_page.next_cursor)
+    assert [tweet.id for tweet in second_page.tweets] == [created[0]]
+    with pytest.raises(BackendException):
+        await tweet_service.search(marker, limit=1, cursor=faker.pystr(8))
+
+
+def test_extract_hashtags():
+    text = "#Привет мир! #python3 и снова #привет, email a#b, ##двойной #" + "x" * 101
+    assert extract_hashtags(text) == ["привет", "python3"]
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_hashtag_tweets_and_trending(get_authors_schemas_list, tweet_service, faker):
+    author = (await get_authors_schemas_list)[0]
+    hot, cold = (f"tag{faker.pystr(min_chars=10, max_chars=10).lower()}" for _ in range(2))
+    created = []
+    for content in (f"#{hot} раз", f"два #{hot.upper()} и #{cold}", f"три #{hot}"):
+        tweet = await tweet_service.create_tweet(TweetInSchema(tweet_data=content, tweet_media_ids=[]), author.api_key)
+        created.append(tweet.tweet_id)
+    batch = json.dumps([dict(tweet_data=f"четыре #{cold}", tweet_media_ids=[])]).encode()
+    created.append((await tweet_service.create_tweets(batch, ndjson=False, api_key=author.api_key)).tweets[0].tweet_id)
+    await tweet_service.delete_tweet(created[2], author.api_key)
+
+    result = await tweet_service.get_tag_tweets(f"#{hot.upper()}", limit=10)
+    assert [tweet.id for tweet in result.tweets] == [created[1], created[0]]
+    first_page = await tweet_service.get_tag_tweets(cold, limit=1)
+    assert [tweet.id for tweet in first_page.tweets] == [created[3]]
+    second_page = await tweet_service.get_tag_tweets(cold, limit=1, cursor=first_page.next_cursor)
+    assert [tweet.id for tweet in second_page.tweets] == [created[1]]
+
+    trending = await tweet_service.get_trending(limit=100)
+    assert isinstance(trending, TrendingOutSchema)
+    counts = {item.tag: item.count for item in trending.tags}
+    assert counts[hot] == 3 and counts[cold] == 2
+    assert [item.tag for item in trending.tags].index(hot) < [item.tag for item in trending.tags].index(cold)
+
+    assert await TweetDbService().prune_hashtag_counters(before=TweetService._bucket(0).replace(year=2100)) >= 2
+    counts = {item.tag: item.count for item in (await tweet_service.get_trending(limit=100)).tags}
+    assert hot not in counts and cold not in counts
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_create_tweet_atomic(
+    get_authors_schemas_list, tweet_service, author_service, count_queries, monkeypatch, faker
+):
+    authors_list = await get_authors_schemas_list
+    author, reader = authors_list[0], authors_list[1]
+    await author_service.add_follow(author.id, reader.api_key)
+    tag = f"tag{faker.pystr(min_chars=10, max_chars=10).lower()}"
+    await author_service.get_principal(author.api_key)
+    with count_queries() as queries:
+        created = await tweet_service.create_tweet(TweetInSchema(tweet_data=f"один запрос #{tag}"), author.api_key)
+    writes = [query for query in queries if "INSERT INTO tweets" in query]
+    assert len(writes) == 1 and "INSERT INTO timelines" in writes[0] and "INSERT INTO hashtag_counters" in writes[0]
+    assert [tweet.id for tweet in (await tweet_service.get_timeline(reader.api_key, limit=1)).tweets] == [
+        created.tweet_id
+    ]
+    assert [tweet.id for tweet in (await tweet_service.get_tag_tweets(tag, limit=10)).tweets] == [created.tweet_id]
+
+    # слишком длинный хэштег валит весь запрос: не остаётся ни твита, ни счётчиков его хэштегов
+    broken = f"tag{faker.pystr(min_chars=10, max_chars=10).lower()}"
+    monkeypatch.setattr("app_tweets.services.extract_hashtags", lambda text: [broken, "x" * 101])
+    before = [tweet.id for tweet in (await tweet_service.get_list(author.api_key)).tweets]
+    with pytest.raises(BackendException):
+        await tweet_service.create_tweet(TweetInSchema(tweet_data="сломанный"), author.api_key)
+    with pytest.raises(BackendException):
+        await tweet_service.create_tweets(
+            json.dumps([dict(tweet_data="сломанный")]).encode(), ndjson=False, api_key=author.api_key
+        )
+    assert [tweet.id for tweet in (await tweet_service.get_list(author.api_key)).tweets] == before
+    assert broken not in {item.tag for item in (await tweet_service.get_trending(limit=100)).tags}
+
+
+async def read_frames(subscriber, count: int) -> list:
+    frames = [await asyncio.wait_for(subscriber.queue.get(), 5) for _ in range(count)]
+    return [(frame.split(b"\n")[0][7:].decode(), orjson.loads(frame.split(b"\n")[1][6:])) for frame in frames]
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_tweet_stream(get_tweet_schemas_list, tweet_service, author_service):
+    authors_list, tweet_list = await get_tweet_schemas_list
+    reader, writer, stranger = authors_list[:3]
+    await author_service.add_follow(writer.id, reader.api_key)
+    tweet_stream.start()
+    try:
+        await asyncio.wait_for(tweet_stream.connected.wait(), 5)
+        subscriber = await tweet_service.open_stream(reader.api_key)
+        await tweet_service.create_tweet(TweetInSchema(tweet_data="чужой твит"), stranger.api_key)
+        created = await tweet_service.create_tweet(TweetInSchema(tweet_data="поток твитов"), writer.api_key)
+        await tweet_service.add_like_to_tweet(created.tweet_id, stranger.api_key)
+        await tweet_service.delete_tweet(created.tweet_id, writer.api_key)
+        (tweet_event, tweet), (like_event, like), (delete_event, deleted) = await read_frames(subscriber, 3)
+        assert (tweet_event, tweet["id"], tweet["content"]) == ("tweet", created.tweet_id, "поток твитов")
+        assert tweet["author"] == {"id": writer.id, "name": writer.name}
+        assert (like_event, like) == (
+            "like",
+            {"tweet_id": created.tweet_id, "user_id": stranger.id, "name": stranger.name},
+        )
+        assert (delete_event, deleted) == ("delete", {"tweet_id": created.tweet_id})
+        assert subscriber.queue.empty()
+        assert tweet_stream.stats()["subscribers"] >= 1
+    finally:
+        await tweet_stream.stop()
+        await author_service.remove_follow(writer.id, reader.api_key)
+    assert subscriber.closed and subscriber.queue.get_nowait() is RESET
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_tweet_stream_slow_subscriber(tweet_db_service):
+    hub = TweetStreamHub(tweet_db_service, channel="test", queue_size=2, backlog=10, heartbeat=0.01, retry_after=0)
+    slow, fast = hub.subscribe([1]), hub.subscribe([1, 2])
+    hub._on_notify(None, 0, "test", orjson.dumps(dict(event="delete", tweet_id=10, author_id=1)).decode())
+    hub._on_notify(None, 0, "test", orjson.dumps(dict(event="delete", tweet_id=11, author_id=1)).decode())
+    dispatch = asyncio.create_task(hub.dispatch())
+    try:
+        frames = hub.frames(fast)
+        assert [await frames.__anext__() for _ in range(2)] == [
+            b'event: delete\ndata: {"tweet_id":10}\n\n',
+            b'event: delete\ndata: {"tweet_id":11}\n\n',
+        ]
+        hub._on_notify(None, 0, "test", orjson.dumps(dict(event="delete", tweet_id=12, author_id=1)).decode())
+        assert await frames.__anext__() == b'event: delete\ndata: {"tweet_id":12}\n\n'
+        assert await frames.__anext__() == b": ping\n\n"
+    finally:
+        dispatch.cancel()
+    assert [frame async for frame in hub.frames(slow)] == [RESET]
+    assert hub.stats()["slow"] == 1 and hub.stats()["subscribers"] == 1
+    await frames.aclose()
+    assert hub.stats()["subscribers"] == 0
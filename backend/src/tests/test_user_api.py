@@ -3,7 +3,10 @@ from fastapi import status
 from httpx import AsyncClient
 from loguru import logger
 
+from app_users.db_services import author_key
 from app_users.schemas import AuthorProfileApiSchema
+from cache import cache_backend
+from exceptions import BackendException
 from schemas import SuccessSchema
 
 
@@ -72,3 +75,54 @@ async def test_add_follow_api(get_authors_schemas_list, author_service, get_app)
             response_dict = response.json()
             assert SuccessSchema() == SuccessSchema(**response_dict)
             logger.info(response_dict)
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_user_me_etag_api(get_authors_schemas_list, get_app):
+    app = await get_app
+    authors = await get_authors_schemas_list
+    reader, writer = authors[0], authors[1]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        etags = {}
+        for author in (reader, writer):
+            response = await ac.get("/api/users/me", headers={"api-key": author.api_key})
+            etags[author.id] = response.headers["etag"]
+            response = await ac.get(
+                "/api/users/me", headers={"api-key": author.api_key, "if-none-match": etags[author.id]}
+            )
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        await ac.post(f"/api/users/{writer.id}/follow", headers={"api-key": reader.api_key})
+        for author in (reader, writer):
+            response = await ac.get(
+                "/api/users/me", headers={"api-key": author.api_key, "if-none-match": etags[author.id]}
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response.headers["etag"] != etags[author.id]
+            assert set(response.json()["user"].keys()) == {"id", "name", "followers", "following"}
+        await ac.delete(f"/api/users/{writer.id}/follow", headers={"api-key": reader.api_key})
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_get_authors_by_ids_api(get_authors_id_list, get_app, count_queries):
+    app = await get_app
+    ids = await get_authors_id_list
+    await cache_backend.delete(*map(author_key, ids))
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with count_queries() as queries:
+            response = await ac.get(
+                "/api/users", params={"ids": ",".join(map(str, [*ids, 0x7FFFFFFF]))}, headers={"api-key": "test"}
+            )
+        assert response.status_code == status.HTTP_200_OK
+        users = response.json()["users"]
+        assert [user["id"] for user in users] == [*ids, 0x7FFFFFFF]
+        assert all(
+            user["result"] and set(user["user"].keys()) == {"id", "name", "followers", "following"}
+            for user in users[:-1]
+        )
+        assert users[-1]["result"] is False and users[-1]["error_type"] == "AUTHOR_NOT_EXIST"
+        assert len([query for query in queries if "authors.id IN" in query]) == 1
+        with pytest.raises(BackendException) as error:
+            await ac.get("/api/users", params={"ids": f"{ids[0]},3000000000"}, headers={"api-key": "test"})
+        assert error.value.error_type == "INVALID_IDS"
@@ -1,12 +1,20 @@
+import asyncio
+import json
+
 import pytest
 from faker import Faker
 from faker.providers import python
 from fastapi.testclient import TestClient
+from sqlalchemy import select
 
 from app import app
-from app_users.schemas import AuthorModelSchema
+from app_tweets.models import Timeline
+from app_tweets.schemas import TweetInSchema
+from app_users.db_services import api_key_cache, author_key
+from app_users.schemas import AuthorCachedSchema, AuthorModelSchema
+from cache import cache_backend
+from db import session
 from exceptions import BackendException
-from schemas import SuccessSchema
 
 client = TestClient(app)
 
@@ -39,6 +47,7 @@ async def test_create_user(faker, author_db_service):
 async def test_get_user(get_authors_schemas_list, author_db_service):
     users = await get_authors_schemas_list
     for user in users:
+        await author_db_service.get_author(author_id=user.id)
         result = await author_db_service.get_author(api_key=user.api_key)
         assert isinstance(result, AuthorModelSchema)
         assert result.name == user.name
@@ -48,22 +57,101 @@ async def test_get_user(get_authors_schemas_list, author_db_service):
 
 @pytest.mark.dbtest
 @pytest.mark.asyncio
-async def test_update_follow(get_authors_schemas_list, author_db_service):
+async def test_follow(get_authors_schemas_list, author_db_service, tweet_db_service):
+    """тест подписок: повторная подписка и отписка ничего не меняют, счётчики и списки профиля согласованы,
+    отписка убирает твиты автора из ленты читателя"""
     users = await get_authors_schemas_list
-    assert len(users) > 1
-    followings = users[1:]
-    for user in users:
-        assert isinstance(user, AuthorModelSchema)
-
-    for user in followings:
-        result = await author_db_service.update_follow(
-            reading_author=users[0],
-            writing_author=user,
-            followers=[u.dict(include={"id", "name"}) for u in followings],
-            following=[users[0].dict(include={"id", "name"})],
-        )
-        assert isinstance(result, SuccessSchema)
-        following = await author_db_service.get_author(api_key=user.api_key)
-        follower = await author_db_service.get_author(api_key=users[0].api_key)
-        assert users[0].dict(include={"id", "name"}) in following.following
-        assert user.dict(include={"id", "name"}) in follower.followers
+    reader, writers = users[0], users[1:]
+    assert len(writers) > 1
+    for writer in writers:
+        await author_db_service.unfollow(reader.id, writer.id)
+    before = await author_db_service.get_author(author_id=writers[0].id)
+    for writer in writers:
+        assert await author_db_service.follow(reader.id, writer.id) is True
+        assert await author_db_service.follow(reader.id, writer.id) is False
+    new_tweet = TweetInSchema(tweet_data="в ленту")
+    dropped = await tweet_db_service.create_tweet(new_tweet, writers[0].id, fanout_limit=10)
+    kept = await tweet_db_service.create_tweet(new_tweet, writers[1].id, fanout_limit=10)
+    timeline = select(Timeline.tweet_id).where(Timeline.owner_id == reader.id)
+    async with session() as async_session:
+        assert set((await async_session.execute(timeline)).scalars()) == {dropped.id, kept.id}
+    follower = await author_db_service.get_author(author_id=reader.id)
+    assert follower.following_count == len(writers)
+    assert follower.followers == [
+        writer.dict(include={"id", "name"}) for writer in sorted(writers, key=lambda u: u.id)
+    ]
+    assert sorted(await author_db_service.get_followee_ids(reader.id)) == sorted(writer.id for writer in writers)
+    following = await author_db_service.get_author(author_id=writers[0].id)
+    assert following.follower_count == before.follower_count + 1
+    assert reader.dict(include={"id", "name"}) in following.following
+    assert following.version > before.version
+    assert await author_db_service.unfollow(reader.id, writers[0].id) is True
+    assert await author_db_service.unfollow(reader.id, writers[0].id) is False
+    async with session() as async_session:
+        assert set((await async_session.execute(timeline)).scalars()) == {kept.id}
+    following = await author_db_service.get_author(author_id=writers[0].id)
+    assert following.follower_count == before.follower_count
+    assert reader.dict(include={"id", "name"}) not in following.following
+    assert await author_db_service.follow(reader.id, 0) is None
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_follow_concurrent(get_authors_schemas_list, author_db_service):
+    """тест конкурентных подписок: встречные подписки не взаимоблокируются, каждая пара записывается один раз"""
+    users = await get_authors_schemas_list
+    first, second = users[-2], users[-1]
+    await author_db_service.unfollow(first.id, second.id)
+    await author_db_service.unfollow(second.id, first.id)
+    before = await author_db_service.get_authors([first.id, second.id])
+    results = await asyncio.gather(
+        *(author_db_service.follow(first.id, second.id) for _ in range(5)),
+        *(author_db_service.follow(second.id, first.id) for _ in range(5)),
+    )
+    assert results.count(True) == 2
+    after = await author_db_service.get_authors([first.id, second.id])
+    for old, new in zip(before, after):
+        assert new.follower_count == old.follower_count + 1
+        assert new.following_count == old.following_count + 1
+    await author_db_service.unfollow(first.id, second.id)
+    await author_db_service.unfollow(second.id, first.id)
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_verify_api_key_cache(faker, author_db_service):
+    api_key = faker.pystr(min_chars=64, max_chars=64)
+    assert await author_db_service.verify_api_key_exist(api_key) is False
+    assert api_key in api_key_cache
+    await author_db_service.create_author(name=faker.name(), api_key=api_key, password=faker.password())
+    assert api_key not in api_key_cache
+    assert await author_db_service.verify_api_key_exist(api_key) is True
+    hits = api_key_cache.hits
+    assert await author_db_service.verify_api_key_exist(api_key) is True
+    assert api_key_cache.hits == hits + 1
+
+
+@pytest.mark.dbtest
+@pytest.mark.asyncio
+async def test_get_authors(get_authors_schemas_list, author_db_service, monkeypatch):
+    """тест пакетной загрузки профилей: промахи пишутся в кэш одним обращением, пароли и api-key в кэш не попадают"""
+    users = await get_authors_schemas_list
+    ids = [user.id for user in users]
+    await cache_backend.delete(*map(author_key, ids))
+    await author_db_service.get_author(author_id=ids[0])
+    writes = []
+    set_many = cache_backend.set_many
+
+    async def spy(items, ttl):
+        writes.append(items)
+        await set_many(items, ttl)
+
+    monkeypatch.setattr(cache_backend, "set_many", spy)
+    result = await author_db_service.get_authors(ids + [0])
+    assert [author.id for author in result] == ids
+    assert len(writes) == 1 and set(map(author_key, ids[1:])) <= set(writes[0])
+    for author, user in zip(result, users):
+        assert isinstance(author, AuthorCachedSchema)
+        assert author.name == user.name
+    for cached in await cache_backend.get_many(list(map(author_key, ids))):
+        assert cached and not {"password", "api_key"} & set(json.loads(cached))
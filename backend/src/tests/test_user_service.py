@@ -1,10 +1,20 @@
+import asyncio
+
 import pytest
 from loguru import logger
 from pydantic import ValidationError
 from sqlalchemy.exc import ProgrammingError
 
-from app_users.schemas import AuthorBaseSchema, AuthorProfileApiSchema
-from exceptions import BackendException
+from app_users.db_services import author_key
+from app_users.schemas import (
+    AuthorBaseSchema,
+    AuthorPrincipalSchema,
+    AuthorProfileApiSchema,
+)
+from app_users.services import PasswordHasher, author_loader, request_principal
+from cache import cache_backend
+from exceptions import BackendException, ServiceUnavailableException
+from loaders import loader_scope
 from schemas import SuccessSchema
 
 
@@ -98,3 +108,62 @@ async def test_add_remove_followers(get_authors_schemas_list, author_service, fa
     assert isinstance(result, SuccessSchema)
     assert new_follower.dict() not in reading_author.user.followers
     assert new_following.dict() not in writing_author.user.following
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_get_principal(get_authors_schemas_list, author_service, faker):
+    """тест получения автора запроса"""
+    users = await get_authors_schemas_list
+    for user in users:
+        principal = await author_service.get_principal(user.api_key)
+        assert isinstance(principal, AuthorPrincipalSchema)
+        assert principal.dict() == user.dict(include={"id", "name", "api_key"})
+    api_key = faker.pystr(10)
+    token = request_principal.set(AuthorPrincipalSchema(id=0, name=faker.name(), api_key=api_key))
+    assert (await author_service.get_principal(api_key)).id == 0
+    request_principal.reset(token)
+    with pytest.raises(BackendException):
+        await author_service.get_principal(api_key)
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_author_loader(get_authors_schemas_list, author_service, count_queries):
+    """тест пакетной загрузки авторов: один запрос к СУБД на шаг цикла событий и память в пределах запроса"""
+    users = await get_authors_schemas_list
+    ids = [user.id for user in users]
+    await cache_backend.delete(*map(author_key, ids))
+    with loader_scope():
+        with count_queries() as queries:
+            profiles = await asyncio.gather(*(author_service.get_author(author_id=author_id) for author_id in ids))
+        assert [profile.user.id for profile in profiles] == ids
+        assert len(queries) == 1 and "authors.id IN" in queries[0]
+        with count_queries() as queries:
+            await author_service.me(api_key=users[0].api_key)
+            await author_service.get_author(author_id=ids[-1])
+        assert not [query for query in queries if "authors.id IN" in query]
+        await author_service.add_follow(ids[1], users[0].api_key)
+        profile = await author_service.get_author(author_id=ids[0])
+        assert ids[1] in [writer.id for writer in profile.user.followers]
+        assert author_loader().batches == 2
+    await cache_backend.delete(*map(author_key, ids))
+    with count_queries() as queries:
+        await asyncio.gather(*(author_service.get_author(author_id=author_id) for author_id in ids))
+    assert len(queries) == len(ids)
+
+
+@pytest.mark.service
+@pytest.mark.asyncio
+async def test_password_hasher():
+    """тест расчёта хэшей паролей вне цикла событий"""
+    hasher = PasswordHasher(executor_type="thread", workers=1, concurrency=1, queue_timeout=0.01)
+    hashed = await hasher.hash("secret")
+    assert await hasher.verify("secret", hashed) is True
+    assert await hasher.verify("wrong", hashed) is False
+    results = await asyncio.gather(hasher.hash("first"), hasher.hash("second"), return_exceptions=True)
+    assert sum(isinstance(result, ServiceUnavailableException) for result in results) == 1
+    stats = hasher.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 4
+    assert stats["waiting"] == stats["active"] == 0